@@ -1,22 +1,104 @@
-from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO, emit
-from database import Database
-from serial_monitor import SerialMonitor
-import threading
-import csv
-import io
 import os
-import uuid
-from werkzeug.utils import secure_filename
+
+# With a Redis message queue the redis client blocks on plain sockets: make sockets and select
+# cooperative before anything else is imported or opens one. Threading is left alone (the
+# writer, retention and matrix threads stay real OS threads).
+if os.environ.get('SOCKETIO_MESSAGE_QUEUE', '').startswith(('redis://', 'rediss://')):
+    try:
+        import eventlet
+        eventlet.monkey_patch(socket=True, select=True)
+    except ImportError:
+        pass
+
+# Job workers are spawned processes (see jobs.py) that import the script which started the app
+# again, as __mp_main__: there, build the app but don't start its threads, pools or listeners
+JOB_WORKER = __name__ == '__mp_main__'
+
+from flask import Flask, render_template, request, jsonify, Response, send_file
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
+from database import Database, EXPORTS, DB_NAME
+from db_executor import DBExecutor
+from export import stream_export, FORMATS
+from serial_monitor import SerialMonitor
+from pick_queue import PickQueue
+from retention import RetentionManager
+from snapshot import ReportSnapshot
+from cluster import make_client_manager, LeaderLock
+from assets import AssetPipeline
+from images import ImageStore
+from responses import FastJSONProvider, compress_responses
+from timeseries import TimeSeries
+from forecast import ReplenishmentForecaster
+from ledger import StockSnapshotter
+from jobs import JobRunner, JOBS
+from datetime import datetime, timezone
+import queue
+import tempfile
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.config['SECRET_KEY'] = 'secret!'
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'static', 'uploads')
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-socketio = SocketIO(app, cors_allowed_origins="*")
-
-db = Database()
+# JSON responses above the threshold are gzipped for clients that accept it
+compress_responses(app, threshold=int(os.environ.get('GZIP_MIN_BYTES', 1024)))
+
+# Fingerprinted, minified, precompressed css/js. Built by `flask build-assets` (or at startup when run
+# directly); importing the app only loads static/dist/manifest.json, and serves /static until one exists
+assets = AssetPipeline(app.static_folder)
+assets.init_app(app)
+if os.environ.get('ASSETS_PREBUILT') == '1':
+    assets.load()
+
+@app.cli.command('build-assets')
+def build_assets():
+    for source, hashed in assets.build().items():
+        print(f"{source} -> {hashed}")
+
+# Content-addressed product images, thumbnails rendered by a background worker
+images = ImageStore(app.config['UPLOAD_FOLDER'])
+images.init_app(app)
+if not JOB_WORKER:
+    images.start()
+
+# Several processes (see cluster.py) relay Socket.IO emits through a message queue:
+# redis://... in production, local://<channel> in tests, unset for a single process
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+cluster_manager = make_client_manager(SOCKETIO_MESSAGE_QUEUE)
+socketio = SocketIO(app, cors_allowed_origins="*", client_manager=cluster_manager)
+
+# Database calls run on a real thread pool under eventlet so slow queries don't freeze the hub,
+# stock mutations are funnelled through one writer thread (one per warehouse file when
+# WAREHOUSE_SHARD_DIR puts each warehouse's stock in its own file, see database.Database)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+DB_SINGLE_WRITER = os.environ.get('DB_SINGLE_WRITER', '1') == '1'
+db = DBExecutor(Database(single_writer=DB_SINGLE_WRITER), pool_size=DB_POOL_SIZE,
+                enabled=socketio.async_mode == 'eventlet')
+
+# Stock breakdowns, availability checks and inventory value served from an in-memory
+# matrix; every process keeps its own copy and checks it against the database
+STOCK_MATRIX_ENABLED = os.environ.get('STOCK_MATRIX_ENABLED', '1') == '1'
+if STOCK_MATRIX_ENABLED and not JOB_WORKER:
+    db.db.enable_stock_matrix(check_interval=int(os.environ.get('STOCK_MATRIX_CHECK_INTERVAL', 300)),
+                              sync_interval=float(os.environ.get('STOCK_MATRIX_SYNC_INTERVAL', 1))).start()
+
+# Low-stock alerts are raised inside stock writes (possibly on a pool thread); they are
+# queued here and emitted from the request that made the write
+low_stock_alerts = queue.Queue()
+db.db.on_low_stock(low_stock_alerts.put)
+
+def emit_low_stock_alerts():
+    while True:
+        try:
+            alert = low_stock_alerts.get_nowait()
+        except queue.Empty:
+            return
+        socketio.emit('low_stock', alert)
+
+# Per-warehouse pick queue, pushed to workers subscribed to their warehouse
+pick_queue = PickQueue(db)
+pick_queue.load()
 
 # Serial Configuration
 SERIAL_PORT = os.environ.get('SERIAL_PORT', '/dev/tty.usbserial')
@@ -30,6 +112,79 @@ def handle_serial_scan(barcode):
 serial_monitor = SerialMonitor(SERIAL_PORT, BAUD_RATE, callback=handle_serial_scan)
 # serial_monitor.start() 
 
+# Retention Configuration (scan roll-up, instance archival, incremental vacuum)
+RETENTION_ENABLED = os.environ.get('RETENTION_ENABLED', '1') == '1'
+retention = RetentionManager(
+    db.db,
+    scan_days=int(os.environ.get('RETENTION_SCAN_DAYS', 30)),
+    instance_days=int(os.environ.get('RETENTION_INSTANCE_DAYS', 90)),
+    lock_budget_ms=int(os.environ.get('RETENTION_LOCK_BUDGET_MS', 50)),
+)
+
+# Replenishment forecast (reorder points, days until stock-out) per product and warehouse
+FORECAST_ENABLED = os.environ.get('FORECAST_ENABLED', '1') == '1'
+forecaster = ReplenishmentForecaster(
+    db.db,
+    window_days=int(os.environ.get('FORECAST_WINDOW_DAYS', 28)),
+    lead_time_days=int(os.environ.get('FORECAST_LEAD_TIME_DAYS', 7)),
+    service_z=float(os.environ.get('FORECAST_SERVICE_Z', 1.65)),
+    interval=int(os.environ.get('FORECAST_INTERVAL', 60)),
+)
+
+# Stock ledger snapshots for point-in-time stock queries
+stock_snapshots = StockSnapshotter(
+    db.db,
+    interval=int(os.environ.get('STOCK_SNAPSHOT_INTERVAL', 24 * 3600)),
+    max_movements=int(os.environ.get('STOCK_SNAPSHOT_MOVEMENTS', 50000)),
+)
+
+# Reporting snapshot: analytics and exports read a periodically refreshed copy
+REPORT_SNAPSHOT_ENABLED = os.environ.get('REPORT_SNAPSHOT_ENABLED', '1') == '1'
+snapshot = ReportSnapshot(
+    db.db,
+    interval=int(os.environ.get('REPORT_SNAPSHOT_INTERVAL', 300)),
+    max_writes=int(os.environ.get('REPORT_SNAPSHOT_WRITES', 1000)),
+    max_age=int(os.environ.get('REPORT_SNAPSHOT_MAX_AGE', 0)) or None,
+)
+reports_db = DBExecutor(snapshot.reader, pool_size=DB_POOL_SIZE, enabled=socketio.async_mode == 'eventlet')
+
+# Time-series charts over the rollup tables, built (pandas) on the pool too
+timeseries = DBExecutor(TimeSeries(db.db), pool_size=DB_POOL_SIZE, enabled=socketio.async_mode == 'eventlet')
+reports_timeseries = DBExecutor(TimeSeries(snapshot.reader), pool_size=DB_POOL_SIZE,
+                                enabled=socketio.async_mode == 'eventlet')
+
+# Background jobs (imports, exports, reconciliation, rebuilds) in a process pool;
+# progress is pushed to clients as 'job_progress' events
+JOB_OUTPUT_DIR = os.environ.get('JOB_OUTPUT_DIR', os.path.join(os.path.dirname(os.path.abspath(DB_NAME)), 'job_output'))
+JOB_PROGRESS_INTERVAL = float(os.environ.get('JOB_PROGRESS_INTERVAL', 1))
+jobs = DBExecutor(JobRunner(db.db, JOB_OUTPUT_DIR,
+                            max_workers=int(os.environ.get('JOB_WORKERS', 2)),
+                            max_pending=int(os.environ.get('JOB_MAX_PENDING', 20))),
+                  pool_size=DB_POOL_SIZE, enabled=socketio.async_mode == 'eventlet')
+# Jobs clients may submit directly (imports go through /api/import, which stores the upload)
+SUBMITTABLE_JOBS = set(JOBS) - {'import_products'}
+
+def emit_job_progress():
+    while True:
+        try:
+            for job in jobs.updates():
+                socketio.emit('job_progress', job)
+        except Exception as e:
+            print(f"Job progress error: {e}")
+        socketio.sleep(JOB_PROGRESS_INTERVAL)
+
+def report_source():
+    # (database, snapshot age in seconds); the live database when snapshots are disabled,
+    # before the first one, or once the copy is older than its max age
+    if REPORT_SNAPSHOT_ENABLED and snapshot.ready():
+        return reports_db, snapshot.age()
+    return db, None
+
+def snapshot_headers(age):
+    if age is None:
+        return {}
+    return {'X-Snapshot-Age': f"{age:.0f}"}
+
 def process_scan(barcode):
     # Log raw scan
     db.log_scan(barcode)
@@ -51,6 +206,27 @@ def update_dashboard():
     history = db.get_scan_history()
     socketio.emit('history_update', history)
 
+def broadcast_pick_queue(warehouse_ids):
+    for wid in warehouse_ids:
+        socketio.emit('pick_queue', {'warehouse_id': wid, 'orders': pick_queue.get_queue(wid)},
+                      to=f"warehouse_{wid}")
+
+def refresh_pick_queue_orders(order_ids):
+    # This process broadcasts; the other processes only re-read the orders into their own queues
+    broadcast_pick_queue(pick_queue.refresh_orders(order_ids))
+    if SOCKETIO_MESSAGE_QUEUE:
+        cluster_manager.publish_event('pick_queue_refresh', order_ids)
+
+def refresh_pick_queue(order_id):
+    refresh_pick_queue_orders([order_id])
+
+if SOCKETIO_MESSAGE_QUEUE:
+    cluster_manager.on_cluster_event('pick_queue_refresh', pick_queue.refresh_orders)
+    # The listener normally starts with the first client connection; start it now so a
+    # process without sockets still keeps its pick queue (served over HTTP) current
+    if not JOB_WORKER:
+        cluster_manager.initialize()
+
 @app.route('/')
 def welcome():
     return render_template('welcome.html')
@@ -61,9 +237,20 @@ def admin_dashboard():
 
 # --- Product Class Management ---
 
+def with_image_urls(products):
+    for product in products:
+        product.update(images.urls(product.get('image_path')))
+    return products
+
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    return jsonify(db.get_all_products())
+    return jsonify(with_image_urls(db.get_all_products()))
+
+@app.route('/api/products/search', methods=['GET'])
+def search_products():
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    return jsonify(with_image_urls(db.search_products(query, limit)))
 
 @app.route('/api/warehouses', methods=['GET'])
 def get_warehouses():
@@ -77,18 +264,10 @@ def add_product():
     category = request.form.get('category', 'Uncategorized')
     description = request.form.get('description', '')
     pack_size = request.form.get('pack_size', 1)
-    
-    image_path = None
-    if 'image' in request.files:
-        file = request.files['image']
-        if file and file.filename != '':
-            filename = secure_filename(f"{uuid.uuid4()}_{file.filename}")
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-            image_path = f"uploads/{filename}"
 
     if not name:
         return jsonify({"status": "error", "message": "Name is required"}), 400
-        
+
     try:
         price = float(price)
         pack_size = int(pack_size)
@@ -96,6 +275,13 @@ def add_product():
         price = 0.0
         pack_size = 1
 
+    # Only a valid request stores the upload (and queues its thumbnails)
+    image_path = None
+    if 'image' in request.files:
+        file = request.files['image']
+        if file and file.filename != '':
+            image_path = images.save(file)
+
     if db.add_product(name, price, description, category, pack_size, image_path):
         return jsonify({"status": "success", "message": "Product Class added"})
     else:
@@ -117,12 +303,55 @@ def add_instance():
         return jsonify({"status": "error", "message": "Product ID and Barcode required"}), 400
         
     success, result = db.add_instance(product_id, barcode, int(quantity), notes, int(warehouse_id))
+    emit_low_stock_alerts()
     if success:
         update_dashboard()
         return jsonify({"status": "success", "message": result})
     else:
         return jsonify({"status": "error", "message": result}), 400
 
+@app.route('/api/products/<int:product_id>/thresholds', methods=['GET'])
+def get_stock_thresholds(product_id):
+    return jsonify(db.get_stock_thresholds(product_id))
+
+@app.route('/api/products/<int:product_id>/thresholds', methods=['POST'])
+def set_stock_threshold(product_id):
+    # {"threshold": 10, "warehouse_id": 2}; no warehouse_id sets the product-wide default,
+    # threshold null removes it
+    data = request.json or {}
+    threshold = data.get('threshold')
+    if threshold is not None and (not isinstance(threshold, int) or threshold < 0):
+        return jsonify({"status": "error", "message": "Threshold must be a non-negative integer"}), 400
+    if db.set_stock_threshold(product_id, threshold, int(data.get('warehouse_id') or 0)):
+        return jsonify({"status": "success"})
+    return jsonify({"status": "error", "message": "Update failed"}), 500
+
+@app.route('/api/stock/at', methods=['GET'])
+def get_stock_at():
+    # ?at=2024-05-03 (end of that day) or 2024-05-03T14:30, UTC; optional warehouse_id, product_id
+    at = request.args.get('at', '')
+    try:
+        moment = datetime.fromisoformat(at)
+    except ValueError:
+        return jsonify({"status": "error", "message": "at must be an ISO date or datetime"}), 400
+    if len(at) == 10:
+        moment = moment.replace(hour=23, minute=59, second=59)
+    if moment.tzinfo:
+        moment = moment.astimezone(timezone.utc)
+    rows = db.get_stock_at(moment.strftime('%Y-%m-%d %H:%M:%S'),
+                           warehouse_id=request.args.get('warehouse_id', type=int),
+                           product_id=request.args.get('product_id', type=int))
+    if rows is None:
+        return jsonify({"status": "error", "message": "No stock history that far back"}), 404
+    return jsonify(rows)
+
+@app.route('/api/alerts', methods=['GET'])
+def get_stock_alerts():
+    # ?all=1 includes resolved alerts
+    alerts = db.get_stock_alerts(open_only=request.args.get('all') != '1',
+                                 limit=min(request.args.get('limit', 100, type=int), 1000))
+    return jsonify(alerts)
+
 @app.route('/api/products/<int:product_id>/instances', methods=['GET'])
 def get_product_instances(product_id):
     instances = db.get_instances(product_id)
@@ -139,11 +368,29 @@ def update_quantity():
     if not product_id or change is None:
         return jsonify({"status": "error", "message": "Product ID and change required"}), 400
 
-    if db.update_quantity(product_id, int(change), int(warehouse_id)):
+    updated = db.update_quantity(product_id, int(change), int(warehouse_id))
+    emit_low_stock_alerts()
+    if updated:
         return jsonify({"status": "success"})
     else:
         return jsonify({"status": "error", "message": "Update failed"}), 500
 
+@app.route('/api/stock/adjustments', methods=['POST'])
+def adjust_stock():
+    # Cycle count: {"lines": [{"product_id": 1, "warehouse_id": 2, "counted": 40},
+    #                         {"product_id": 3, "warehouse_id": 1, "change": -2}, ...]}
+    lines = (request.json or {}).get('lines')
+    if not isinstance(lines, list) or not lines or not all(isinstance(l, dict) for l in lines):
+        return jsonify({"status": "error", "message": "lines required"}), 400
+
+    success, result = db.adjust_stock(lines)
+    emit_low_stock_alerts()
+    if not success:
+        return jsonify({"status": "error", "message": result}), 400
+    if result['changed']:
+        update_dashboard()
+    return jsonify({"status": "success", **result})
+
 # --- Order Management ---
 @app.route('/worker')
 def worker_view():
@@ -185,15 +432,61 @@ def record_pick():
     success, message = db.record_pick(order_id, int(warehouse_id), barcode, worker_name)
     if success:
         # Emit update so admin/worker screens refresh
+        refresh_pick_queue(order_id)
         socketio.emit('order_update', {'order_id': order_id})
         return jsonify({"status": "success", "message": message})
     else:
         return jsonify({"status": "error", "message": message}), 400
 
+# --- Wave Picking ---
+
+@app.route('/api/waves', methods=['POST'])
+def plan_wave():
+    data = request.json
+    warehouse_id = data.get('warehouse_id')
+    max_orders = int(data.get('max_orders', 50))
+    worker_name = data.get('worker_name')
+
+    if not warehouse_id:
+        return jsonify({"status": "error", "message": "Warehouse required"}), 400
+
+    wave = db.plan_wave(int(warehouse_id), max_orders, worker_name)
+    if not wave:
+        return jsonify({"status": "error", "message": "אין פריטים פתוחים לליקוט"}), 404
+    return jsonify({"status": "success", "wave": wave})
+
+@app.route('/api/waves/<int:wave_id>', methods=['GET'])
+def get_wave(wave_id):
+    wave = db.get_wave(wave_id)
+    if not wave:
+        return jsonify({"status": "error", "message": "Wave not found"}), 404
+    return jsonify(wave)
+
+@app.route('/api/waves/<int:wave_id>/confirm', methods=['POST'])
+def confirm_wave(wave_id):
+    # Body: {barcodes: [...one entry per scanned unit...], worker_name}
+    data = request.json
+    barcodes = data.get('barcodes') or []
+    worker_name = data.get('worker_name')
+
+    if not worker_name:
+        return jsonify({"status": "error", "message": "Missing data"}), 400
+
+    success, result = db.confirm_wave(wave_id, barcodes, worker_name)
+    if success:
+        refresh_pick_queue_orders(result['order_ids'])
+        for order_id in result['order_ids']:
+            socketio.emit('order_update', {'order_id': order_id})
+        return jsonify({"status": "success", "wave": result})
+    else:
+        return jsonify({"status": "error", "message": result}), 400
+
 @app.route('/api/orders/active', methods=['GET'])
 def get_active_orders():
-    warehouse_id = request.args.get('warehouse_id')
-    return jsonify(db.get_active_orders(warehouse_id))
+    warehouse_id = request.args.get('warehouse_id', type=int)
+    if warehouse_id:
+        return jsonify(pick_queue.get_queue(warehouse_id))
+    return jsonify(db.get_active_orders())
 
 @app.route('/api/orders/<int:order_id>/status', methods=['POST'])
 def update_order_status(order_id):
@@ -205,6 +498,8 @@ def update_order_status(order_id):
         return jsonify({'status': 'error', 'message': 'Status required'}), 400
         
     if db.update_order_status(order_id, status, worker):
+        refresh_pick_queue(order_id)
+        socketio.emit('order_update', {'order_id': order_id})
         return jsonify({'status': 'success'})
     else:
         return jsonify({'status': 'error'}), 500
@@ -212,16 +507,96 @@ def update_order_status(order_id):
 
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
-    return jsonify(db.get_orders())
+    filters = {
+        'status': request.args.get('status') or None,
+        'business_name': request.args.get('business') or None,
+        'date_from': request.args.get('from') or None,
+        'date_to': request.args.get('to') or None,
+    }
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    before = None
+    if request.args.get('before_ts') and request.args.get('before_id'):
+        before = (request.args.get('before_ts'), request.args.get('before_id', type=int))
+
+    orders = db.get_orders(limit=limit, before=before, **filters)
+    next_cursor = None
+    if len(orders) == limit:
+        next_cursor = {"before_ts": orders[-1]['timestamp'], "before_id": orders[-1]['id']}
+    return jsonify({
+        "orders": orders,
+        "total": db.count_orders(**filters),
+        "next_cursor": next_cursor,
+    })
+
+@app.route('/api/orders/details', methods=['GET'])
+def get_orders_details():
+    # ?ids=1,2,3 -> {"1": {"items": [...], "allocations": [...]}, ...}
+    try:
+        order_ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify({"status": "error", "message": "ids must be order ids"}), 400
+    if not order_ids or len(order_ids) > 500:
+        return jsonify({"status": "error", "message": "1 to 500 ids required"}), 400
+    return jsonify(db.get_orders_details(order_ids))
 
 @app.route('/api/orders/<int:order_id>', methods=['GET'])
 def get_order_details(order_id):
     details = db.get_order_details(order_id)
     return jsonify(details)
 
+@app.route('/api/bootstrap', methods=['GET'])
+def get_bootstrap():
+    # First paint of the admin dashboard in one round trip. Warehouses, products (totals and
+    # breakdowns) and the first orders page come from one read transaction on the live database;
+    # analytics come from the report snapshot and may lag by analytics.snapshot_age seconds
+    limit = 50
+    data = db.get_dashboard(orders_limit=limit)
+    orders = data.pop('orders')
+    next_cursor = None
+    if len(orders) == limit:
+        next_cursor = {"before_ts": orders[-1]['timestamp'], "before_id": orders[-1]['id']}
+    data['orders'] = {"orders": orders, "total": data.pop('orders_total'), "next_cursor": next_cursor}
+    data['products'] = with_image_urls(data['products'])
+    source, age = report_source()
+    data['analytics'] = source.get_analytics_data()
+    data['analytics']['snapshot_age'] = age
+    return jsonify(data), 200, snapshot_headers(age)
+
 @app.route('/api/analytics', methods=['GET'])
 def get_analytics():
-    return jsonify(db.get_analytics_data())
+    source, age = report_source()
+    data = source.get_analytics_data()
+    data['snapshot_age'] = age
+    return jsonify(data), 200, snapshot_headers(age)
+
+@app.route('/api/analytics/timeseries', methods=['GET'])
+def get_analytics_timeseries():
+    # Plotly figure JSON: ?metric=units|revenue|stock_in&bucket=hour|day|week|month
+    #                     &group=product|category|warehouse|total&days=90&warehouse_id=&series=10
+    source, age = report_source()
+    charts = reports_timeseries if source is reports_db else timeseries
+    try:
+        fig = charts.figure(
+            metric=request.args.get('metric', 'units'),
+            bucket=request.args.get('bucket', 'day'),
+            group_by=request.args.get('group', 'product'),
+            days=min(request.args.get('days', 90, type=int), 730),
+            warehouse_id=request.args.get('warehouse_id', type=int),
+            max_series=min(request.args.get('series', 10, type=int), 20),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(fig), 200, snapshot_headers(age)
+
+@app.route('/api/replenishment', methods=['GET'])
+def get_replenishment():
+    # ?warehouse_id=&at_risk=1&limit=100, soonest stock-outs first
+    rows = db.get_replenishment(
+        warehouse_id=request.args.get('warehouse_id', type=int),
+        at_risk=request.args.get('at_risk') == '1',
+        limit=min(request.args.get('limit', 100, type=int), 1000),
+    )
+    return jsonify(rows)
 
 
 @app.route('/api/orders', methods=['POST'])
@@ -234,42 +609,70 @@ def create_order():
         return jsonify({"status": "error", "message": "Business name and Items required"}), 400
         
     success, result = db.create_order(business, items)
+    emit_low_stock_alerts()
     if success:
         # Stock has changed, broadcast update
         socketio.emit('history_update', db.get_scan_history()) # Refresh history just in case
+        refresh_pick_queue(result)
         return jsonify({"status": "success", "order_id": result})
     else:
         return jsonify({"status": "error", "message": result}), 400
 
 @app.route('/print/order/<int:order_id>')
 def print_order(order_id):
-    # Fetch details manually to pass to template
-    conn = db._get_connection()
-    cursor = conn.cursor()
-    
-    # Get Order Info
-    cursor.execute("SELECT * FROM orders WHERE id = ?", (order_id,))
-    order = cursor.fetchone()
-    
-    # Get Items
-    cursor.execute('''
-        SELECT oi.quantity, p.name, p.id as product_id 
-        FROM order_items oi
-        JOIN products p ON oi.product_id = p.id
-        WHERE oi.order_id = ?
-    ''', (order_id,))
-    items = cursor.fetchall()
-    conn.close()
-    
-    if not order:
+    orders = db.get_print_batch([order_id])
+    if not orders:
         return "Order not found", 404
-        
-    return render_template('print_order.html', order=dict(order), items=[dict(i) for i in items])
+    return render_template('print_order.html', orders=orders)
+
+@app.route('/print/orders')
+def print_orders():
+    # One document, one page per order: ?ids=1,2,3 or ?status=PENDING or ?wave_id=7
+    limit = min(request.args.get('limit', 500, type=int), 2000)
+    if request.args.get('ids'):
+        try:
+            order_ids = [int(i) for i in request.args['ids'].split(',') if i.strip()]
+        except ValueError:
+            return "Invalid order ids", 400
+        orders = db.get_print_batch(order_ids, limit=limit)
+    elif request.args.get('wave_id'):
+        orders = db.get_print_batch(wave_id=request.args.get('wave_id', type=int), limit=limit)
+    elif request.args.get('status'):
+        orders = db.get_print_batch(status=request.args['status'], limit=limit)
+    else:
+        return "ids, status or wave_id required", 400
+
+    if not orders:
+        return "No orders found", 404
+    return render_template('print_order.html', orders=orders)
+
+# --- Export ---
+
+@app.route('/api/export/<kind>', methods=['GET'])
+def export_data(kind):
+    # Streams straight from a cursor; ?since=<timestamp>&since_id=<id> for incremental pulls
+    fmt = request.args.get('format', 'csv')
+    if kind not in EXPORTS or fmt not in FORMATS:
+        return jsonify({"status": "error", "message": "Unknown export"}), 400
+
+    since = request.args.get('since')
+    since_id = request.args.get('since_id', type=int)
+    compress = request.args.get('gzip') == '1'
+
+    source, age = report_source()
+    headers = {'Content-Disposition': f'attachment; filename={kind}.{fmt}'}
+    headers.update(snapshot_headers(age))
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+
+    return Response(stream_export(source, kind, fmt, since, since_id, compress),
+                    mimetype=FORMATS[fmt], headers=headers)
 
 # --- Import ---
 
 @app.route('/api/import', methods=['POST'])
 def import_data():
+    # CSV of product classes, imported by a background job: 202 with the job id to poll
     if 'file' not in request.files:
         return jsonify({"status": "error", "message": "No file uploaded"}), 400
     
@@ -277,42 +680,103 @@ def import_data():
     if file.filename == '':
         return jsonify({"status": "error", "message": "No file selected"}), 400
 
-    if file:
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_input = csv.DictReader(stream)
-        count = 0
-        
-        for row in csv_input:
-            # Flexible Key Mapping
-            name = row.get('name') or row.get('Name')
-            if not name: continue
-            
-            try:
-                price = float(row.get('price') or row.get('Price') or 0.0)
-            except:
-                price = 0.0
-                
-            category = row.get('category') or row.get('Category') or 'Uncategorized'
-            
-            # Create Product Class
-            if db.add_product(name, price, "", category):
-                count += 1
-        
-        return jsonify({
-            "status": "success", 
-            "imported_count": count, 
-            "message": f"Imported {count} product classes."
-        })
+    os.makedirs(JOB_OUTPUT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix='.csv', dir=JOB_OUTPUT_DIR)
+    with os.fdopen(fd, 'wb') as f:
+        file.save(f)
+    return submit_job('import_products', {'path': path})
+
+# --- Background Jobs ---
+
+def submit_job(kind, params):
+    job_id = jobs.submit(kind, params)
+    if job_id is None:
+        if 'path' in params:
+            os.remove(params['path'])
+        return jsonify({"status": "error", "message": "Too many jobs pending"}), 429
+    return jsonify({"status": "queued", "job_id": job_id}), 202
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    # {"kind": "export" | "sync_warehouses" | "reconcile_stock" | "rebuild_replenishment", "params": {...}}
+    data = request.json or {}
+    kind = data.get('kind')
+    params = data.get('params') or {}
+    if kind not in SUBMITTABLE_JOBS or not isinstance(params, dict):
+        return jsonify({"status": "error", "message": "Unknown job"}), 400
+    return submit_job(kind, params)
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify(db.get_jobs(status=request.args.get('status'),
+                               limit=min(request.args.get('limit', 50, type=int), 500)))
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    job = db.get_job(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    status = jobs.cancel(job_id)
+    if status is None:
+        return jsonify({"status": "error", "message": "Job not found or already finished"}), 409
+    return jsonify({"status": "success", "job_status": status})
+
+@app.route('/api/jobs/<int:job_id>/download', methods=['GET'])
+def download_job_result(job_id):
+    # Output file of a finished export job
+    job = db.get_job(job_id)
+    result = (job or {}).get('result') or {}
+    if not job or job['status'] != 'done' or 'path' not in result or not os.path.exists(result['path']):
+        return jsonify({"status": "error", "message": "No output for this job"}), 404
+    return send_file(result['path'], as_attachment=True, download_name=result['filename'])
 
 @socketio.on('connect')
 def test_connect():
     print('Client connected')
     emit('history_update', db.get_scan_history())
 
-if __name__ == '__main__':
+@socketio.on('subscribe_pick_queue')
+def subscribe_pick_queue(data):
+    # One warehouse per client: leave any previous warehouse room first
+    warehouse_id = int(data.get('warehouse_id'))
+    for room in rooms():
+        if str(room).startswith('warehouse_'):
+            leave_room(room)
+    join_room(f"warehouse_{warehouse_id}")
+    emit('pick_queue', {'warehouse_id': warehouse_id, 'orders': pick_queue.get_queue(warehouse_id)})
+
+def start_background_services():
+    # Runs in exactly one process per host (see LeaderLock)
     try:
         serial_monitor.start()
     except Exception as e:
         print(f"Could not start serial monitor: {e}")
-        
-    socketio.run(app, debug=False, host='0.0.0.0', port=5001)
+
+    if RETENTION_ENABLED:
+        retention.start()
+
+    if REPORT_SNAPSHOT_ENABLED:
+        snapshot.start()
+
+    if FORECAST_ENABLED:
+        forecaster.start()
+
+    stock_snapshots.start()
+
+    images.backfill(p['image_path'] for p in db.get_all_products())
+
+leader = LeaderLock(DB_NAME + '.leader', on_elected=start_background_services)
+
+if not JOB_WORKER:
+    jobs.start()
+    socketio.start_background_task(emit_job_progress)
+
+if __name__ == '__main__':
+    if os.environ.get('ASSETS_PREBUILT') != '1':
+        assets.build()
+    leader.start()
+    socketio.run(app, debug=False, host='0.0.0.0', port=int(os.environ.get('PORT', 5001)))
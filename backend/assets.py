@@ -0,0 +1,184 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+from flask import abort, request, send_file, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIMETYPES = {'.css': 'text/css', '.js': 'application/javascript'}
+ONE_YEAR = 365 * 24 * 3600
+
+def minify_css(text):
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r'\s*:\s*(?=[^{}]*;)', ':', text)
+    return text.replace(';}', '}').strip()
+
+def _js_line_states(text):
+    # (line, starts inside a template literal, ends inside one) for each line. Tracks
+    # quotes, comments, backticks and ${...} nesting; regex literals are not recognised,
+    # so a quote or backtick inside one would confuse it (script.js has none).
+    stack = ['code']  # 'code', 'template' or 'comment'; code inside ${...} counts braces
+    braces = [0]
+    for line in text.splitlines():
+        start = stack[-1] == 'template'
+        i = 0
+        while i < len(line):
+            mode, ch, pair = stack[-1], line[i], line[i:i + 2]
+            if mode == 'comment':
+                if pair == '*/':
+                    stack.pop()
+                    i += 1
+            elif mode == 'template':
+                if ch == '\\':
+                    i += 1
+                elif ch == '`':
+                    stack.pop()
+                elif pair == '${':
+                    stack.append('code')
+                    braces.append(0)
+                    i += 1
+            elif pair == '//':
+                break
+            elif pair == '/*':
+                stack.append('comment')
+                i += 1
+            elif ch in '\'"':
+                i += 1
+                while i < len(line) and line[i] != ch:
+                    i += 2 if line[i] == '\\' else 1
+            elif ch == '`':
+                stack.append('template')
+            elif ch == '{':
+                braces[-1] += 1
+            elif ch == '}':
+                if braces[-1] == 0 and len(stack) > 1:
+                    stack.pop()
+                    braces.pop()
+                else:
+                    braces[-1] -= 1
+            i += 1
+        yield line, start, stack[-1] == 'template'
+
+def minify_js(text):
+    # Conservative: drop indentation, blank lines and whole-line // comments only. Lines
+    # inside multi-line template literals are part of the string and are kept verbatim.
+    lines = []
+    for line, starts_in_literal, ends_in_literal in _js_line_states(text):
+        if not starts_in_literal:
+            line = line.lstrip()
+            if not line or line.startswith('//'):
+                continue
+        if not ends_in_literal:
+            line = line.rstrip()
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+class AssetPipeline:
+    """Fingerprinted, minified and precompressed static assets.
+
+    build() minifies every .css/.js file under static/css and static/js,
+    writes it to static/dist as name.<hash>.ext next to .gz (and .br when the
+    brotli module is installed) variants, and records the mapping in
+    manifest.json. Templates link assets with asset_url('css/style.css'); the
+    hashed URLs are served from /assets with immutable cache headers and the
+    best pre-encoded variant the client accepts.
+    """
+
+    def __init__(self, static_folder, dirs=('css', 'js')):
+        self.static_folder = static_folder
+        self.dirs = dirs
+        self.dist_folder = os.path.join(static_folder, 'dist')
+        self.manifest = {}
+        self.files = {}  # hashed name -> original extension
+
+    def init_app(self, app):
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+        app.jinja_env.globals['asset_url'] = self.asset_url
+
+    def build(self):
+        manifest = {}
+        for folder in self.dirs:
+            source_dir = os.path.join(self.static_folder, folder)
+            if not os.path.isdir(source_dir):
+                continue
+            for name in sorted(os.listdir(source_dir)):
+                base, ext = os.path.splitext(name)
+                if ext not in MINIFIERS:
+                    continue
+                with open(os.path.join(source_dir, name), encoding='utf-8') as f:
+                    body = MINIFIERS[ext](f.read()).encode('utf-8')
+                digest = hashlib.sha256(body).hexdigest()[:12]
+                hashed = f"{folder}/{base}.{digest}{ext}"
+                self._write(hashed, body)
+                manifest[f"{folder}/{name}"] = hashed
+
+        self._write('manifest.json', json.dumps(manifest, indent=2).encode('utf-8'), compress=False)
+        self._write('.gitignore', b'*\n', compress=False)  # build output
+        self.manifest = manifest
+        self.files = {hashed: os.path.splitext(hashed)[1] for hashed in manifest.values()}
+        return manifest
+
+    def load(self):
+        # Use a manifest produced earlier (e.g. at build time) instead of rebuilding
+        with open(os.path.join(self.dist_folder, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.files = {hashed: os.path.splitext(hashed)[1] for hashed in self.manifest.values()}
+
+    def asset_url(self, filename):
+        hashed = self.manifest.get(filename)
+        if not hashed:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=hashed)
+
+    def serve(self, filename):
+        ext = self.files.get(filename)
+        if not ext:
+            abort(404)
+
+        path = os.path.join(self.dist_folder, filename)
+        accepted = request.accept_encodings
+        encoding = None
+        for candidate, suffix in [('br', '.br'), ('gzip', '.gz')]:
+            if accepted[candidate] and os.path.exists(path + suffix):
+                encoding, path = candidate, path + suffix
+                break
+
+        response = send_file(path, mimetype=MIMETYPES[ext], max_age=ONE_YEAR, conditional=True,
+                             etag=f"{filename}.{encoding or 'identity'}")
+        response.headers.pop('Content-Disposition', None)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    def _write(self, name, body, compress=True):
+        path = os.path.join(self.dist_folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        variants = [(path, body)]
+        if compress:
+            variants.append((path + '.gz', gzip.compress(body, 9, mtime=0)))
+            if brotli:
+                variants.append((path + '.br', brotli.compress(body)))
+        for target, data in variants:
+            # Several processes may build at once: write aside, then swap in
+            tmp = f"{target}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, target)
+
+if __name__ == '__main__':
+    # Build step for deployments that start with ASSETS_PREBUILT=1 (same as `flask build-assets`)
+    pipeline = AssetPipeline(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+    for source, hashed in pipeline.build().items():
+        print(f"{source} -> {hashed}")
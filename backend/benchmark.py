@@ -0,0 +1,871 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from database import Database
+from export import stream_export
+
+# Ad-hoc performance checks, run as: python benchmark.py [name ...]
+
+def temp_db_path():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.remove(path)
+    return path
+
+def timed(label, n, fn):
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<40} {elapsed / n * 1e6:9.1f} us/op  ({n} ops)")
+    return elapsed
+
+def bench_stock_writes(n=2000):
+    print("--- Stock write cost ---")
+    path = temp_db_path()
+    db = Database(path)
+    for i in range(50):
+        db.add_product(f"Product {i}", 1.0, "", "Bench")
+
+    # Public API (one connection + commit per call, trigger maintains the total)
+    timed("add_instance", n, lambda i: db.add_instance(i % 50 + 1, f"BC{i}", 1, '', i % 3 + 1))
+    timed("update_quantity", n, lambda i: db.update_quantity(i % 50 + 1, 1, i % 3 + 1))
+
+    # Statement level: trigger-maintained total vs the old explicit double write
+    conn = db._get_connection()
+    upsert = '''
+        INSERT INTO warehouse_stock (product_id, warehouse_id, quantity) VALUES (?, ?, ?)
+        ON CONFLICT(product_id, warehouse_id) DO UPDATE SET quantity = quantity + ?
+    '''
+    timed("warehouse_stock upsert (trigger)", n * 10,
+          lambda i: conn.execute(upsert, (i % 50 + 1, i % 3 + 1, 1, 1)))
+    conn.commit()
+
+    for trigger in ['trg_stock_insert', 'trg_stock_update', 'trg_stock_delete']:
+        conn.execute(f"DROP TRIGGER {trigger}")
+
+    def double_write(i):
+        conn.execute("UPDATE products SET quantity = quantity + ? WHERE id = ?", (1, i % 50 + 1))
+        conn.execute(upsert, (i % 50 + 1, i % 3 + 1, 1, 1))
+    timed("products update + upsert (explicit)", n * 10, double_write)
+    conn.commit()
+    conn.close()
+
+    os.remove(path)
+
+def bench_export_memory(sizes=(1000, 10000, 100000)):
+    print("--- Export peak memory ---")
+    path = temp_db_path()
+    db = Database(path)
+    conn = db._get_connection()
+    loaded = 0
+    for size in sizes:
+        conn.executemany("INSERT INTO scans (barcode, quantity) VALUES (?, 1)",
+                         ((f"BC{i}",) for i in range(loaded, size)))
+        conn.commit()
+        loaded = size
+
+        for fmt in ['csv', 'ndjson']:
+            tracemalloc.start()
+            start = time.perf_counter()
+            total_bytes = sum(len(chunk) for chunk in stream_export(db, 'scans', fmt, compress=True))
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"  {size:>8} rows {fmt:<6} peak {peak / 1024:8.1f} KiB  "
+                  f"{total_bytes / 1024:9.1f} KiB gz  {elapsed:6.2f}s")
+    conn.close()
+
+    os.remove(path)
+
+def bench_eventlet_latency(orders=3000, slow_calls=4, fast_calls=50):
+    print("--- Fast request latency behind slow queries (eventlet) ---")
+    try:
+        import eventlet
+    except ImportError:
+        print("  eventlet not installed, skipping")
+        return
+    from db_executor import DBExecutor
+
+    path = temp_db_path()
+    db = Database(path)
+    conn = db._get_connection()
+    conn.executemany("INSERT INTO products (name, price) VALUES (?, 1.0)", ((f"P{i}",) for i in range(2000)))
+    conn.executemany("INSERT INTO orders (business_name) VALUES (?)", ((f"C{i}",) for i in range(orders)))
+    conn.executemany("INSERT INTO order_items (order_id, product_id, quantity) VALUES (?, ?, 1)",
+                     ((i % orders + 1, i % 2000 + 1) for i in range(orders * 100)))
+    conn.commit()
+    conn.close()
+
+    for enabled in [False, True]:
+        executor = DBExecutor(db, pool_size=8, enabled=enabled)
+        latencies = []
+
+        def fast_request(arrival):
+            # Latency from the scheduled arrival, so time spent waiting behind a blocked hub counts
+            executor.get_warehouses()
+            latencies.append(time.perf_counter() - arrival)
+
+        start = time.perf_counter()
+        pool = eventlet.GreenPool()
+        for _ in range(slow_calls):
+            pool.spawn(executor.get_analytics_data)
+        for i in range(fast_calls):
+            pool.spawn(fast_request, start + i * 0.005)
+            eventlet.sleep(max(0, start + (i + 1) * 0.005 - time.perf_counter()))
+        pool.waitall()
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000
+        label = "tpool executor" if enabled else "inline (blocking)"
+        print(f"  {label:<20} fast p50 {p50:8.1f} ms  p95 {p95:8.1f} ms  wall {elapsed:5.2f}s")
+
+    os.remove(path)
+
+def bench_write_throughput(writes=2000, concurrency=(1, 10, 100)):
+    print("--- Write throughput vs concurrent writers ---")
+    for single_writer in [False, True]:
+        for writers in concurrency:
+            path = temp_db_path()
+            db = Database(path, single_writer=single_writer)
+            for i in range(50):
+                db.add_product(f"Product {i}", 1.0, "", "Bench")
+
+            failures = []
+            per_writer = writes // writers
+
+            def writer(n):
+                for i in range(per_writer):
+                    if not db.update_quantity((n + i) % 50 + 1, 1, i % 3 + 1):
+                        failures.append(1)
+
+            threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - start
+
+            label = "single writer queue" if single_writer else "connection per call"
+            print(f"  {label:<20} {writers:>4} writers  {per_writer * writers / elapsed:9.0f} writes/s  "
+                  f"{len(failures)} failed")
+            db.close()
+            os.remove(path)
+
+def bench_product_search(products=1000000, queries=500):
+    print("--- Product search latency ---")
+    import random
+    rng = random.Random(1)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 9)))
+             for _ in range(20000)]
+    categories = [f"cat{i}" for i in range(200)]
+
+    path = temp_db_path()
+    db = Database(path)
+    conn = db._get_connection()
+    start = time.perf_counter()
+    conn.executemany("INSERT INTO products (name, description, category, price) VALUES (?, ?, ?, 1.0)",
+                     ((' '.join(rng.sample(words, 3)), ' '.join(rng.sample(words, 8)), rng.choice(categories))
+                      for _ in range(products)))
+    conn.commit()
+    conn.close()
+    print(f"  loaded {products} products in {time.perf_counter() - start:.1f}s")
+
+    for label, make_query in [
+        ("full word", lambda: rng.choice(words)),
+        ("3 letter prefix", lambda: rng.choice(words)[:3]),
+        ("two word prefixes", lambda: rng.choice(words)[:4] + ' ' + rng.choice(words)[:2]),
+    ]:
+        latencies = []
+        for _ in range(queries):
+            q = make_query()
+            t = time.perf_counter()
+            db.search_products(q, 20)
+            latencies.append(time.perf_counter() - t)
+        latencies.sort()
+        print(f"  {label:<20} p50 {latencies[len(latencies) // 2] * 1000:6.2f} ms  "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.2f} ms")
+
+    os.remove(path)
+
+def bench_wave_planning(orders=5000, products=500, lines=5):
+    print("--- Wave planning over open orders ---")
+    import random
+    rng = random.Random(1)
+    path = temp_db_path()
+    db = Database(path)
+    conn = db._get_connection()
+    conn.executemany("INSERT INTO products (name, price) VALUES (?, 1.0)", ((f"P{i}",) for i in range(products)))
+    conn.executemany("INSERT INTO orders (business_name) VALUES (?)", ((f"C{i}",) for i in range(orders)))
+    conn.executemany(
+        "INSERT INTO order_item_allocations (order_id, product_id, warehouse_id, quantity) VALUES (?, ?, ?, ?)",
+        ((o + 1, rng.randint(1, products), rng.randint(1, 3), rng.randint(1, 5))
+         for o in range(orders) for _ in range(lines)))
+    conn.executemany("INSERT INTO item_lots (product_id, warehouse_id, barcode, quantity) VALUES (?, 1, ?, ?)",
+                     ((p + 1, f"BC{p + 1}", orders * lines) for p in range(products)))
+    conn.commit()
+    conn.close()
+
+    for size in [100, 1000, orders]:
+        start = time.perf_counter()
+        wave = db.plan_wave(1, max_orders=size)
+        elapsed = time.perf_counter() - start
+        print(f"  max_orders {size:>6}  {len(wave['order_ids']):>6} orders  {len(wave['items']):>4} pick lines  "
+              f"{elapsed * 1000:7.1f} ms")
+
+        barcodes = [f"BC{item['product_id']}" for item in wave['items'] for _ in range(item['quantity'])]
+        start = time.perf_counter()
+        db.confirm_wave(wave['id'], barcodes, "bench")
+        print(f"  {'':<17} confirm {len(barcodes):>6} units scanned  {(time.perf_counter() - start) * 1000:7.1f} ms")
+
+    os.remove(path)
+
+def bench_orders_page(orders=200000, pages=200):
+    print("--- Order list page latency ---")
+    import random
+    rng = random.Random(1)
+    path = temp_db_path()
+    db = Database(path)
+    conn = db._get_connection()
+    conn.executemany(
+        "INSERT INTO orders (business_name, timestamp, status) VALUES (?, datetime('2020-01-01', ? || ' minutes'), ?)",
+        ((f"Client {rng.randint(1, 500)}", i, rng.choice(['PENDING', 'PROCESSING', 'COMPLETED', 'COMPLETED']))
+         for i in range(orders)))
+    conn.executemany("INSERT INTO order_items (order_id, product_id, quantity) VALUES (?, 1, 1)",
+                     ((rng.randint(1, orders),) for _ in range(orders * 3)))
+    conn.commit()
+
+    def old_get_orders(i):
+        # The previous unpaginated listing: aggregate every order, then sort
+        conn.execute('''
+            SELECT o.id, o.business_name, o.timestamp, o.status,
+                   COUNT(oi.id) as item_count, SUM(oi.quantity) as total_qty
+            FROM orders o LEFT JOIN order_items oi ON o.id = oi.order_id
+            GROUP BY o.id ORDER BY o.timestamp DESC
+        ''').fetchall()
+    timed("full listing (old)", 3, old_get_orders)
+
+    timed("first page", pages, lambda i: db.get_orders(limit=50))
+    deep = db.get_orders(limit=1, before=None)[0]
+    for _ in range(orders // 2 // 500):
+        page = db.get_orders(limit=500, before=(deep['timestamp'], deep['id']))
+        deep = page[-1]
+    timed("page after deep cursor", pages, lambda i: db.get_orders(limit=50, before=(deep['timestamp'], deep['id'])))
+    timed("status filter page", pages, lambda i: db.get_orders(status='PENDING', limit=50))
+    timed("client filter page", pages, lambda i: db.get_orders(business_name="Client 42", limit=50))
+    timed("count (counters)", pages, lambda i: db.count_orders(status='PENDING'))
+    timed("count (client filter)", pages, lambda i: db.count_orders(business_name="Client 42"))
+    conn.close()
+
+    os.remove(path)
+
+def bench_item_lots(products=50, deliveries=40, units=2500):
+    print("--- Unit rows vs lots: size and latency ---")
+    import sqlite3
+    path = temp_db_path()
+    Database(path)
+    conn = sqlite3.connect(path)
+    conn.execute("DROP TABLE item_lots")
+    conn.executemany("INSERT INTO products (name, price) VALUES (?, 1.0)", ((f"P{i}",) for i in range(products)))
+    # Legacy layout: one row per received unit
+    for d in range(deliveries):
+        conn.executemany(
+            "INSERT INTO item_instances (product_id, warehouse_id, barcode, scan_time, notes) "
+            "VALUES (?, ?, ?, datetime('2024-01-01', ? || ' hours'), 'delivery')",
+            ((d % products + 1, d % 3 + 1, f"BC{d}", d) for _ in range(units)))
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    legacy_size = os.path.getsize(path)
+
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    legacy = lambda i: conn.execute("SELECT * FROM item_instances WHERE product_id = ? ORDER BY scan_time DESC",
+                                    (i % products + 1,)).fetchall()
+    print(f"  legacy: {deliveries * units} unit rows, {legacy_size / 1024 / 1024:6.2f} MiB")
+    timed("get_instances (unit rows)", 50, legacy)
+    timed("barcode -> product lookup (unit rows)", 2000, lambda i: conn.execute(
+        "SELECT product_id FROM item_instances WHERE barcode = ? AND warehouse_id = ?",
+        (f"BC{i % deliveries}", i % deliveries % 3 + 1)).fetchone())
+    conn.close()
+
+    start = time.perf_counter()
+    db = Database(path)
+    migrate_time = time.perf_counter() - start
+    conn = db._get_connection()
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    lots = conn.execute("SELECT COUNT(*) FROM item_lots").fetchone()[0]
+    print(f"  lots:   {lots} lot rows, {os.path.getsize(path) / 1024 / 1024:6.2f} MiB  (migration {migrate_time:.2f}s)")
+    timed("get_instances (lots)", 50, lambda i: db.get_instances(i % products + 1))
+    timed("barcode -> product lookup (lots)", 2000, lambda i: conn.execute(
+        "SELECT product_id FROM item_lots WHERE barcode = ? AND warehouse_id = ? LIMIT 1",
+        (f"BC{i % deliveries}", i % deliveries % 3 + 1)).fetchone())
+    timed("add_instance 2500 units", 20, lambda i: db.add_instance(1, f"NEW{i}", units, '', 1))
+    conn.close()
+
+    os.remove(path)
+
+def bench_report_snapshot(orders=3000, writes=500):
+    print("--- Write latency while reports run (live vs snapshot) ---")
+    from snapshot import ReportSnapshot
+    path = temp_db_path()
+    db = Database(path)
+    conn = db._get_connection()
+    conn.executemany("INSERT INTO products (name, price) VALUES (?, 1.0)", ((f"P{i}",) for i in range(2000)))
+    conn.executemany("INSERT INTO orders (business_name) VALUES (?)", ((f"C{i}",) for i in range(orders)))
+    conn.executemany("INSERT INTO order_items (order_id, product_id, quantity) VALUES (?, ?, 1)",
+                     ((i % orders + 1, i % 2000 + 1) for i in range(orders * 100)))
+    conn.commit()
+    conn.close()
+
+    snapshot_path = temp_db_path()
+    snapshot = ReportSnapshot(db, snapshot_path)
+    start = time.perf_counter()
+    snapshot.refresh()
+    print(f"  snapshot refresh ({os.path.getsize(snapshot_path) / 1024 / 1024:.1f} MiB) "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+    for label, reports in [("no reports", None), ("reports on live db", db), ("reports on snapshot", snapshot.reader)]:
+        stop = threading.Event()
+        report_count = []
+
+        def reporter():
+            while not stop.is_set():
+                reports.get_analytics_data()
+                report_count.append(1)
+
+        threads = [threading.Thread(target=reporter) for _ in range(2)] if reports else []
+        for t in threads:
+            t.start()
+        latencies = []
+        for i in range(writes):
+            t = time.perf_counter()
+            db.update_quantity(i % 2000 + 1, 1, 1)
+            latencies.append(time.perf_counter() - t)
+        stop.set()
+        for t in threads:
+            t.join()
+
+        latencies.sort()
+        print(f"  {label:<22} write p50 {latencies[len(latencies) // 2] * 1000:6.2f} ms  "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.2f} ms  ({len(report_count)} reports)")
+
+    os.remove(path)
+    os.remove(snapshot_path)
+
+def _http_load(ports, path, seconds, counts):
+    # One client process: keep-alive GETs spread round-robin over the worker ports
+    import http.client
+    conns = [http.client.HTTPConnection('127.0.0.1', port) for port in ports]
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        conn = conns[done % len(conns)]
+        conn.request('GET', path)
+        conn.getresponse().read()
+        done += 1
+    counts.put(done)
+
+def bench_process_scaling(max_workers=4, clients=8, seconds=5):
+    print("--- Request throughput vs worker processes ---")
+    import multiprocessing
+    import subprocess
+    import urllib.request
+    print(f"  {os.cpu_count()} CPU cores available")
+    workdir = tempfile.mkdtemp()
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+    env = dict(os.environ, RETENTION_ENABLED='0', REPORT_SNAPSHOT_ENABLED='0', SERIAL_PORT='/dev/null-bench')
+    Database(os.path.join(workdir, 'inventory.db'))
+
+    for workers in range(1, max_workers + 1):
+        ports = [5101 + i for i in range(workers)]
+        processes = [subprocess.Popen([sys.executable, app_path], cwd=workdir, env=dict(env, PORT=str(port)),
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                     for port in ports]
+        for port in ports:
+            for _ in range(100):
+                try:
+                    urllib.request.urlopen(f"http://127.0.0.1:{port}/api/warehouses").read()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+
+        counts = multiprocessing.Queue()
+        loaders = [multiprocessing.Process(target=_http_load, args=(ports, '/api/warehouses', seconds, counts))
+                   for _ in range(clients)]
+        for loader in loaders:
+            loader.start()
+        total = sum(counts.get() for _ in loaders)
+        for loader in loaders:
+            loader.join()
+        for process in processes:
+            process.terminate()
+            process.wait()
+        print(f"  {workers} worker(s)  {total / seconds:8.0f} req/s")
+
+    import shutil
+    shutil.rmtree(workdir)
+
+def bench_json_responses(products=5000, requests=50):
+    print("--- /api/products: CPU time and bytes per request ---")
+    from flask import Flask, jsonify
+    from flask.json.provider import DefaultJSONProvider
+    from responses import FastJSONProvider, compress_responses
+    path = temp_db_path()
+    db = Database(path)
+    conn = db._get_connection()
+    conn.executemany("INSERT INTO products (name, description, category, price, image_path) VALUES (?, ?, ?, ?, ?)",
+                     ((f"Product {i}", f"Description of product {i}", f"cat{i % 20}", i * 0.5, f"uploads/{i}.jpg")
+                      for i in range(products)))
+    conn.executemany("INSERT INTO warehouse_stock (product_id, warehouse_id, quantity) VALUES (?, ?, ?)",
+                     ((i + 1, w, i % 7) for i in range(products) for w in (1, 2, 3)))
+    conn.commit()
+    conn.close()
+
+    def old_rows():
+        # Previous get_all_products: sqlite3.Row then dict(row)
+        conn = db._get_connection()
+        products = [dict(row) for row in conn.execute("SELECT * FROM products ORDER BY id DESC")]
+        stock_map = {}
+        for row in conn.execute("SELECT product_id, warehouse_id, quantity FROM warehouse_stock"):
+            stock_map.setdefault(row['product_id'], {})[row['warehouse_id']] = row['quantity']
+        for p in products:
+            p['stock_breakdown'] = stock_map.get(p['id'], {})
+        conn.close()
+        return products
+
+    for label, provider, rows, gzip_on in [
+        ("Row + stdlib json", DefaultJSONProvider, old_rows, False),
+        ("tuples + stdlib json", DefaultJSONProvider, db.get_all_products, False),
+        ("tuples + orjson", FastJSONProvider, db.get_all_products, False),
+        ("tuples + orjson + gzip", FastJSONProvider, db.get_all_products, True),
+    ]:
+        app = Flask(__name__)
+        app.json = provider(app)
+        if gzip_on:
+            compress_responses(app)
+        app.add_url_rule('/api/products', 'products', lambda: jsonify(rows()))
+        client = app.test_client()
+        client.get('/api/products')
+        start = time.process_time()
+        for _ in range(requests):
+            size = len(client.get('/api/products', headers={'Accept-Encoding': 'gzip'}).data)
+        cpu = (time.process_time() - start) / requests
+        print(f"  {label:<24} {cpu * 1000:7.2f} ms CPU/request  {size / 1024:8.1f} KiB")
+
+    os.remove(path)
+
+def bench_print_batch(orders=300, lines=8):
+    print("--- Printing a morning's orders ---")
+    from flask import Flask, render_template
+    path = temp_db_path()
+    db = Database(path)
+    conn = db._get_connection()
+    conn.executemany("INSERT INTO products (name, price) VALUES (?, 1.0)", ((f"Product {i}",) for i in range(500)))
+    conn.executemany("INSERT INTO orders (business_name) VALUES (?)", ((f"Client {i}",) for i in range(orders)))
+    conn.executemany("INSERT INTO order_items (order_id, product_id, quantity) VALUES (?, ?, 2)",
+                     ((o + 1, (o * lines + l) % 500 + 1) for o in range(orders) for l in range(lines)))
+    conn.commit()
+    conn.close()
+    app = Flask(__name__, template_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates'))
+
+    def one_by_one():
+        # Previous flow: one page load (two queries + a render) per order
+        pages = 0
+        for order_id in range(1, orders + 1):
+            conn = db._get_connection()
+            order = conn.execute("SELECT * FROM orders WHERE id = ?", (order_id,)).fetchone()
+            items = conn.execute('''
+                SELECT oi.quantity, p.name, p.id as product_id
+                FROM order_items oi JOIN products p ON oi.product_id = p.id
+                WHERE oi.order_id = ?
+            ''', (order_id,)).fetchall()
+            conn.close()
+            order = dict(order)
+            order['items'] = [dict(i) for i in items]
+            pages += len(render_template('print_order.html', orders=[order]))
+        return pages
+
+    def batch():
+        return len(render_template('print_order.html', orders=db.get_print_batch(status='PENDING')))
+
+    with app.app_context():
+        for label, fn in [("one page per order", one_by_one), ("batch document", batch)]:
+            start = time.perf_counter()
+            size = fn()
+            print(f"  {label:<20} {orders} orders  {(time.perf_counter() - start) * 1000:7.1f} ms  "
+                  f"{size / 1024:7.1f} KiB html")
+
+    os.remove(path)
+
+def bench_timeseries(orders=40000, lines=5, products=500):
+    print("--- 90-day sales chart ---")
+    import pandas as pd
+    from timeseries import TimeSeries
+    path = temp_db_path()
+    db = Database(path)
+    conn = db._get_connection()
+    conn.executemany("INSERT INTO products (name, category, price) VALUES (?, ?, 1.5)",
+                     ((f"Product {i}", f"Category {i % 12}") for i in range(products)))
+    # Orders spread over the last 90 days
+    conn.executemany("INSERT INTO orders (business_name, timestamp) VALUES ('Client', datetime('now', ?))",
+                     ((f"-{o * 90 * 24 * 3600 // orders} seconds",) for o in range(orders)))
+    start = time.perf_counter()
+    conn.executemany("INSERT INTO order_item_allocations (order_id, product_id, warehouse_id, quantity) "
+                     "VALUES (?, ?, ?, 2)",
+                     ((o + 1, (o * 7 + l * 31) % products + 1, l % 3 + 1) for o in range(orders) for l in range(lines)))
+    conn.commit()
+    rows = orders * lines
+    print(f"  {rows} allocation inserts (rollup trigger) {(time.perf_counter() - start) * 1000:7.1f} ms")
+    conn.close()
+
+    def raw():
+        # Previous approach: pull every line and aggregate it in Python
+        conn = db._get_connection()
+        conn.row_factory = None
+        data = conn.execute('''
+            SELECT o.timestamp, p.name, a.quantity
+            FROM order_item_allocations a
+            JOIN orders o ON o.id = a.order_id
+            JOIN products p ON p.id = a.product_id
+            WHERE o.timestamp >= datetime('now', '-90 days')
+        ''').fetchall()
+        conn.close()
+        df = pd.DataFrame.from_records(data, columns=['ts', 'series', 'value'])
+        df['ts'] = pd.to_datetime(df['ts']).dt.floor('D')
+        return df.groupby(['ts', 'series'])['value'].sum().unstack(fill_value=0)
+
+    ts = TimeSeries(db)
+    for label, fn in [("raw lines + pandas", raw),
+                      ("rollups, cold", lambda: TimeSeries(db).figure(group_by='product', bucket='day')),
+                      ("rollups, cached", lambda: ts.figure(group_by='product', bucket='day')),
+                      ("rollups weekly by category", lambda: TimeSeries(db).figure(group_by='category', bucket='week'))]:
+        fn()
+        n = 5
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        print(f"  {label:<30} {(time.perf_counter() - start) / n * 1000:8.1f} ms")
+
+    os.remove(path)
+
+def bench_replenishment(products=100000, sales_days=5, touched=1000):
+    print("--- Replenishment forecast ---")
+    import random
+    from datetime import date, timedelta
+    from forecast import ReplenishmentForecaster
+    path = temp_db_path()
+    db = Database(path)
+    rng = random.Random(1)
+    conn = db._get_connection()
+    conn.executemany("INSERT INTO products (name, price) VALUES (?, 1.0)", ((f"Product {i}",) for i in range(products)))
+    conn.executemany("INSERT INTO warehouse_stock (product_id, warehouse_id, quantity) VALUES (?, 1, ?)",
+                     ((i + 1, rng.randint(0, 200)) for i in range(products)))
+    days = [(date.today() - timedelta(days=d)).isoformat() for d in range(28)]
+    conn.executemany("INSERT OR IGNORE INTO sales_daily (period, product_id, warehouse_id, units) VALUES (?, ?, 1, ?)",
+                     ((rng.choice(days), i + 1, rng.randint(1, 10)) for i in range(products) for _ in range(sales_days)))
+    conn.commit()
+    conn.close()
+
+    forecaster = ReplenishmentForecaster(db)
+    start = time.perf_counter()
+    n = forecaster.run_once(full=True)
+    print(f"  full pass             {n:7d} rows  {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    # A burst of stock changes (orders, receipts) marks only those rows dirty
+    for i in range(touched):
+        db.update_quantity(rng.randint(1, products), -1, 1)
+    start = time.perf_counter()
+    n = forecaster.run_once()
+    print(f"  incremental pass      {n:7d} rows  {(time.perf_counter() - start) * 1000:8.1f} ms")
+    start = time.perf_counter()
+    n = forecaster.run_once()
+    print(f"  idle pass             {n:7d} rows  {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    os.remove(path)
+
+def bench_low_stock(n=2000):
+    print("--- Low-stock detection cost vs catalogue size ---")
+    for products in (1000, 100000):
+        path = temp_db_path()
+        db = Database(path)
+        conn = db._get_connection()
+        conn.executemany("INSERT INTO products (name, price) VALUES (?, 1.0)", ((f"Product {i}",) for i in range(products)))
+        conn.executemany("INSERT INTO warehouse_stock (product_id, warehouse_id, quantity) VALUES (?, 1, 1000000)",
+                         ((i + 1,) for i in range(products)))
+        conn.executemany("INSERT INTO stock_thresholds (product_id, warehouse_id, threshold) VALUES (?, 0, 10)",
+                         ((i + 1,) for i in range(products)))
+        conn.commit()
+
+        start = time.perf_counter()
+        for i in range(20):
+            conn.execute("SELECT COUNT(*) FROM products WHERE quantity < 5").fetchone()
+        scan = (time.perf_counter() - start) / 20
+        conn.close()
+        print(f"  {products:>6} products  full scan per check      {scan * 1e6:9.1f} us")
+        timed(f"{products:>6} products  update_quantity + check", n,
+              lambda i: db.update_quantity(i % products + 1, -1, 1))
+        os.remove(path)
+
+def bench_stock_ledger(days=365, per_day=3000, products=1000, warehouses=3, queries=50):
+    print("--- Point-in-time stock over a year of movements ---")
+    import random
+    from datetime import datetime, timedelta
+    path = temp_db_path()
+    db = Database(path)
+    rng = random.Random(1)
+    conn = db._get_connection()
+    conn.execute("DELETE FROM stock_snapshots")
+    start_day = datetime(2024, 1, 1)
+    stock = {}
+    movement_id = 0
+    for day in range(days):
+        base = start_day + timedelta(days=day)
+        movements = []
+        for i in range(per_day):
+            key = (rng.randint(1, products), rng.randint(1, warehouses))
+            delta = rng.choice((-3, -2, -1, -1, 5, 20))
+            stock[key] = stock.get(key, 0) + delta
+            at = (base + timedelta(seconds=i * 86400 // per_day)).strftime('%Y-%m-%d %H:%M:%S')
+            movements.append((key[0], key[1], delta, at))
+        conn.executemany("INSERT INTO stock_movements (product_id, warehouse_id, delta, at) VALUES (?, ?, ?, ?)",
+                         movements)
+        movement_id += per_day
+        # Daily snapshot at midnight, as StockSnapshotter would write
+        cursor = conn.execute("INSERT INTO stock_snapshots (movement_id, taken_at) VALUES (?, ?)",
+                              (movement_id, (base + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')))
+        conn.executemany("INSERT INTO stock_snapshot_rows VALUES (?, ?, ?, ?)",
+                         ((cursor.lastrowid, w, p, q) for (p, w), q in stock.items() if q))
+    # History starts with an empty baseline before the first movement
+    conn.execute("INSERT INTO stock_snapshots (movement_id, taken_at) VALUES (0, '2023-12-31 00:00:00')")
+    conn.commit()
+    print(f"  {movement_id} movements, {days} snapshots, "
+          f"{os.path.getsize(path) / 1024 / 1024:.0f} MiB")
+
+    moments = [(start_day + timedelta(seconds=rng.randint(0, days * 86400 - 1))).strftime('%Y-%m-%d %H:%M:%S')
+               for _ in range(queries)]
+
+    def replay(at, warehouse_id=None):
+        # Without snapshots: sum every movement up to the moment
+        sql = "SELECT product_id, SUM(delta) FROM stock_movements WHERE at <= ?"
+        params = [at]
+        if warehouse_id is not None:
+            sql += " AND warehouse_id = ?"
+            params.append(warehouse_id)
+        return conn.execute(sql + " GROUP BY product_id", params).fetchall()
+
+    for label, fn in [("full replay, warehouse 2", lambda at: replay(at, 2)),
+                      ("snapshot + tail, warehouse 2", lambda at: db.get_stock_at(at, warehouse_id=2)),
+                      ("snapshot + tail, all warehouses", lambda at: db.get_stock_at(at)),
+                      ("snapshot + tail, one product", lambda at: db.get_stock_at(at, product_id=7))]:
+        begin = time.perf_counter()
+        for at in moments:
+            fn(at)
+        print(f"  {label:<34} {(time.perf_counter() - begin) / queries * 1000:8.1f} ms/query")
+
+    at = moments[0]
+    expected = sorted((p, q) for p, q in replay(at, 2) if q)
+    assert expected == [(r['product_id'], r['quantity']) for r in db.get_stock_at(at, warehouse_id=2)]
+    conn.close()
+    os.remove(path)
+
+def bench_warehouse_scaling(writes=1200, warehouse_counts=(1, 2, 4, 8)):
+    print("--- Receiving throughput vs warehouse count ---")
+    # One receiving thread per warehouse. "shared file" is the default layout, "sharded" gives
+    # each warehouse a shard file (Database shard_dir) folded into the core file after every
+    # write, "file per warehouse" gives each warehouse its own Database: the ceiling, with no fold
+    for layout in ("shared file", "sharded", "file per warehouse"):
+        for count in warehouse_counts:
+            paths = [temp_db_path() for _ in range(count if layout == "file per warehouse" else 1)]
+            shard_dir = tempfile.mkdtemp() if layout == "sharded" else None
+            dbs = [Database(path, single_writer=True, shard_dir=shard_dir) for path in paths]
+            for db in dbs:
+                conn = db._get_connection()
+                conn.executemany("INSERT INTO warehouses (name) VALUES (?)",
+                                 ((f"Warehouse {w}",) for w in range(4, count + 1)))
+                conn.commit()
+                conn.close()
+                for i in range(50):
+                    db.add_product(f"Product {i}", 1.0, "", "Bench")
+
+            per_warehouse = writes // count
+
+            def receiver(wid):
+                db = dbs[(wid - 1) % len(dbs)]
+                for i in range(per_warehouse):
+                    db.add_instance(i % 50 + 1, f"W{wid}-{i}", 1, '', wid)
+
+            threads = [threading.Thread(target=receiver, args=(wid,)) for wid in range(1, count + 1)]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - start
+            print(f"  {layout:<20} {count:>2} warehouses  {per_warehouse * count / elapsed:8.0f} writes/s")
+            for db, path in zip(dbs, paths):
+                db.close()
+                os.remove(path)
+            if shard_dir:
+                shutil.rmtree(shard_dir)
+
+def bench_cycle_count(lines=5000):
+    print("--- Cycle count of 5,000 lines ---")
+    import random
+    rng = random.Random(1)
+    path = temp_db_path()
+    db = Database(path, single_writer=True)
+    conn = db._get_connection()
+    conn.executemany("INSERT INTO products (name, price) VALUES (?, 1.0)", ((f"Product {i}",) for i in range(lines)))
+    conn.executemany("INSERT INTO warehouse_stock (product_id, warehouse_id, quantity) VALUES (?, ?, 50)",
+                     ((i // 3 + 1, i % 3 + 1) for i in range(lines)))
+    conn.commit()
+    conn.close()
+    count = [{'product_id': i // 3 + 1, 'warehouse_id': i % 3 + 1, 'counted': rng.randint(45, 55)}
+             for i in range(lines)]
+
+    start = time.perf_counter()
+    for line in count:
+        db.update_quantity(line['product_id'], line['counted'] - 50, line['warehouse_id'])
+    print(f"  update_quantity per line   {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    # A second count against the adjusted stock
+    for line in count:
+        line['counted'] = rng.randint(45, 55)
+    start = time.perf_counter()
+    success, report = db.adjust_stock(count)
+    print(f"  adjust_stock, one commit   {(time.perf_counter() - start) * 1000:8.1f} ms  "
+          f"({report['changed']} changed)")
+    db.close()
+    os.remove(path)
+
+def bench_stock_matrix(products=20000, warehouses=3, reads=20):
+    print("--- Stock reads: SQLite vs in-memory matrix (20,000 products) ---")
+    path = temp_db_path()
+    db = Database(path)
+    conn = db._get_connection()
+    conn.executemany("INSERT INTO warehouses (name) VALUES (?)", ((f"W{i}",) for i in range(4, warehouses + 1)))
+    conn.executemany("INSERT INTO products (name, price) VALUES (?, 2.5)", ((f"Product {i}",) for i in range(products)))
+    conn.executemany("INSERT INTO warehouse_stock (product_id, warehouse_id, quantity) VALUES (?, ?, 10)",
+                     ((p, w) for p in range(1, products + 1) for w in range(1, warehouses + 1)))
+    conn.commit()
+    conn.close()
+    items = [{'product_id': p, 'quantity': 1} for p in range(1, 11)]
+
+    timed("get_all_products, SQL", reads, lambda _: db.get_all_products())
+    timed("get_analytics_data, SQL", reads, lambda _: db.get_analytics_data())
+    timed("create_order (10 items), SQL", reads, lambda _: db.create_order("Bench", items))
+
+    start = time.perf_counter()
+    db.enable_stock_matrix()
+    print(f"  matrix load                {(time.perf_counter() - start) * 1000:8.1f} ms")
+    timed("get_all_products, matrix", reads, lambda _: db.get_all_products())
+    timed("get_analytics_data, matrix", reads, lambda _: db.get_analytics_data())
+    timed("create_order (10 items), matrix", reads, lambda _: db.create_order("Bench", items))
+    short = [{'product_id': 1, 'quantity': 10 ** 6}]
+    timed("rejected order, matrix", reads, lambda _: db.create_order("Bench", short))
+    timed("consistency check", 1, lambda _: db.stock_matrix.check())
+    os.remove(path)
+
+def bench_jobs(rows=5000):
+    print("--- CSV import of 5,000 rows: inline vs background job ---")
+    import tempfile
+    from jobs import JobRunner, import_products
+    path = temp_db_path()
+    db = Database(path)
+    output_dir = tempfile.mkdtemp()
+
+    def write_csv():
+        csv_path = os.path.join(output_dir, "import.csv")
+        with open(csv_path, "w") as f:
+            f.write("name,price,category\n")
+            f.writelines(f"Product {i},1.5,Bench\n" for i in range(rows))
+        return csv_path
+
+    class Inline:
+        def progress(self, *args, **kwargs):
+            pass
+
+    start = time.perf_counter()
+    import_products(db, {'path': write_csv()}, Inline())
+    print(f"  inline (request blocked)   {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    runner = JobRunner(db, output_dir, max_workers=1)
+    runner.start()
+    csv_path = write_csv()
+    start = time.perf_counter()
+    job_id = runner.submit('import_products', {'path': csv_path})
+    print(f"  submit (request returns)   {(time.perf_counter() - start) * 1000:8.1f} ms")
+    while db.get_job(job_id)['status'] in ('queued', 'running'):
+        time.sleep(0.05)
+    print(f"  job finished after         {(time.perf_counter() - start) * 1000:8.1f} ms  "
+          f"({db.get_job(job_id)['result']['imported_count']} imported)")
+    runner.stop()
+    os.remove(path)
+
+def bench_dashboard(products=5000, orders=2000, details=50):
+    print("--- Dashboard first paint and order details ---")
+    path = temp_db_path()
+    db = Database(path)
+    conn = db._get_connection()
+    conn.executemany("INSERT INTO products (name, price) VALUES (?, 1.0)", ((f"Product {i}",) for i in range(products)))
+    conn.executemany("INSERT INTO warehouse_stock (product_id, warehouse_id, quantity) VALUES (?, 1, 100)",
+                     ((p,) for p in range(1, products + 1)))
+    conn.executemany("INSERT INTO orders (business_name) VALUES (?)", ((f"Client {i % 50}",) for i in range(orders)))
+    conn.executemany("INSERT INTO order_items (order_id, product_id, quantity) VALUES (?, ?, 2)",
+                     ((i % orders + 1, i % products + 1) for i in range(orders * 3)))
+    conn.executemany("INSERT INTO order_item_allocations (order_id, product_id, warehouse_id, quantity) VALUES (?, ?, 1, 2)",
+                     ((i % orders + 1, i % products + 1) for i in range(orders * 3)))
+    conn.commit()
+    conn.close()
+
+    def separate(_):
+        db.get_warehouses()
+        db.get_all_products()
+        db.get_orders()
+        db.count_orders()
+
+    # Analytics are not part of the read: /api/bootstrap takes them from the report snapshot
+    timed("dashboard, four calls", 20, separate)
+    timed("dashboard, one read transaction", 20, lambda _: db.get_dashboard())
+    ids = list(range(1, details + 1))
+    timed(f"{details} order details, one by one", 20, lambda _: [db.get_order_details(i) for i in ids])
+    timed(f"{details} order details, multi-get", 20, lambda _: db.get_orders_details(ids))
+    os.remove(path)
+
+BENCHMARKS = {
+    'stock_writes': bench_stock_writes,
+    'export_memory': bench_export_memory,
+    'eventlet_latency': bench_eventlet_latency,
+    'write_throughput': bench_write_throughput,
+    'product_search': bench_product_search,
+    'wave_planning': bench_wave_planning,
+    'orders_page': bench_orders_page,
+    'item_lots': bench_item_lots,
+    'report_snapshot': bench_report_snapshot,
+    'process_scaling': bench_process_scaling,
+    'json_responses': bench_json_responses,
+    'print_batch': bench_print_batch,
+    'timeseries': bench_timeseries,
+    'replenishment': bench_replenishment,
+    'low_stock': bench_low_stock,
+    'stock_ledger': bench_stock_ledger,
+    'warehouse_scaling': bench_warehouse_scaling,
+    'cycle_count': bench_cycle_count,
+    'stock_matrix': bench_stock_matrix,
+    'jobs': bench_jobs,
+    'dashboard': bench_dashboard,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
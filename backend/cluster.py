@@ -0,0 +1,177 @@
+import fcntl
+import os
+import subprocess
+import sys
+import threading
+import time
+import socketio
+
+# Running several app.py processes: each one serves HTTP/Socket.IO on its own
+# port behind a load balancer with sticky sessions (e.g. nginx ip_hash), and
+# Socket.IO emits are relayed between them through SOCKETIO_MESSAGE_QUEUE.
+#
+#   SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0 python cluster.py 4
+
+class ClusterEvents:
+    """Mixin for Socket.IO pub/sub managers.
+
+    Besides client emits, carries app-level events (name, data) to the other
+    processes, e.g. to keep their in-memory pick queues in sync. Events are
+    not delivered back to the process that published them. Subclasses provide
+    _receive(), the raw message stream of their transport.
+
+    initialize() may be called by the app before the first client connects
+    (so events are received by processes without sockets too); the server's
+    own call on first connection is then a no-op.
+    """
+
+    def initialize(self):
+        if getattr(self, 'listening', False):
+            return
+        self.listening = True
+        super().initialize()
+
+    def on_cluster_event(self, name, handler):
+        if not hasattr(self, 'cluster_handlers'):
+            self.cluster_handlers = {}
+        self.cluster_handlers[name] = handler
+
+    def publish_event(self, name, data):
+        self._publish({'method': 'cluster_event', 'name': name, 'data': data, 'host_id': self.host_id})
+
+    def _listen(self):
+        for message in self._receive():
+            data = message
+            if not isinstance(message, dict):
+                try:
+                    data = self.json.loads(message)
+                except Exception:
+                    yield message
+                    continue
+            if isinstance(data, dict) and data.get('method') == 'cluster_event':
+                handler = getattr(self, 'cluster_handlers', {}).get(data.get('name'))
+                if handler and data.get('host_id') != self.host_id:
+                    try:
+                        handler(data.get('data'))
+                    except Exception as e:
+                        print(f"Cluster event error ({data.get('name')}): {e}")
+                continue
+            yield message
+
+class LocalManager(ClusterEvents, socketio.PubSubManager):
+    """In-process stand-in for the Redis message queue (local://<channel>).
+
+    Every manager on the same channel in this process receives what the others
+    publish, so several Socket.IO servers can be wired together in tests
+    without a broker. It does not reach other processes.
+    """
+    name = 'local'
+    channels = {}
+    channels_lock = threading.Lock()
+
+    def __init__(self, url='local://', write_only=False, logger=None, json=None):
+        super().__init__(channel=url.split('://', 1)[1] or 'socketio', write_only=write_only,
+                         logger=logger, json=json)
+
+    def _publish(self, data):
+        with LocalManager.channels_lock:
+            queues = list(LocalManager.channels.get(self.channel, []))
+        for q in queues:
+            q.put(self.json.dumps(data))
+
+    def _receive(self):
+        q = self.server.eio.create_queue()
+        with LocalManager.channels_lock:
+            LocalManager.channels.setdefault(self.channel, []).append(q)
+        while True:
+            yield q.get()
+
+class RedisManager(ClusterEvents, socketio.RedisManager):
+    name = 'redis'
+
+    def _receive(self):
+        return socketio.RedisManager._listen(self)
+
+def make_client_manager(url):
+    # None (single process), local://<channel> or redis://...
+    if not url:
+        return None
+    if url.startswith('local://'):
+        return LocalManager(url)
+    if url.startswith(('redis://', 'rediss://')):
+        # Sockets must be cooperative by now: app.py monkey-patches them before any other import
+        return RedisManager(url)
+    raise ValueError(f"Unsupported message queue: {url}")
+
+class LeaderLock:
+    """Elects one process on this host to run the singleton services (serial
+    monitor, retention, report snapshot) with an exclusive flock on lock_path.
+
+    Followers retry every poll seconds, so if the leader exits another process
+    takes over. on_elected is called once, from a background thread unless the
+    lock was free at start().
+    """
+
+    def __init__(self, lock_path, on_elected, poll=5):
+        self.lock_path = lock_path
+        self.on_elected = on_elected
+        self.poll = poll
+        self.lock_file = None
+        self.thread = None
+
+    def is_leader(self):
+        return self.lock_file is not None
+
+    def start(self):
+        if self._try_acquire():
+            self.on_elected()
+            return
+        self.thread = threading.Thread(target=self._wait_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def release(self):
+        if self.lock_file:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+
+    def _try_acquire(self):
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self.lock_file = lock_file
+        return True
+
+    def _wait_loop(self):
+        while not self._try_acquire():
+            time.sleep(self.poll)
+        print(f"Process {os.getpid()} elected leader")
+        self.on_elected()
+
+def run_workers(count, base_port=5001):
+    # Start count app.py processes on consecutive ports; the load balancer spreads clients over them
+    env = dict(os.environ)
+    if count > 1 and not env.get('SOCKETIO_MESSAGE_QUEUE', '').startswith(('redis://', 'rediss://')):
+        print("Several workers need SOCKETIO_MESSAGE_QUEUE=redis://... to share Socket.IO broadcasts")
+        sys.exit(1)
+
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+    processes = []
+    for i in range(count):
+        env['PORT'] = str(base_port + i)
+        processes.append(subprocess.Popen([sys.executable, app_path], env=dict(env)))
+        print(f"Worker {i + 1}/{count} on port {base_port + i} (pid {processes[-1].pid})")
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+if __name__ == '__main__':
+    run_workers(int(sys.argv[1]) if len(sys.argv) > 1 else int(os.environ.get('WORKERS', 1)),
+                int(os.environ.get('PORT', 5001)))
@@ -0,0 +1,19 @@
+import itertools
+import pytest
+from database import Database
+
+@pytest.fixture
+def make_path(tmp_path):
+    # Fresh, not yet created file paths under the test's tmp_path (cleaned up by pytest)
+    counter = itertools.count(1)
+
+    def make(suffix='.db'):
+        return str(tmp_path / f"test_{next(counter)}{suffix}")
+    return make
+
+@pytest.fixture
+def make_db(make_path):
+    # A new Database in its own file; keyword arguments go to Database
+    def make(**kwargs):
+        return Database(make_path(), **kwargs)
+    return make
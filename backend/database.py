@@ -1,21 +1,132 @@
+import json
 import sqlite3
-import datetime
 import os
+import re
+import threading
+from write_queue import WriteQueue
 
 DB_NAME = "inventory.db"
 
+# Directory for per-warehouse shard files; unset keeps everything in DB_NAME (see Database)
+SHARD_DIR = os.environ.get('WAREHOUSE_SHARD_DIR') or None
+
+# High-volume tables whose rows live in their warehouse's shard when sharded
+SHARDED_TABLES = ('warehouse_stock', 'item_lots', 'item_instances', 'scans', 'order_item_allocations')
+
+# Streamable exports: kind -> (select, time column for `since` filters or None)
+EXPORTS = {
+    'products': ("SELECT id, name, category, price, description, quantity, pack_size FROM products", None),
+    'scans': ("SELECT id, barcode, quantity, timestamp FROM scans", 'timestamp'),
+    'instances': ("SELECT id, product_id, warehouse_id, barcode, scan_time, notes, status, lot_id FROM item_instances", 'scan_time'),
+    'lots': ("SELECT id, product_id, warehouse_id, barcode, received_at, notes, quantity, picked_quantity FROM item_lots", 'received_at'),
+    'orders': ("SELECT id, business_name, timestamp, status, worker_name, completed_at FROM orders", 'timestamp'),
+    'order_items': ('''
+        SELECT oi.id, oi.order_id, oi.product_id, oi.quantity, o.timestamp
+        FROM order_items oi JOIN orders o ON o.id = oi.order_id
+    ''', 'o.timestamp'),
+}
+
 class Database:
-    def __init__(self):
-        self._init_db()
+    def __init__(self, db_name=DB_NAME, single_writer=False, read_only=False, shard_dir=SHARD_DIR):
+        self.db_name = db_name
+        self.read_only = read_only
+        self.write_count = 0
+        self.low_stock_handlers = []
+        self.stock_matrix = None
+        # Per-warehouse shard files (see Warehouse Shards below): warehouse_id -> path
+        self.shard_dir = shard_dir
+        self.shards = {}
+        self.shard_writers = {}
+        self.shard_readers = {}
+        self.shard_lock = threading.Lock()
+        self.fold_lock = threading.Lock()
+        if not read_only:
+            self._init_db()
+
+        # Stock mutations go through one writer thread instead of competing for the lock
+        self.writer = None
+        if single_writer:
+            self.writer = WriteQueue(db_name)
+            self.writer.start()
+
+        if shard_dir and not read_only:
+            self._open_shards()
+            # Catch up on shard writes whose fold did not run (a crash between the two commits)
+            for warehouse_id in self.shards:
+                self._fold_shard(warehouse_id)
+
+    def close(self):
+        if self.writer:
+            self.writer.stop()
+            self.writer = None
+        for writer in self.shard_writers.values():
+            writer.stop()
+        for reader in self.shard_readers.values():
+            reader.close()
+        self.shard_writers = {}
+        self.shard_readers = {}
+        if self.stock_matrix:
+            self.stock_matrix.stop()
+
+    def enable_stock_matrix(self, check_interval=300, sync_interval=1):
+        # Serve breakdowns, availability and inventory value from an in-memory matrix
+        # (stock_matrix.StockMatrix), kept current by the stock writes below
+        from stock_matrix import StockMatrix
+        matrix = StockMatrix(self, check_interval=check_interval, sync_interval=sync_interval)
+        matrix.load()
+        self.stock_matrix = matrix
+        return matrix
+
+    def _sync_stock_matrix(self):
+        if self.stock_matrix:
+            self.stock_matrix.sync()
 
-    def _get_connection(self):
-        conn = sqlite3.connect(DB_NAME, check_same_thread=False)
+    def _get_connection(self, lock=None):
+        # Sharded, the shards are attached as well: writable when in lock (every shard when
+        # lock is None), read-only otherwise
+        if self.read_only:
+            conn = sqlite3.connect(f"file:{self.db_name}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_name, uri=True, check_same_thread=False)
         conn.row_factory = sqlite3.Row
+        if self.shard_dir:
+            self._attach_shards(conn, lock)
         return conn
 
+    def _fetch_dicts(self, cursor):
+        # Zip plain tuples with the column names once: cheaper than sqlite3.Row + dict(row)
+        # for the large lists the API returns (needs a connection with row_factory = None)
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def _write(self, fn, *args):
+        # Run fn(cursor, *args) in a write transaction: queued to the single writer
+        # when enabled, otherwise on a private connection. Exceptions roll back.
+        self.write_count += 1
+        if self.writer:
+            return self.writer.submit(fn, *args).result()
+
+        conn = self._get_connection()
+        try:
+            result = fn(conn.cursor(), *args)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
     def _init_db(self):
         conn = self._get_connection()
         cursor = conn.cursor()
+
+        # Lets retention reclaim space with incremental_vacuum (only applies to a new
+        # database file, existing ones are converted once by retention.py)
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+        # WAL lets the executor's reader threads run alongside a writer
+        cursor.execute("PRAGMA journal_mode = WAL")
         
         # Products (Classes)
         cursor.execute('''
@@ -69,10 +180,39 @@ class Database:
                 scan_time DATETIME DEFAULT CURRENT_TIMESTAMP,
                 notes TEXT,
                 status TEXT DEFAULT 'In Stock',
+                lot_id INTEGER,
+                FOREIGN KEY(product_id) REFERENCES products(id),
+                FOREIGN KEY(warehouse_id) REFERENCES warehouses(id),
+                FOREIGN KEY(lot_id) REFERENCES item_lots(id)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_instances_status_time ON item_instances(status, scan_time)")
+        cursor.execute("PRAGMA table_info(item_instances)")
+        if 'lot_id' not in [col['name'] for col in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE item_instances ADD COLUMN lot_id INTEGER")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_instances_lot ON item_instances(lot_id)")
+
+        # Item Lots (one row per received batch; item_instances only keeps units whose state diverged)
+        cursor.execute("SELECT name FROM sqlite_master WHERE name = 'item_lots'")
+        item_lots_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS item_lots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                product_id INTEGER NOT NULL,
+                warehouse_id INTEGER DEFAULT 1,
+                barcode TEXT NOT NULL,
+                received_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                notes TEXT,
+                quantity INTEGER NOT NULL,
+                picked_quantity INTEGER DEFAULT 0,
                 FOREIGN KEY(product_id) REFERENCES products(id),
                 FOREIGN KEY(warehouse_id) REFERENCES warehouses(id)
             )
         ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_lots_barcode ON item_lots(barcode, warehouse_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_lots_product ON item_lots(product_id, received_at)")
+        if not item_lots_exists:
+            self._compact_instances_to_lots(cursor)
 
         # Scans table (History log)
         cursor.execute('''
@@ -83,6 +223,18 @@ class Database:
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_scans_timestamp ON scans(timestamp)")
+
+        # Scan Daily Roll-up (old scans aggregated per barcode by retention.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_daily (
+                day DATE NOT NULL,
+                barcode TEXT NOT NULL,
+                scan_count INTEGER DEFAULT 0,
+                quantity INTEGER DEFAULT 0,
+                PRIMARY KEY (day, barcode)
+            )
+        ''')
         
         # Orders Table
         cursor.execute('''
@@ -96,6 +248,47 @@ class Database:
             )
         ''')
 
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_timestamp ON orders(timestamp, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_status_timestamp ON orders(status, timestamp, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_business_timestamp ON orders(business_name, timestamp, id)")
+
+        # Order Counts (per status, trigger-maintained so list totals don't scan orders)
+        cursor.execute("SELECT name FROM sqlite_master WHERE name = 'order_counts'")
+        order_counts_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS order_counts (
+                status TEXT PRIMARY KEY,
+                count INTEGER DEFAULT 0
+            )
+        ''')
+        if not order_counts_exists:
+            cursor.execute("INSERT INTO order_counts (status, count) SELECT status, COUNT(*) FROM orders GROUP BY status")
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_order_counts_insert
+            AFTER INSERT ON orders
+            BEGIN
+                INSERT INTO order_counts (status, count) VALUES (NEW.status, 1)
+                ON CONFLICT(status) DO UPDATE SET count = count + 1;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_order_counts_update
+            AFTER UPDATE OF status ON orders
+            WHEN OLD.status IS NOT NEW.status
+            BEGIN
+                UPDATE order_counts SET count = count - 1 WHERE status = OLD.status;
+                INSERT INTO order_counts (status, count) VALUES (NEW.status, 1)
+                ON CONFLICT(status) DO UPDATE SET count = count + 1;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_order_counts_delete
+            AFTER DELETE ON orders
+            BEGIN
+                UPDATE order_counts SET count = count - 1 WHERE status = OLD.status;
+            END
+        ''')
+
         # Order Items Table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS order_items (
@@ -107,6 +300,7 @@ class Database:
                 FOREIGN KEY(product_id) REFERENCES products(id)
             )
         ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id)")
         
         # Order Item Allocations (Which warehouse provides what)
         # Added picked_quantity
@@ -123,6 +317,276 @@ class Database:
                 FOREIGN KEY(warehouse_id) REFERENCES warehouses(id)
             )
         ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_allocations_order ON order_item_allocations(order_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_allocations_warehouse ON order_item_allocations(warehouse_id)")
+
+        # Waves (batch picking across orders) and the allocations each wave covers
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS waves (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                warehouse_id INTEGER NOT NULL,
+                worker_name TEXT,
+                status TEXT DEFAULT 'OPEN',
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                completed_at DATETIME,
+                FOREIGN KEY(warehouse_id) REFERENCES warehouses(id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS wave_allocations (
+                wave_id INTEGER NOT NULL,
+                allocation_id INTEGER NOT NULL,
+                PRIMARY KEY (wave_id, allocation_id),
+                FOREIGN KEY(wave_id) REFERENCES waves(id),
+                FOREIGN KEY(allocation_id) REFERENCES order_item_allocations(id)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_wave_allocations_allocation ON wave_allocations(allocation_id)")
+
+        # Hourly and daily rollups for time-series analytics, maintained by triggers as rows arrive
+        cursor.execute("SELECT name FROM sqlite_master WHERE name = 'sales_hourly'")
+        rollups_exist = cursor.fetchone() is not None
+        for resolution in ('hourly', 'daily'):
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS sales_{resolution} (
+                    period TEXT NOT NULL,
+                    product_id INTEGER NOT NULL,
+                    warehouse_id INTEGER NOT NULL,
+                    units INTEGER DEFAULT 0,
+                    revenue REAL DEFAULT 0,
+                    PRIMARY KEY (period, product_id, warehouse_id)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS stock_in_{resolution} (
+                    period TEXT NOT NULL,
+                    product_id INTEGER NOT NULL,
+                    warehouse_id INTEGER NOT NULL,
+                    units INTEGER DEFAULT 0,
+                    PRIMARY KEY (period, product_id, warehouse_id)
+                ) WITHOUT ROWID
+            ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_sales_rollups
+            AFTER INSERT ON order_item_allocations
+            BEGIN
+                INSERT INTO sales_hourly (period, product_id, warehouse_id, units, revenue)
+                SELECT strftime('%Y-%m-%d %H:00:00', o.timestamp), NEW.product_id, NEW.warehouse_id,
+                       NEW.quantity, NEW.quantity * COALESCE(p.price, 0)
+                FROM orders o LEFT JOIN products p ON p.id = NEW.product_id
+                WHERE o.id = NEW.order_id
+                ON CONFLICT(period, product_id, warehouse_id) DO UPDATE SET
+                    units = units + excluded.units, revenue = revenue + excluded.revenue;
+                INSERT INTO sales_daily (period, product_id, warehouse_id, units, revenue)
+                SELECT date(o.timestamp), NEW.product_id, NEW.warehouse_id,
+                       NEW.quantity, NEW.quantity * COALESCE(p.price, 0)
+                FROM orders o LEFT JOIN products p ON p.id = NEW.product_id
+                WHERE o.id = NEW.order_id
+                ON CONFLICT(period, product_id, warehouse_id) DO UPDATE SET
+                    units = units + excluded.units, revenue = revenue + excluded.revenue;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stock_in_rollups
+            AFTER INSERT ON item_lots
+            BEGIN
+                INSERT INTO stock_in_hourly (period, product_id, warehouse_id, units)
+                VALUES (strftime('%Y-%m-%d %H:00:00', NEW.received_at), NEW.product_id, NEW.warehouse_id, NEW.quantity)
+                ON CONFLICT(period, product_id, warehouse_id) DO UPDATE SET units = units + excluded.units;
+                INSERT INTO stock_in_daily (period, product_id, warehouse_id, units)
+                VALUES (date(NEW.received_at), NEW.product_id, NEW.warehouse_id, NEW.quantity)
+                ON CONFLICT(period, product_id, warehouse_id) DO UPDATE SET units = units + excluded.units;
+            END
+        ''')
+        if not rollups_exist:
+            cursor.execute('''
+                INSERT INTO sales_hourly (period, product_id, warehouse_id, units, revenue)
+                SELECT strftime('%Y-%m-%d %H:00:00', o.timestamp), a.product_id, a.warehouse_id,
+                       SUM(a.quantity), SUM(a.quantity * COALESCE(p.price, 0))
+                FROM order_item_allocations a
+                JOIN orders o ON o.id = a.order_id
+                LEFT JOIN products p ON p.id = a.product_id
+                GROUP BY 1, 2, 3
+            ''')
+            cursor.execute('''
+                INSERT INTO stock_in_hourly (period, product_id, warehouse_id, units)
+                SELECT strftime('%Y-%m-%d %H:00:00', received_at), product_id, warehouse_id, SUM(quantity)
+                FROM item_lots
+                GROUP BY 1, 2, 3
+            ''')
+            cursor.execute('''
+                INSERT INTO sales_daily (period, product_id, warehouse_id, units, revenue)
+                SELECT date(period), product_id, warehouse_id, SUM(units), SUM(revenue)
+                FROM sales_hourly GROUP BY 1, 2, 3
+            ''')
+            cursor.execute('''
+                INSERT INTO stock_in_daily (period, product_id, warehouse_id, units)
+                SELECT date(period), product_id, warehouse_id, SUM(units)
+                FROM stock_in_hourly GROUP BY 1, 2, 3
+            ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sales_daily_product ON sales_daily(product_id, warehouse_id, period)")
+
+        # Rollup version: bumped by triggers whenever a rollup row or a series name changes (cache key for charts)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO rollup_version (id, version) VALUES (1, 0)")
+        version_events = [(f"{table}_{resolution}", event)
+                          for table in ('sales', 'stock_in') for resolution in ('hourly', 'daily')
+                          for event in ('INSERT', 'UPDATE', 'DELETE')]
+        version_events += [('products', 'UPDATE OF name, category'), ('products', 'DELETE'),
+                           ('warehouses', 'UPDATE OF name'), ('warehouses', 'DELETE')]
+        for table, event in version_events:
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_rollup_version_{table}_{event.split()[0].lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE rollup_version SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+
+        # Replenishment forecast per product and warehouse (written by forecast.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS replenishment (
+                product_id INTEGER NOT NULL,
+                warehouse_id INTEGER NOT NULL,
+                stock INTEGER DEFAULT 0,
+                daily_demand REAL DEFAULT 0,
+                demand_std REAL DEFAULT 0,
+                reorder_point INTEGER DEFAULT 0,
+                suggested_quantity INTEGER DEFAULT 0,
+                days_until_stockout REAL,
+                computed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (product_id, warehouse_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_replenishment_stockout ON replenishment(days_until_stockout)")
+        # Stock rows changed since the last forecast pass (append-only, consumed up to an id)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS replenishment_dirty (
+                id INTEGER PRIMARY KEY,
+                product_id INTEGER NOT NULL,
+                warehouse_id INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_replenishment_dirty_insert
+            AFTER INSERT ON warehouse_stock
+            BEGIN
+                INSERT INTO replenishment_dirty (product_id, warehouse_id) VALUES (NEW.product_id, NEW.warehouse_id);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_replenishment_dirty_update
+            AFTER UPDATE OF quantity ON warehouse_stock
+            BEGIN
+                INSERT INTO replenishment_dirty (product_id, warehouse_id) VALUES (NEW.product_id, NEW.warehouse_id);
+            END
+        ''')
+
+        # Stock movement ledger: every change to warehouse_stock, appended by triggers
+        cursor.execute("SELECT name FROM sqlite_master WHERE name = 'stock_movements'")
+        ledger_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_movements (
+                id INTEGER PRIMARY KEY,
+                product_id INTEGER NOT NULL,
+                warehouse_id INTEGER NOT NULL,
+                delta INTEGER NOT NULL,
+                at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_movements_at ON stock_movements(at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_movements_warehouse ON stock_movements(warehouse_id, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_movements_product ON stock_movements(product_id, id)")
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_movements_insert
+            AFTER INSERT ON warehouse_stock
+            WHEN NEW.quantity != 0
+            BEGIN
+                INSERT INTO stock_movements (product_id, warehouse_id, delta)
+                VALUES (NEW.product_id, NEW.warehouse_id, NEW.quantity);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_movements_update
+            AFTER UPDATE OF quantity ON warehouse_stock
+            WHEN NEW.quantity != OLD.quantity
+            BEGIN
+                INSERT INTO stock_movements (product_id, warehouse_id, delta)
+                VALUES (NEW.product_id, NEW.warehouse_id, NEW.quantity - OLD.quantity);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_movements_delete
+            AFTER DELETE ON warehouse_stock
+            WHEN OLD.quantity != 0
+            BEGIN
+                INSERT INTO stock_movements (product_id, warehouse_id, delta)
+                VALUES (OLD.product_id, OLD.warehouse_id, -OLD.quantity);
+            END
+        ''')
+        # Periodic copies of warehouse_stock, each as of a ledger position (movement_id)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                movement_id INTEGER NOT NULL,
+                taken_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_snapshots_movement ON stock_snapshots(movement_id)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_snapshot_rows (
+                snapshot_id INTEGER NOT NULL,
+                warehouse_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                PRIMARY KEY (snapshot_id, warehouse_id, product_id)
+            ) WITHOUT ROWID
+        ''')
+        if not ledger_exists:
+            # History starts here: baseline snapshot of the current stock
+            self._take_stock_snapshot(cursor)
+
+        # Warehouse shards (see Warehouse Shards): how far each shard's ledger, lots and allocations
+        # are folded into this file; the row is written when the shard is created
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS shard_folds (
+                warehouse_id INTEGER PRIMARY KEY,
+                movement_id INTEGER NOT NULL,
+                lot_id INTEGER NOT NULL,
+                allocation_id INTEGER NOT NULL
+            )
+        ''')
+
+        # Low-stock thresholds (warehouse_id 0 applies to every warehouse of the product)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_thresholds (
+                product_id INTEGER NOT NULL,
+                warehouse_id INTEGER NOT NULL DEFAULT 0,
+                threshold INTEGER NOT NULL,
+                PRIMARY KEY (product_id, warehouse_id)
+            ) WITHOUT ROWID
+        ''')
+        # Threshold crossings; an alert stays open until stock is back above the threshold
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                product_id INTEGER NOT NULL,
+                warehouse_id INTEGER NOT NULL,
+                quantity INTEGER,
+                threshold INTEGER,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                resolved_at DATETIME
+            )
+        ''')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_stock_alerts_open
+            ON stock_alerts(product_id, warehouse_id) WHERE resolved_at IS NULL
+        ''')
 
         # Workers Table
         cursor.execute('''
@@ -133,18 +597,476 @@ class Database:
                 last_active DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        
+
+        # Background jobs (see jobs.JobRunner); params and result are JSON
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                params TEXT,
+                progress REAL DEFAULT 0,
+                message TEXT,
+                result TEXT,
+                cancel_requested INTEGER DEFAULT 0,
+                owner_pid INTEGER,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                started_at DATETIME,
+                finished_at DATETIME
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_active ON jobs(status) WHERE status IN ('queued', 'running')")
+
+        # Product Search Index (FTS5 over products, kept in sync by triggers)
+        cursor.execute("SELECT name FROM sqlite_master WHERE name = 'products_fts'")
+        fts_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                name, description, category,
+                content='products', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        ''')
+        if not fts_exists:
+            cursor.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_products_fts_insert
+            AFTER INSERT ON products
+            BEGIN
+                INSERT INTO products_fts (rowid, name, description, category)
+                VALUES (NEW.id, NEW.name, NEW.description, NEW.category);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_products_fts_delete
+            AFTER DELETE ON products
+            BEGIN
+                INSERT INTO products_fts (products_fts, rowid, name, description, category)
+                VALUES ('delete', OLD.id, OLD.name, OLD.description, OLD.category);
+            END
+        ''')
+        # Only text columns: stock changes rewrite products.quantity and must not touch the index
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_products_fts_update
+            AFTER UPDATE OF name, description, category ON products
+            BEGIN
+                INSERT INTO products_fts (products_fts, rowid, name, description, category)
+                VALUES ('delete', OLD.id, OLD.name, OLD.description, OLD.category);
+                INSERT INTO products_fts (rowid, name, description, category)
+                VALUES (NEW.id, NEW.name, NEW.description, NEW.category);
+            END
+        ''')
+
+        # Stock Totals Triggers
+        # products.quantity is derived from warehouse_stock and never written directly
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_stock_insert'")
+        if not cursor.fetchone():
+            # First run with triggers: fold any legacy drift into warehouse_stock
+            # before totals become trigger-maintained
+            self._migrate_legacy_totals(cursor)
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stock_insert
+            AFTER INSERT ON warehouse_stock
+            BEGIN
+                UPDATE products SET quantity = quantity + NEW.quantity WHERE id = NEW.product_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stock_update
+            AFTER UPDATE OF quantity ON warehouse_stock
+            BEGIN
+                UPDATE products SET quantity = quantity + NEW.quantity - OLD.quantity WHERE id = NEW.product_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stock_delete
+            AFTER DELETE ON warehouse_stock
+            BEGIN
+                UPDATE products SET quantity = quantity - OLD.quantity WHERE id = OLD.product_id;
+            END
+        ''')
+
         conn.commit()
         conn.close()
 
-    def get_warehouses(self):
+    def _migrate_legacy_totals(self, cursor):
+        # Trust products.quantity: any difference to the warehouse breakdown goes to Warehouse 1
+        cursor.execute('''
+            SELECT p.id, p.quantity - COALESCE(SUM(ws.quantity), 0) as diff
+            FROM products p
+            LEFT JOIN warehouse_stock ws ON ws.product_id = p.id
+            GROUP BY p.id
+            HAVING diff != 0
+        ''')
+        for row in cursor.fetchall():
+            cursor.execute('''
+                INSERT INTO warehouse_stock (product_id, warehouse_id, quantity)
+                VALUES (?, ?, ?)
+                ON CONFLICT(product_id, warehouse_id)
+                DO UPDATE SET quantity = quantity + ?
+            ''', (row['id'], 1, row['diff'], row['diff']))
+
+    def _compact_instances_to_lots(self, cursor):
+        # One-time migration: fold per-unit rows into lots keyed by receipt
+        # (product, warehouse, barcode, scan time). Units that are no longer
+        # 'In Stock' stay behind as unit rows pointing at their lot.
+        cursor.execute("SELECT COUNT(*) FROM item_instances WHERE lot_id IS NULL")
+        if cursor.fetchone()[0] == 0:
+            return
+        print("Compacting item_instances into lots...")
+        cursor.execute('''
+            INSERT INTO item_lots (product_id, warehouse_id, barcode, received_at, notes, quantity, picked_quantity)
+            SELECT product_id, COALESCE(warehouse_id, 1), barcode, scan_time,
+                   MAX(CASE WHEN status = 'In Stock' THEN notes END),
+                   COUNT(*), SUM(status != 'In Stock')
+            FROM item_instances
+            WHERE lot_id IS NULL
+            GROUP BY product_id, COALESCE(warehouse_id, 1), barcode, scan_time
+        ''')
+        cursor.execute('''
+            UPDATE item_instances SET lot_id = l.id
+            FROM item_lots l
+            WHERE item_instances.lot_id IS NULL
+              AND l.product_id = item_instances.product_id
+              AND l.warehouse_id = COALESCE(item_instances.warehouse_id, 1)
+              AND l.barcode = item_instances.barcode
+              AND l.received_at IS item_instances.scan_time
+        ''')
+        cursor.execute("DELETE FROM item_instances WHERE status = 'In Stock'")
+
+    def check_stock_totals(self):
+        # Products whose total differs from the sum of their warehouse rows (should always be empty)
         conn = self._get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM warehouses")
+        cursor.execute('''
+            SELECT p.id as product_id, p.quantity, COALESCE(SUM(ws.quantity), 0) as warehouse_total
+            FROM products p
+            LEFT JOIN main.warehouse_stock ws ON ws.product_id = p.id
+            GROUP BY p.id
+            HAVING p.quantity != warehouse_total
+        ''')
         rows = cursor.fetchall()
         conn.close()
         return [dict(row) for row in rows]
 
+    def get_warehouses(self):
+        conn = self._get_connection()
+        conn.row_factory = None
+        rows = self._get_warehouses(conn.cursor())
+        conn.close()
+        return rows
+
+    def _get_warehouses(self, cursor):
+        cursor.execute("SELECT * FROM warehouses")
+        return self._fetch_dicts(cursor)
+
+    # --- Warehouse Shards ---
+    # With shard_dir set, each warehouse's rows of SHARDED_TABLES live in their own file,
+    # shard_dir/warehouse_<id>.db, so stock writes in different warehouses take different write
+    # locks. Scans logged without a warehouse (log_scan) stay in the core file.
+    # - Connections ATTACH the shards as shard_<id> and shadow each sharded table with a TEMP
+    #   view over the shards (and the core rows), so reads are unchanged. Writes name the owning
+    #   shard's table (_sharded).
+    # - Receipts and manual changes (_write_stock) run on the warehouse's file alone. Writes that
+    #   also change core rows (orders, picks, waves, cycle counts) hold the core file and the
+    #   shards they write (_write_across). SQLite commits such a transaction atomically per file
+    #   only: a crash during its commit can keep one file's part without the other's.
+    # - Each shard keeps its own stock ledger. Folding replays it into the core warehouse_stock,
+    #   a mirror of the shards' stock, so the core triggers keep products.quantity, the ledger
+    #   and the forecast dirty list as before, and adds new lots and allocations to the rollups.
+    #   Every write folds its shards before it returns.
+    # - AUTOINCREMENT ids start at warehouse_id << 40 in each shard: unique across files, but
+    #   increasing only within a warehouse.
+    # - A connection attaches at most 10 databases (SQLITE_LIMIT_ATTACHED), retention's archive
+    #   included, so at most nine warehouses can be sharded.
+    def _shard_path(self, warehouse_id):
+        return os.path.join(self.shard_dir, f"warehouse_{warehouse_id}.db")
+
+    def _sharded(self, table, warehouse_id):
+        # Qualified name of a sharded table for writing one warehouse's rows
+        if not self.shard_dir:
+            return f"main.{table}"
+        if warehouse_id not in self.shards:
+            raise ValueError(f"Unknown warehouse {warehouse_id}")
+        return f"shard_{warehouse_id}.{table}"
+
+    def _open_shards(self, warehouse_ids=None):
+        # Open the shards of warehouse_ids (every warehouse when None), creating missing ones;
+        # ids that are not warehouses are skipped
+        if warehouse_ids is not None and all(wid in self.shards for wid in warehouse_ids):
+            return
+        conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        try:
+            existing = [row[0] for row in conn.execute("SELECT id FROM warehouses ORDER BY id")]
+            created = {row[0] for row in conn.execute("SELECT warehouse_id FROM shard_folds")}
+        finally:
+            conn.close()
+        for warehouse_id in existing:
+            if warehouse_ids is None or warehouse_id in warehouse_ids:
+                self._open_shard(warehouse_id, warehouse_id in created)
+
+    def _open_shard(self, warehouse_id, created):
+        with self.shard_lock:
+            if warehouse_id in self.shards:
+                return
+            path = self._shard_path(warehouse_id)
+            if not created:
+                self._create_shard(warehouse_id, path)
+            elif not os.path.exists(path):
+                raise RuntimeError(f"Shard of warehouse {warehouse_id} is missing: {path}")
+            # Replaced rather than updated: connections read it without the lock
+            self.shards = {**self.shards, warehouse_id: path}
+
+    def _find_shards(self):
+        # Read-only: whatever shard files shard_dir holds (a report snapshot's copies)
+        shards = {}
+        if os.path.isdir(self.shard_dir):
+            for name in os.listdir(self.shard_dir):
+                match = re.fullmatch(r'warehouse_(\d+)\.db', name)
+                if match:
+                    shards[int(match.group(1))] = os.path.join(self.shard_dir, name)
+        self.shards = shards
+
+    def _create_shard(self, warehouse_id, path):
+        # The core schema of the sharded tables and the stock ledger (with the ledger triggers
+        # only), then, in the same transaction, the warehouse's rows: lots, units and allocations
+        # move over, stock rows are copied (the core ones become the mirror). Scans logged so far
+        # name no warehouse and stay in the core file.
+        os.makedirs(self.shard_dir, exist_ok=True)
+        conn = sqlite3.connect(path, isolation_level=None)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute("ATTACH DATABASE ? AS core", (self.db_name,))
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT 1 FROM core.shard_folds WHERE warehouse_id = ?", (warehouse_id,))
+            if cursor.fetchone():
+                # Created meanwhile by another process
+                cursor.execute("ROLLBACK")
+                return
+
+            tables = SHARDED_TABLES + ('stock_movements',)
+            cursor.execute(f'''
+                SELECT sql FROM core.sqlite_master
+                WHERE tbl_name IN ({','.join('?' * len(tables))}) AND sql IS NOT NULL
+                  AND (type IN ('table', 'index') OR name LIKE 'trg_movements_%')
+                  AND name NOT IN (SELECT name FROM main.sqlite_master)
+                ORDER BY type != 'table'
+            ''', tables)
+            for (sql,) in cursor.fetchall():
+                cursor.execute(sql)
+            cursor.executemany('''
+                INSERT INTO main.sqlite_sequence (name, seq)
+                SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM main.sqlite_sequence WHERE name = ?)
+            ''', [(table, warehouse_id << 40, table)
+                  for table in ('item_lots', 'item_instances', 'scans', 'order_item_allocations')])
+
+            cursor.execute('''
+                INSERT OR IGNORE INTO main.warehouse_stock SELECT * FROM core.warehouse_stock WHERE warehouse_id = ?
+            ''', (warehouse_id,))
+            for table, column in (('item_lots', 'warehouse_id'), ('item_instances', 'COALESCE(warehouse_id, 1)'),
+                                  ('order_item_allocations', 'warehouse_id')):
+                cursor.execute(f"INSERT OR IGNORE INTO main.{table} SELECT * FROM core.{table} WHERE {column} = ?",
+                               (warehouse_id,))
+                cursor.execute(f"DELETE FROM core.{table} WHERE {column} = ?", (warehouse_id,))
+            cursor.execute('''
+                INSERT INTO core.shard_folds (warehouse_id, movement_id, lot_id, allocation_id)
+                SELECT ?, (SELECT COALESCE(MAX(id), 0) FROM main.stock_movements),
+                       (SELECT COALESCE(MAX(id), 0) FROM main.item_lots),
+                       (SELECT COALESCE(MAX(id), 0) FROM main.order_item_allocations)
+            ''', (warehouse_id,))
+            cursor.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _attach_shards(self, conn, lock):
+        if self.read_only:
+            self._find_shards()
+        shards = sorted(self.shards.items())
+        if not shards:
+            return
+        for warehouse_id, path in shards:
+            writable = not self.read_only and (lock is None or warehouse_id in lock)
+            conn.execute(f"ATTACH DATABASE ? AS shard_{warehouse_id}",
+                         (path if writable else f"file:{path}?mode=ro",))
+        for table in SHARDED_TABLES:
+            # The core warehouse_stock rows are the shards' mirror, not stock of their own
+            schemas = [f"shard_{warehouse_id}" for warehouse_id, _ in shards]
+            if table != 'warehouse_stock':
+                schemas.insert(0, 'main')
+            conn.execute(f"CREATE TEMP VIEW {table} AS " +
+                         " UNION ALL ".join(f"SELECT * FROM {schema}.{table}" for schema in schemas))
+
+    def _write_stock(self, warehouse_id, fn, *args):
+        # Run fn(cursor, *args), a stock change in one warehouse returning (result, [(product_id,
+        # warehouse_id)] stock rows changed), and return (result, newly opened low-stock alerts).
+        # Sharded, fn runs on the warehouse's own file (through its own single writer when
+        # enabled) and the fold that follows passes any alerts to the handlers itself.
+        if not self.shard_dir:
+            return self._write(self._checked_stock_write, fn, *args)
+        self._open_shards([warehouse_id])
+        path = self.shards.get(warehouse_id)
+        if path is None:
+            raise ValueError(f"Unknown warehouse {warehouse_id}")
+
+        if self.writer:
+            with self.shard_lock:
+                writer = self.shard_writers.get(warehouse_id)
+                if writer is None:
+                    writer = self.shard_writers[warehouse_id] = WriteQueue(path)
+                    writer.start()
+            result, _ = writer.submit(fn, *args).result()
+        else:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            try:
+                result, _ = fn(conn.cursor(), *args)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        self._fold_shard(warehouse_id)
+        return result, []
+
+    def _checked_stock_write(self, cursor, fn, *args):
+        # A receipt or correction can open or clear a low-stock alert
+        result, pairs = fn(cursor, *args)
+        return result, self._check_low_stock(cursor, pairs)
+
+    def _write_across(self, warehouse_ids, fn, *args):
+        # Run fn(cursor, *args), which writes core rows and the stock of warehouse_ids (of any
+        # warehouse when None), in one write transaction. Sharded, it holds the core file and
+        # those shards, and folds them first (so core totals are exact for fn) and after fn.
+        if not self.shard_dir:
+            return self._write(fn, *args)
+        self._open_shards(warehouse_ids)
+        folded = sorted(self.shards) if warehouse_ids is None else [w for w in warehouse_ids if w in self.shards]
+        self.write_count += 1
+        conn = self._get_connection(lock=warehouse_ids)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            alerts = self._fold_locked(cursor, folded)
+            result = fn(cursor, *args)
+            alerts += self._fold_locked(cursor, folded)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        self._notify_low_stock(alerts)
+        return result
+
+    def _fold_locked(self, cursor, warehouse_ids):
+        # Fold the shards (attached as shard_<id>) in a transaction that holds the core file
+        alerts = []
+        for warehouse_id in warehouse_ids:
+            alerts += self._fold_from(cursor, warehouse_id, cursor, f"shard_{warehouse_id}")
+        return alerts
+
+    def _fold_shard(self, warehouse_id):
+        # Fold a shard into the core file after a write that held only the shard, and pass on the
+        # alerts this opens. A fold takes everything past the last one, so a failure is logged and
+        # left to the warehouse's next write (or the next start)
+        try:
+            alerts = self._write(self._fold, warehouse_id)
+        except Exception as e:
+            print(f"Error folding warehouse {warehouse_id}: {e}")
+            return
+        self._notify_low_stock(alerts)
+
+    def _fold(self, cursor, warehouse_id):
+        # In a core write transaction (the single writer's, if enabled), reading the shard on a
+        # connection of its own that stays open between folds. The no-op write comes first: a
+        # deferred transaction that had read the positions could not upgrade after another fold
+        cursor.execute("UPDATE main.shard_folds SET warehouse_id = warehouse_id WHERE warehouse_id = ?",
+                       (warehouse_id,))
+        with self.fold_lock:
+            reader = self.shard_readers.get(warehouse_id)
+            if reader is None:
+                reader = sqlite3.connect(self.shards[warehouse_id], check_same_thread=False)
+                self.shard_readers[warehouse_id] = reader
+            reader.execute("BEGIN")
+            try:
+                return self._fold_from(cursor, warehouse_id, reader.cursor(), 'main')
+            finally:
+                reader.commit()
+
+    def _fold_from(self, cursor, warehouse_id, shard_cursor, shard):
+        # Fold what schema `shard` of shard_cursor holds past the core file's fold positions;
+        # returns the newly opened alerts
+        cursor.execute("SELECT movement_id, lot_id, allocation_id FROM main.shard_folds WHERE warehouse_id = ?",
+                       (warehouse_id,))
+        positions = tuple(cursor.fetchone())
+        shard_cursor.execute(f"SELECT id, product_id, delta FROM {shard}.stock_movements WHERE id > ? ORDER BY id",
+                             (positions[0],))
+        movements = [tuple(row) for row in shard_cursor.fetchall()]
+        shard_cursor.execute(f'''
+            SELECT id, product_id, received_at, quantity FROM {shard}.item_lots WHERE id > ? ORDER BY id
+        ''', (positions[1],))
+        lots = [tuple(row) for row in shard_cursor.fetchall()]
+        shard_cursor.execute(f'''
+            SELECT id, order_id, product_id, quantity FROM {shard}.order_item_allocations WHERE id > ? ORDER BY id
+        ''', (positions[2],))
+        allocations = [tuple(row) for row in shard_cursor.fetchall()]
+        if not (movements or lots or allocations):
+            return []
+
+        latest = tuple(rows[-1][0] if rows else position
+                       for rows, position in zip((movements, lots, allocations), positions))
+        cursor.execute('''
+            UPDATE main.shard_folds SET movement_id = ?, lot_id = ?, allocation_id = ? WHERE warehouse_id = ?
+        ''', (*latest, warehouse_id))
+
+        # 1. Net change per product into the mirror (totals, ledger and forecast triggers fire)
+        cursor.execute('''
+            INSERT INTO main.warehouse_stock (product_id, warehouse_id, quantity)
+            SELECT m.value ->> 1, ?, SUM(m.value ->> 2) FROM json_each(?) m
+            WHERE true
+            GROUP BY m.value ->> 1
+            HAVING SUM(m.value ->> 2) != 0
+            ON CONFLICT(product_id, warehouse_id) DO UPDATE SET quantity = quantity + excluded.quantity
+        ''', (warehouse_id, json.dumps(movements)))
+
+        # 2. Rollups, as the core insert triggers on item_lots and order_item_allocations do
+        for resolution, period in (('hourly', "strftime('%Y-%m-%d %H:00:00', {})"), ('daily', "date({})")):
+            if lots:
+                cursor.execute(f'''
+                    INSERT INTO stock_in_{resolution} (period, product_id, warehouse_id, units)
+                    SELECT {period.format("l.value ->> 2")}, l.value ->> 1, ?, SUM(l.value ->> 3)
+                    FROM json_each(?) l
+                    WHERE true
+                    GROUP BY 1, 2
+                    ON CONFLICT(period, product_id, warehouse_id) DO UPDATE SET units = units + excluded.units
+                ''', (warehouse_id, json.dumps(lots)))
+            if allocations:
+                cursor.execute(f'''
+                    INSERT INTO sales_{resolution} (period, product_id, warehouse_id, units, revenue)
+                    SELECT {period.format("o.timestamp")}, a.value ->> 2, ?,
+                           SUM(a.value ->> 3), SUM((a.value ->> 3) * COALESCE(p.price, 0))
+                    FROM json_each(?) a
+                    JOIN orders o ON o.id = a.value ->> 1
+                    LEFT JOIN products p ON p.id = a.value ->> 2
+                    WHERE true
+                    GROUP BY 1, 2
+                    ON CONFLICT(period, product_id, warehouse_id) DO UPDATE SET
+                        units = units + excluded.units, revenue = revenue + excluded.revenue
+                ''', (warehouse_id, json.dumps(allocations)))
+
+        # 3. Threshold checks for the stock rows that changed
+        return self._check_low_stock(cursor, [(product_id, warehouse_id) for product_id in {m[1] for m in movements}])
+
     # --- Worker Management ---
     def get_workers(self):
         conn = self._get_connection()
@@ -196,30 +1118,57 @@ class Database:
 
     def get_all_products(self):
         conn = self._get_connection()
+        conn.row_factory = None
         cursor = conn.cursor()
-        
-        # Get basic products
+        if self.stock_matrix:
+            products = self._get_products(cursor, self.stock_matrix.breakdowns())
+        else:
+            products = self._get_products(cursor)
+        conn.close()
+        return products
+
+    def _get_products(self, cursor, stock_map=None):
+        # Newest first, each with its {warehouse_id: quantity} breakdown (read here unless given)
         cursor.execute("SELECT * FROM products ORDER BY id DESC")
-        products = [dict(row) for row in cursor.fetchall()]
-        
-        # Get breakdown
-        cursor.execute("SELECT product_id, warehouse_id, quantity FROM warehouse_stock")
-        stock_rows = cursor.fetchall()
-        
-        # Map breakdown
-        stock_map = {} # pid -> {wid: qty}
-        for row in stock_rows:
-            pid = row['product_id']
-            if pid not in stock_map: stock_map[pid] = {}
-            stock_map[pid][row['warehouse_id']] = row['quantity']
-            
+        products = self._fetch_dicts(cursor)
+
+        if stock_map is None:
+            cursor.execute("SELECT product_id, warehouse_id, quantity FROM warehouse_stock")
+            stock_map = {} # pid -> {wid: qty}
+            for pid, wid, qty in cursor.fetchall():
+                if pid not in stock_map: stock_map[pid] = {}
+                stock_map[pid][wid] = qty
+
         # Attach to products
         for p in products:
             p['stock_breakdown'] = stock_map.get(p['id'], {})
-            
-        conn.close()
         return products
-    
+
+    def search_products(self, query, limit=20):
+        # Every word is a prefix term (AND), ranked by bm25 with name weighted highest
+        terms = ['"' + word.replace('"', '""') + '"*' for word in query.split()]
+        if not terms:
+            return []
+
+        conn = self._get_connection()
+        conn.row_factory = None
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT p.id, p.name, p.category, p.price, p.quantity, p.pack_size, p.image_path
+            FROM (
+                SELECT rowid, bm25(products_fts, 10.0, 1.0, 3.0) as score
+                FROM products_fts
+                WHERE products_fts MATCH ?
+                ORDER BY score
+                LIMIT ?
+            ) f
+            JOIN products p ON p.id = f.rowid
+            ORDER BY f.score
+        ''', (' '.join(terms), limit))
+        rows = self._fetch_dicts(cursor)
+        conn.close()
+        return rows
+
     def get_product_by_id(self, pid):
         conn = self._get_connection()
         cursor = conn.cursor()
@@ -229,182 +1178,614 @@ class Database:
         return dict(row) if row else None
 
     def add_instance(self, product_id, barcode, quantity=1, notes='', warehouse_id=1):
-        conn = self._get_connection()
-        cursor = conn.cursor()
         try:
-            # 1. Create instances
-            for _ in range(quantity):
-                cursor.execute('''
-                    INSERT INTO item_instances (product_id, barcode, notes, warehouse_id)
-                    VALUES (?, ?, ?, ?)
-                ''', (product_id, barcode, notes, warehouse_id))
-            
-            # 2. Update TOTAL stock count
-            cursor.execute("UPDATE products SET quantity = quantity + ? WHERE id = ?", (quantity, product_id))
-            
-            # 3. Update Warehouse Stock
-            # Upsert logic (Insert or Update)
-            cursor.execute('''
-                INSERT INTO warehouse_stock (product_id, warehouse_id, quantity) 
-                VALUES (?, ?, ?)
-                ON CONFLICT(product_id, warehouse_id) 
-                DO UPDATE SET quantity = quantity + ?
-            ''', (product_id, warehouse_id, quantity, quantity))
-
-            # 4. Log the batch scan event
-            cursor.execute("INSERT INTO scans (barcode, quantity) VALUES (?, ?)", (barcode, quantity))
-
-            conn.commit()
-            return True, f"Added {quantity} items"
+            result, alerts = self._write_stock(warehouse_id, self._add_instance,
+                                              product_id, barcode, quantity, notes, warehouse_id)
         except Exception as e:
-            conn.rollback()
             return False, str(e)
-        finally:
-            conn.close()
+        self._sync_stock_matrix()
+        self._notify_low_stock(alerts)
+        return result
+
+    def _add_instance(self, cursor, product_id, barcode, quantity, notes, warehouse_id):
+        # 1. Record the received batch as one lot
+        cursor.execute('''
+            INSERT INTO item_lots (product_id, barcode, notes, warehouse_id, quantity)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (product_id, barcode, notes, warehouse_id, quantity))
+
+        # 2. Update Warehouse Stock (products.quantity follows via trigger)
+        # Upsert logic (Insert or Update)
+        cursor.execute('''
+            INSERT INTO warehouse_stock (product_id, warehouse_id, quantity) 
+            VALUES (?, ?, ?)
+            ON CONFLICT(product_id, warehouse_id) 
+            DO UPDATE SET quantity = quantity + ?
+        ''', (product_id, warehouse_id, quantity, quantity))
+
+        # 3. Log the batch scan event
+        cursor.execute("INSERT INTO scans (barcode, quantity) VALUES (?, ?)", (barcode, quantity))
+        return (True, f"Added {quantity} items"), [(product_id, warehouse_id)]
 
     def get_instances(self, product_id):
+        # Lots (with how many units are still in stock) and individual units that left a lot
         conn = self._get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM item_instances WHERE product_id = ? ORDER BY scan_time DESC", (product_id,))
+        cursor.execute('''
+            SELECT id as lot_id, NULL as instance_id, product_id, warehouse_id, barcode,
+                   received_at as scan_time, notes, quantity, picked_quantity,
+                   CASE WHEN picked_quantity < quantity THEN 'In Stock' ELSE 'Picked' END as status
+            FROM item_lots WHERE product_id = ?
+            UNION ALL
+            SELECT lot_id, id, product_id, warehouse_id, barcode,
+                   scan_time, notes, 1, 0, status
+            FROM item_instances WHERE product_id = ?
+            ORDER BY scan_time DESC
+        ''', (product_id, product_id))
         rows = cursor.fetchall()
         conn.close()
         return [dict(row) for row in rows]
         
     def update_quantity(self, product_id, change, warehouse_id=1):
         # Manual adjustment
-        conn = self._get_connection()
-        cursor = conn.cursor()
         try:
-            # Update Total
-            cursor.execute("UPDATE products SET quantity = quantity + ? WHERE id = ?", (change, product_id))
-            
-            # Update Warehouse
-            cursor.execute('''
-                INSERT INTO warehouse_stock (product_id, warehouse_id, quantity) 
-                VALUES (?, ?, ?)
-                ON CONFLICT(product_id, warehouse_id) 
-                DO UPDATE SET quantity = quantity + ?
-            ''', (product_id, warehouse_id, change, change))
-            
-            conn.commit()
-            return True
+            result, alerts = self._write_stock(warehouse_id, self._update_quantity, product_id, change, warehouse_id)
         except:
             return False
-        finally:
+        self._sync_stock_matrix()
+        self._notify_low_stock(alerts)
+        return result
+
+    def _update_quantity(self, cursor, product_id, change, warehouse_id):
+        # Update Warehouse (products.quantity follows via trigger)
+        cursor.execute('''
+            INSERT INTO warehouse_stock (product_id, warehouse_id, quantity) 
+            VALUES (?, ?, ?)
+            ON CONFLICT(product_id, warehouse_id) 
+            DO UPDATE SET quantity = quantity + ?
+        ''', (product_id, warehouse_id, change, change))
+        return True, [(product_id, warehouse_id)]
+
+    def take_stock_snapshot(self):
+        try:
+            return self._write(self._take_stock_snapshot)
+        except Exception as e:
+            print(f"Error taking stock snapshot: {e}")
+            return None
+
+    def _take_stock_snapshot(self, cursor):
+        # Same transaction as the ledger position, so rows and movement_id agree
+        cursor.execute("INSERT INTO stock_snapshots (movement_id) SELECT COALESCE(MAX(id), 0) FROM stock_movements")
+        snapshot_id = cursor.lastrowid
+        cursor.execute('''
+            INSERT INTO stock_snapshot_rows (snapshot_id, warehouse_id, product_id, quantity)
+            SELECT ?, warehouse_id, product_id, quantity FROM main.warehouse_stock WHERE quantity != 0
+        ''', (snapshot_id,))
+        return snapshot_id
+
+    def get_ledger_status(self):
+        # Movements since the latest snapshot and when it was taken
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT (SELECT COALESCE(MAX(id), 0) FROM stock_movements) - s.movement_id AS pending, s.taken_at
+            FROM stock_snapshots s ORDER BY s.id DESC LIMIT 1
+        ''')
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else {'pending': 0, 'taken_at': None}
+
+    def get_stock_at(self, at, warehouse_id=None, product_id=None):
+        # On-hand stock as of `at` ('YYYY-MM-DD HH:MM:SS', UTC): the nearest snapshot at or
+        # before that ledger position plus the movements after it. None when `at` predates
+        # the first snapshot (history starts there).
+        conn = self._get_connection()
+        conn.row_factory = None
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(taken_at) FROM stock_snapshots")
+        first = cursor.fetchone()[0]
+        if first is None or at < first:
             conn.close()
+            return None
 
-    def log_scan(self, barcode, quantity=1):
-        # Logging raw scan from wedge/serial
+        # Ledger position at `at`: one seek on idx_movements_at (ids grow with time)
+        cursor.execute("SELECT id FROM stock_movements WHERE at <= ? ORDER BY at DESC, id DESC LIMIT 1", (at,))
+        row = cursor.fetchone()
+        movement_id = row[0] if row else 0
+        cursor.execute('''
+            SELECT id, movement_id FROM stock_snapshots
+            WHERE movement_id <= ? ORDER BY movement_id DESC, id DESC LIMIT 1
+        ''', (movement_id,))
+        snapshot_id, snapshot_movement = cursor.fetchone()
+
+        filters, params = '', []
+        if warehouse_id is not None:
+            filters += " AND warehouse_id = ?"
+            params.append(warehouse_id)
+        if product_id is not None:
+            filters += " AND product_id = ?"
+            params.append(product_id)
+        cursor.execute(f'''
+            SELECT warehouse_id, product_id, SUM(quantity) AS quantity FROM (
+                SELECT warehouse_id, product_id, quantity FROM stock_snapshot_rows
+                WHERE snapshot_id = ? {filters}
+                UNION ALL
+                SELECT warehouse_id, product_id, delta FROM stock_movements
+                WHERE id > ? AND id <= ? {filters}
+            )
+            GROUP BY warehouse_id, product_id
+            HAVING SUM(quantity) != 0
+            ORDER BY warehouse_id, product_id
+        ''', [snapshot_id] + params + [snapshot_movement, movement_id] + params)
+        rows = self._fetch_dicts(cursor)
+        conn.close()
+        return rows
+
+    def adjust_stock(self, lines):
+        # Cycle count: lines are {'product_id', 'warehouse_id', and 'counted' (absolute) or
+        # 'change' (delta)}. Applied in one transaction; returns (True, variance report)
+        # or (False, message) with nothing changed.
+        try:
+            warehouse_ids = {line.get('warehouse_id') for line in lines}
+            result, alerts = self._write_across([wid for wid in warehouse_ids if type(wid) is int],
+                                                self._adjust_stock, lines)
+        except Exception as e:
+            return False, str(e)
+        self._sync_stock_matrix()
+        self._notify_low_stock(alerts)
+        return result
+
+    def _adjust_stock(self, cursor, lines):
+        # 1. Validate the whole count before touching stock
+        seen = set()
+        for line in lines:
+            key = (line.get('product_id'), line.get('warehouse_id'))
+            # type() rather than isinstance(): JSON true/false would pass as bool, a subclass of int
+            if not all(type(v) is int for v in key):
+                raise ValueError("Each line needs integer product_id and warehouse_id")
+            if ('counted' in line) == ('change' in line):
+                raise ValueError(f"Line {key}: give either counted or change")
+            value = line.get('counted', line.get('change'))
+            if type(value) is not int or ('counted' in line and value < 0):
+                raise ValueError(f"Line {key}: quantity must be an integer (counted >= 0)")
+            if key in seen:
+                raise ValueError(f"Line {key} appears twice")
+            seen.add(key)
+
+        payload = json.dumps([[l['product_id'], l['warehouse_id'], l.get('counted'), l.get('change')] for l in lines])
+        cursor.execute('''
+            SELECT l.value ->> 0 FROM json_each(?) l
+            WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.id = l.value ->> 0)
+               OR NOT EXISTS (SELECT 1 FROM warehouses w WHERE w.id = l.value ->> 1)
+            LIMIT 1
+        ''', (payload,))
+        unknown = cursor.fetchone()
+        if unknown:
+            raise ValueError(f"Unknown product or warehouse for product {unknown[0]}")
+
+        # 2. Deltas against current stock, set-based
+        cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS stock_adjustment (
+                product_id INTEGER, warehouse_id INTEGER, before INTEGER, delta INTEGER
+            )
+        ''')
+        cursor.execute("DELETE FROM temp.stock_adjustment")
+        cursor.execute('''
+            INSERT INTO temp.stock_adjustment (product_id, warehouse_id, before, delta)
+            SELECT l.value ->> 0, l.value ->> 1, COALESCE(ws.quantity, 0),
+                   COALESCE(l.value ->> 3, (l.value ->> 2) - COALESCE(ws.quantity, 0))
+            FROM json_each(?) l
+            LEFT JOIN warehouse_stock ws ON ws.product_id = l.value ->> 0 AND ws.warehouse_id = l.value ->> 1
+        ''', (payload,))
+
+        # 3. Apply per warehouse (totals, ledger and forecast triggers fire per changed row)
+        cursor.execute("SELECT DISTINCT warehouse_id FROM temp.stock_adjustment WHERE delta != 0")
+        for (warehouse_id,) in cursor.fetchall():
+            cursor.execute(f'''
+                INSERT INTO {self._sharded('warehouse_stock', warehouse_id)} (product_id, warehouse_id, quantity)
+                SELECT product_id, warehouse_id, delta FROM temp.stock_adjustment
+                WHERE delta != 0 AND warehouse_id = ?
+                ON CONFLICT(product_id, warehouse_id) DO UPDATE SET quantity = quantity + excluded.quantity
+            ''', (warehouse_id,))
+
+        # 4. Variance report
+        cursor.execute('''
+            SELECT a.product_id, p.name, a.warehouse_id, a.before, a.before + a.delta AS after, a.delta,
+                   a.delta * COALESCE(p.price, 0) AS value
+            FROM temp.stock_adjustment a
+            JOIN products p ON p.id = a.product_id
+            ORDER BY ABS(a.delta * COALESCE(p.price, 0)) DESC, a.product_id, a.warehouse_id
+        ''')
+        columns = [col[0] for col in cursor.description]
+        variances = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        cursor.execute("DELETE FROM temp.stock_adjustment")
+
+        report = {
+            'lines': len(variances),
+            'changed': sum(1 for v in variances if v['delta']),
+            'units_delta': sum(v['delta'] for v in variances),
+            'value_delta': round(sum(v['value'] for v in variances), 2),
+            'variances': variances,
+        }
+        alerts = self._check_low_stock(cursor, [(v['product_id'], v['warehouse_id']) for v in variances if v['delta']])
+        return (True, report), alerts
+
+    def on_low_stock(self, handler):
+        # handler(alert) is called after the commit of a write that took stock to or below
+        # its threshold, in the thread that made the write
+        self.low_stock_handlers.append(handler)
+
+    def _notify_low_stock(self, alerts):
+        for alert in alerts:
+            for handler in self.low_stock_handlers:
+                try:
+                    handler(alert)
+                except Exception as e:
+                    print(f"Low stock handler error: {e}")
+
+    def _check_low_stock(self, cursor, pairs):
+        # Compare only the (product_id, warehouse_id) stock rows a write touched with their
+        # threshold: the warehouse's own, else the product's (warehouse 0), else the forecast
+        # reorder point. Opens an alert on crossing, resolves it once stock recovers.
+        # Returns the newly opened alerts.
+        cursor.execute('''
+            SELECT ws.product_id, ws.warehouse_id, ws.quantity,
+                   COALESCE(t.threshold, d.threshold, r.reorder_point) AS threshold, a.id AS alert_id
+            FROM warehouse_stock ws
+            LEFT JOIN stock_thresholds t ON t.product_id = ws.product_id AND t.warehouse_id = ws.warehouse_id
+            LEFT JOIN stock_thresholds d ON d.product_id = ws.product_id AND d.warehouse_id = 0
+            LEFT JOIN replenishment r ON r.product_id = ws.product_id AND r.warehouse_id = ws.warehouse_id
+                 AND r.daily_demand > 0
+            LEFT JOIN stock_alerts a ON a.product_id = ws.product_id AND a.warehouse_id = ws.warehouse_id
+                 AND a.resolved_at IS NULL
+            WHERE (ws.product_id, ws.warehouse_id) IN (
+                SELECT value ->> 0, value ->> 1 FROM json_each(?)
+            )
+        ''', (json.dumps(list(set(pairs))),))
+
+        alerts = []
+        for product_id, warehouse_id, quantity, threshold, alert_id in cursor.fetchall():
+            low = threshold is not None and quantity <= threshold
+            if low and alert_id is None:
+                cursor.execute('''
+                    INSERT INTO stock_alerts (product_id, warehouse_id, quantity, threshold)
+                    VALUES (?, ?, ?, ?)
+                ''', (product_id, warehouse_id, quantity, threshold))
+                alerts.append({'id': cursor.lastrowid, 'product_id': product_id, 'warehouse_id': warehouse_id,
+                               'quantity': quantity, 'threshold': threshold})
+            elif not low and alert_id is not None:
+                cursor.execute("UPDATE stock_alerts SET resolved_at = CURRENT_TIMESTAMP WHERE id = ?", (alert_id,))
+        return alerts
+
+    def set_stock_threshold(self, product_id, threshold, warehouse_id=0):
+        # threshold None removes it; warehouse_id 0 sets the product-wide default
+        try:
+            return self._write(self._set_stock_threshold, product_id, threshold, warehouse_id)
+        except Exception as e:
+            print(f"Error setting threshold: {e}")
+            return False
+
+    def _set_stock_threshold(self, cursor, product_id, threshold, warehouse_id):
+        if threshold is None:
+            cursor.execute("DELETE FROM stock_thresholds WHERE product_id = ? AND warehouse_id = ?",
+                           (product_id, warehouse_id))
+        else:
+            cursor.execute('''
+                INSERT INTO stock_thresholds (product_id, warehouse_id, threshold) VALUES (?, ?, ?)
+                ON CONFLICT(product_id, warehouse_id) DO UPDATE SET threshold = excluded.threshold
+            ''', (product_id, warehouse_id, threshold))
+        return True
+
+    def get_stock_thresholds(self, product_id):
         conn = self._get_connection()
         cursor = conn.cursor()
+        cursor.execute("SELECT warehouse_id, threshold FROM stock_thresholds WHERE product_id = ? ORDER BY warehouse_id",
+                       (product_id,))
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+
+    def get_stock_alerts(self, open_only=True, limit=100):
+        # Newest first
+        sql = '''
+            SELECT a.id, a.product_id, p.name, a.warehouse_id, a.quantity, a.threshold,
+                   a.created_at, a.resolved_at
+            FROM stock_alerts a
+            LEFT JOIN products p ON p.id = a.product_id
+        '''
+        if open_only:
+            sql += " WHERE a.resolved_at IS NULL"
+        sql += " ORDER BY a.id DESC LIMIT ?"
+        conn = self._get_connection()
+        conn.row_factory = None
+        cursor = conn.cursor()
+        cursor.execute(sql, (limit,))
+        rows = self._fetch_dicts(cursor)
+        conn.close()
+        return rows
+
+    def log_scan(self, barcode, quantity=1):
+        # Logging raw scan from wedge/serial
         try:
-            cursor.execute("INSERT INTO scans (barcode, quantity) VALUES (?, ?)", (barcode, quantity))
-            conn.commit()
+            self._write(self._log_scan, barcode, quantity)
         except:
             pass
+
+    def _log_scan(self, cursor, barcode, quantity):
+        # No warehouse to shard by: always the core file
+        cursor.execute("INSERT INTO main.scans (barcode, quantity) VALUES (?, ?)", (barcode, quantity))
+
+    def iter_export(self, kind, since=None, since_id=None, batch_size=1000):
+        # Generator for streaming exports: yields the column names first, then
+        # lists of row tuples straight from the cursor. The connection stays open
+        # until the caller has consumed (or closed) the generator.
+        sql, time_column = EXPORTS[kind]
+        id_column = 'oi.id' if kind == 'order_items' else 'id'
+        conditions = []
+        params = []
+        if since_id is not None:
+            conditions.append(f"{id_column} > ?")
+            params.append(since_id)
+        if since is not None and time_column:
+            conditions.append(f"{time_column} > ?")
+            params.append(since)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {id_column} ASC"
+
+        conn = self._get_connection()
+        conn.row_factory = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            yield [col[0] for col in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
         finally:
             conn.close()
 
     def get_scan_history(self, limit=50):
         conn = self._get_connection()
+        conn.row_factory = None
         cursor = conn.cursor()
         cursor.execute('''
             SELECT s.barcode, s.timestamp, p.name, s.quantity as scanned_amount
             FROM scans s
-            LEFT JOIN item_instances i ON s.barcode = i.barcode
-            LEFT JOIN products p ON i.product_id = p.id
+            LEFT JOIN products p ON p.id = (SELECT product_id FROM item_lots l WHERE l.barcode = s.barcode LIMIT 1)
             ORDER BY s.timestamp DESC
             LIMIT ?
         ''', (limit,))
-        rows = cursor.fetchall()
+        rows = self._fetch_dicts(cursor)
         conn.close()
-        return [dict(row) for row in rows]
+        return rows
+
+    def _order_filters(self, status=None, business_name=None, date_from=None, date_to=None):
+        conditions = []
+        params = []
+        if status:
+            conditions.append("o.status = ?")
+            params.append(status)
+        if business_name:
+            # Prefix range instead of LIKE so the business_name index is usable
+            conditions.append("o.business_name >= ? AND o.business_name < ?")
+            params.extend([business_name, business_name + '\uffff'])
+        if date_from:
+            conditions.append("o.timestamp >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("o.timestamp < ?")
+            params.append(date_to)
+        return conditions, params
+
+    def get_orders(self, status=None, business_name=None, date_from=None, date_to=None, limit=50, before=None):
+        # Keyset pagination on (timestamp, id), newest first; before = (timestamp, id) of the last row seen
+        conditions, params = self._order_filters(status, business_name, date_from, date_to)
+        if before:
+            conditions.append("(o.timestamp, o.id) < (?, ?)")
+            params.extend(before)
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+        conn = self._get_connection()
+        conn.row_factory = None
+        rows = self._get_orders(conn.cursor(), where, params, limit)
+        conn.close()
+        return rows
+
+    def _get_orders(self, cursor, where, params, limit):
+        cursor.execute(f'''
+            WITH page AS (
+                SELECT o.id, o.business_name, o.timestamp, o.status
+                FROM orders o
+                {where}
+                ORDER BY o.timestamp DESC, o.id DESC
+                LIMIT ?
+            )
+            SELECT page.id, page.business_name, page.timestamp, page.status,
+                   COUNT(oi.id) as item_count, SUM(oi.quantity) as total_qty
+            FROM page
+            LEFT JOIN order_items oi ON page.id = oi.order_id
+            GROUP BY page.id
+            ORDER BY page.timestamp DESC, page.id DESC
+        ''', params + [limit])
+        return self._fetch_dicts(cursor)
+
+    def count_orders(self, status=None, business_name=None, date_from=None, date_to=None):
+        conn = self._get_connection()
+        conn.row_factory = None
+        count = self._count_orders(conn.cursor(), status, business_name, date_from, date_to)
+        conn.close()
+        return count
+
+    def _count_orders(self, cursor, status=None, business_name=None, date_from=None, date_to=None):
+        if not (business_name or date_from or date_to):
+            # Trigger-maintained per-status counters: constant cost regardless of history size
+            if status:
+                cursor.execute("SELECT COALESCE(SUM(count), 0) as count FROM order_counts WHERE status = ?", (status,))
+            else:
+                cursor.execute("SELECT COALESCE(SUM(count), 0) as count FROM order_counts")
+        else:
+            conditions, params = self._order_filters(status, business_name, date_from, date_to)
+            cursor.execute("SELECT COUNT(*) as count FROM orders o WHERE " + " AND ".join(conditions), params)
+        return cursor.fetchone()[0]
+
+    def get_print_batch(self, order_ids=None, status=None, wave_id=None, limit=500):
+        # Headers and items for many orders in two set-based queries, oldest first
+        if order_ids is not None:
+            selection, param = "SELECT value FROM json_each(?)", json.dumps([int(i) for i in order_ids])
+        elif wave_id is not None:
+            selection, param = '''
+                SELECT DISTINCT a.order_id FROM wave_allocations wa
+                JOIN order_item_allocations a ON a.id = wa.allocation_id
+                WHERE wa.wave_id = ?
+            ''', wave_id
+        else:
+            selection, param = "SELECT id FROM orders WHERE status = ?", status
 
-    def get_orders(self):
         conn = self._get_connection()
+        conn.row_factory = None
         cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT * FROM orders
+            WHERE id IN ({selection})
+            ORDER BY timestamp, id
+            LIMIT ?
+        ''', (param, limit))
+        orders = self._fetch_dicts(cursor)
+        by_id = {}
+        for order in orders:
+            order['items'] = []
+            by_id[order['id']] = order
+
         cursor.execute('''
-            SELECT o.id, o.business_name, o.timestamp, o.status, COUNT(oi.id) as item_count, SUM(oi.quantity) as total_qty
-            FROM orders o
-            LEFT JOIN order_items oi ON o.id = oi.order_id
-            GROUP BY o.id
-            ORDER BY o.timestamp DESC
-        ''')
-        rows = cursor.fetchall()
+            SELECT oi.order_id, oi.quantity, p.name, p.id as product_id
+            FROM order_items oi
+            JOIN products p ON oi.product_id = p.id
+            WHERE oi.order_id IN (SELECT value FROM json_each(?))
+            ORDER BY oi.order_id, oi.id
+        ''', (json.dumps(list(by_id)),))
+        for order_id, quantity, name, product_id in cursor.fetchall():
+            by_id[order_id]['items'].append({'quantity': quantity, 'name': name, 'product_id': product_id})
         conn.close()
-        return [dict(row) for row in rows]
+        return orders
 
     def get_order_details(self, order_id):
+        return self.get_orders_details([order_id])[order_id]
+
+    def get_orders_details(self, order_ids):
+        # {order_id: {"items": [...], "allocations": [...]}} for every id asked for,
+        # in two queries whatever the number of orders
+        order_ids = list(dict.fromkeys(order_ids))
+        details = {oid: {"items": [], "allocations": []} for oid in order_ids}
+        ids = json.dumps(order_ids)
         conn = self._get_connection()
+        conn.row_factory = None
         cursor = conn.cursor()
         # Basic items
         cursor.execute('''
-            SELECT oi.quantity, p.name, p.id as product_id
+            SELECT oi.order_id, oi.quantity, p.name, p.id as product_id
             FROM order_items oi
             JOIN products p ON oi.product_id = p.id
-            WHERE oi.order_id = ?
-        ''', (order_id,))
-        items = [dict(row) for row in cursor.fetchall()]
-        
+            WHERE oi.order_id IN (SELECT value FROM json_each(?))
+            ORDER BY oi.order_id, oi.id
+        ''', (ids,))
+        for row in self._fetch_dicts(cursor):
+            details[row.pop('order_id')]['items'].append(row)
+
         # Allocations (Warehouse picking status)
         cursor.execute('''
-            SELECT oia.product_id, oia.warehouse_id, oia.quantity, oia.picked_quantity, p.name
+            SELECT oia.order_id, oia.product_id, oia.warehouse_id, oia.quantity, oia.picked_quantity, p.name
             FROM order_item_allocations oia
             JOIN products p ON oia.product_id = p.id
-            WHERE oia.order_id = ?
-        ''', (order_id,))
-        allocations = [dict(row) for row in cursor.fetchall()]
-        
+            WHERE oia.order_id IN (SELECT value FROM json_each(?))
+            ORDER BY oia.order_id, oia.id
+        ''', (ids,))
+        for row in self._fetch_dicts(cursor):
+            details[row.pop('order_id')]['allocations'].append(row)
+
         conn.close()
-        return {"items": items, "allocations": allocations}
+        return details
 
     def record_pick(self, order_id, warehouse_id, barcode, worker_name):
-        conn = self._get_connection()
-        cursor = conn.cursor()
         try:
-            # 1. Find the product_id for this barcode (instance)
-            cursor.execute("SELECT product_id FROM item_instances WHERE barcode = ? AND warehouse_id = ?", (barcode, warehouse_id))
-            instance = cursor.fetchone()
-            if not instance:
-                return False, "פריט לא נמצא במחסן זה"
-            
-            pid = instance['product_id']
-            
-            # 2. Check if this product is in the order for this warehouse and not yet fully picked
-            cursor.execute('''
-                SELECT id, quantity, picked_quantity 
-                FROM order_item_allocations 
-                WHERE order_id = ? AND product_id = ? AND warehouse_id = ?
-            ''', (order_id, pid, warehouse_id))
-            allocation = cursor.fetchone()
-            
-            if not allocation:
-                return False, "מוצר זה אינו חלק מהזמנה זו במחסן זה"
-            
-            if allocation['picked_quantity'] >= allocation['quantity']:
-                return False, "המוצר כבר לוקט במלואו"
-            
-            # 3. Increment picked_quantity
-            cursor.execute('''
-                UPDATE order_item_allocations 
-                SET picked_quantity = picked_quantity + 1 
-                WHERE id = ?
-            ''', (allocation['id'],))
-            
-            # 4. Mark instance as 'Picked' (optional, but good for traceability)
-            cursor.execute("UPDATE item_instances SET status = 'Picked', notes = ? WHERE barcode = ?", (f"Picked for Order #{order_id} by {worker_name}", barcode))
-            
-            # 5. Update worker last_active
-            cursor.execute("UPDATE workers SET last_active = CURRENT_TIMESTAMP WHERE name = ?", (worker_name,))
-            
-            conn.commit()
-            return True, "הפריט לוקט בהצלחה"
+            return self._write_across([warehouse_id], self._record_pick, order_id, warehouse_id, barcode, worker_name)
         except Exception as e:
-            conn.rollback()
             return False, str(e)
-        finally:
-            conn.close()
-    
+
+    def _record_pick(self, cursor, order_id, warehouse_id, barcode, worker_name):
+        # 1. Find the product_id for this barcode (lot)
+        cursor.execute("SELECT product_id FROM item_lots WHERE barcode = ? AND warehouse_id = ? LIMIT 1", (barcode, warehouse_id))
+        lot = cursor.fetchone()
+        if not lot:
+            return False, "פריט לא נמצא במחסן זה"
+
+        pid = lot['product_id']
+
+        # 2. Check if this product is in the order for this warehouse and not yet fully picked
+        cursor.execute('''
+            SELECT id, quantity, picked_quantity 
+            FROM order_item_allocations 
+            WHERE order_id = ? AND product_id = ? AND warehouse_id = ?
+        ''', (order_id, pid, warehouse_id))
+        allocation = cursor.fetchone()
+
+        if not allocation:
+            return False, "מוצר זה אינו חלק מהזמנה זו במחסן זה"
+
+        if allocation['picked_quantity'] >= allocation['quantity']:
+            return False, "המוצר כבר לוקט במלואו"
+
+        # 3. Increment picked_quantity
+        cursor.execute(f'''
+            UPDATE {self._sharded('order_item_allocations', warehouse_id)}
+            SET picked_quantity = picked_quantity + 1 
+            WHERE id = ?
+        ''', (allocation['id'],))
+
+        # 4. Take the unit out of its lot (traceability)
+        self._pick_from_lots(cursor, pid, warehouse_id, [barcode], 1, f"Picked for Order #{order_id} by {worker_name}")
+
+        # 5. Update worker last_active
+        cursor.execute("UPDATE workers SET last_active = CURRENT_TIMESTAMP WHERE name = ?", (worker_name,))
+
+        # 6. Complete the order once every allocation (all warehouses) is picked
+        cursor.execute('''
+            SELECT COUNT(*) as open_count FROM order_item_allocations
+            WHERE order_id = ? AND picked_quantity < quantity
+        ''', (order_id,))
+        if cursor.fetchone()['open_count'] == 0:
+            cursor.execute('''
+                UPDATE orders
+                SET status = 'COMPLETED', completed_at = CURRENT_TIMESTAMP, worker_name = COALESCE(worker_name, ?)
+                WHERE id = ?
+            ''', (worker_name, order_id))
+
+        return True, "הפריט לוקט בהצלחה"
+
+    def _pick_from_lots(self, cursor, product_id, warehouse_id, barcodes, units, notes):
+        # Oldest open lots of the scanned barcodes first; each unit taken gets its own row
+        placeholders = ','.join('?' * len(barcodes))
+        lots = self._sharded('item_lots', warehouse_id)
+        cursor.execute(f'''
+            SELECT id, barcode, quantity - picked_quantity as open_qty
+            FROM {lots}
+            WHERE product_id = ? AND warehouse_id = ? AND barcode IN ({placeholders})
+              AND picked_quantity < quantity
+            ORDER BY received_at, id
+        ''', [product_id, warehouse_id] + list(barcodes))
+        for lot in cursor.fetchall():
+            if units <= 0:
+                break
+            take = min(units, lot['open_qty'])
+            cursor.execute(f"UPDATE {lots} SET picked_quantity = picked_quantity + ? WHERE id = ?", (take, lot['id']))
+            cursor.executemany(f'''
+                INSERT INTO {self._sharded('item_instances', warehouse_id)} (product_id, warehouse_id, barcode, notes, status, lot_id)
+                VALUES (?, ?, ?, ?, 'Picked', ?)
+            ''', [(product_id, warehouse_id, lot['barcode'], notes, lot['id'])] * take)
+            units -= take
+
     def get_active_orders(self, warehouse_id=None):
         conn = self._get_connection()
         cursor = conn.cursor()
@@ -435,6 +1816,335 @@ class Database:
         conn.close()
         return [dict(row) for row in rows]
 
+    def get_open_allocations(self, order_ids=None):
+        # Allocation rows of active orders (seed/refresh for the in-memory pick queue)
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        query = '''
+            SELECT oia.id, oia.order_id, oia.product_id, oia.warehouse_id, oia.quantity, oia.picked_quantity,
+                   p.name, o.business_name, o.timestamp, o.status, o.worker_name
+            FROM order_item_allocations oia
+            JOIN orders o ON o.id = oia.order_id
+            JOIN products p ON p.id = oia.product_id
+            WHERE o.status IN ('PENDING', 'PROCESSING')
+        '''
+        if order_ids is not None:
+            placeholders = ','.join('?' * len(order_ids))
+            cursor.execute(query + f" AND o.id IN ({placeholders})", list(order_ids))
+        else:
+            cursor.execute(query)
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    # --- Background Jobs ---
+    # Status: queued -> running -> done | failed | cancelled. Jobs run in worker processes,
+    # which report progress and check for cancellation through these rows.
+    def create_job(self, kind, params=None, max_pending=None):
+        # Owned by this process: its worker pool runs the job. Returns None when max_pending
+        # jobs are already queued or running (counted in the same statement as the insert)
+        return self._write(self._create_job, kind, params, os.getpid(), max_pending)
+
+    def _create_job(self, cursor, kind, params, owner_pid, max_pending):
+        cursor.execute('''
+            INSERT INTO jobs (kind, params, owner_pid)
+            SELECT ?, ?, ?
+            WHERE ? IS NULL OR (SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')) < ?
+        ''', (kind, json.dumps(params or {}), owner_pid, max_pending, max_pending))
+        return cursor.lastrowid if cursor.rowcount == 1 else None
+
+    def start_job(self, job_id):
+        # False when the job was cancelled while still queued
+        return self._write(self._start_job, job_id)
+
+    def _start_job(self, cursor, job_id):
+        cursor.execute('''
+            UPDATE jobs SET status = 'running', started_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'queued'
+        ''', (job_id,))
+        return cursor.rowcount == 1
+
+    def update_job_progress(self, job_id, progress, message=None):
+        # Returns True when cancellation was requested
+        return self._write(self._update_job_progress, job_id, progress, message)
+
+    def _update_job_progress(self, cursor, job_id, progress, message):
+        cursor.execute('''
+            UPDATE jobs SET progress = ?, message = COALESCE(?, message)
+            WHERE id = ? AND status = 'running'
+            RETURNING cancel_requested
+        ''', (progress, message, job_id))
+        row = cursor.fetchone()
+        return row is None or bool(row[0])
+
+    def finish_job(self, job_id, status, result=None, message=None):
+        return self._write(self._finish_job, job_id, status, result, message)
+
+    def _finish_job(self, cursor, job_id, status, result, message):
+        cursor.execute('''
+            UPDATE jobs SET status = ?, result = ?, message = COALESCE(?, message),
+                   progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END,
+                   finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status IN ('queued', 'running')
+        ''', (status, None if result is None else json.dumps(result), message, status, job_id))
+        return cursor.rowcount == 1
+
+    def cancel_job(self, job_id):
+        # A queued job is cancelled at once, a running one when it next reports progress.
+        # Returns the job's status afterwards, or None if it had already finished.
+        return self._write(self._cancel_job, job_id)
+
+    def _cancel_job(self, cursor, job_id):
+        cursor.execute('''
+            UPDATE jobs SET cancel_requested = 1,
+                   status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                   finished_at = CASE WHEN status = 'queued' THEN CURRENT_TIMESTAMP END
+            WHERE id = ? AND status IN ('queued', 'running')
+            RETURNING status
+        ''', (job_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def get_active_job_owners(self):
+        # {owner_pid: [job_id, ...]} for queued and running jobs
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT owner_pid, id FROM jobs WHERE status IN ('queued', 'running')")
+        owners = {}
+        for pid, job_id in cursor.fetchall():
+            owners.setdefault(pid, []).append(job_id)
+        conn.close()
+        return owners
+
+    def get_jobs(self, status=None, limit=50, job_ids=None):
+        # Newest first, params and result decoded
+        sql = "SELECT * FROM jobs"
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if job_ids is not None:
+            clauses.append("id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(list(job_ids)))
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id DESC LIMIT ?"
+        conn = self._get_connection()
+        conn.row_factory = None
+        cursor = conn.cursor()
+        cursor.execute(sql, params + [limit])
+        jobs = self._fetch_dicts(cursor)
+        conn.close()
+        for job in jobs:
+            job['params'] = json.loads(job['params']) if job['params'] else {}
+            job['result'] = json.loads(job['result']) if job['result'] else None
+            job['cancel_requested'] = bool(job['cancel_requested'])
+        return jobs
+
+    def get_job(self, job_id):
+        jobs = self.get_jobs(job_ids=[job_id], limit=1)
+        return jobs[0] if jobs else None
+
+    # --- Wave Picking ---
+    def plan_wave(self, warehouse_id, max_orders=50, worker_name=None):
+        try:
+            # Claims allocations in wave_allocations, a core table: no shard is written
+            return self._write_across((), self._plan_wave, warehouse_id, max_orders, worker_name)
+        except Exception as e:
+            print(f"Error planning wave: {e}")
+            return None
+
+    def _plan_wave(self, cursor, warehouse_id, max_orders, worker_name):
+        cursor.execute("INSERT INTO waves (warehouse_id, worker_name) VALUES (?, ?)", (warehouse_id, worker_name))
+        wave_id = cursor.lastrowid
+
+        # 1. Claim the open allocations of the oldest orders with work in this warehouse,
+        #    skipping anything already claimed by another open wave
+        cursor.execute('''
+            WITH claimable AS (
+                SELECT a.id, a.order_id
+                FROM order_item_allocations a
+                WHERE a.warehouse_id = ? AND a.picked_quantity < a.quantity
+                  AND NOT EXISTS (
+                      SELECT 1 FROM wave_allocations wa JOIN waves w ON w.id = wa.wave_id
+                      WHERE wa.allocation_id = a.id AND w.status = 'OPEN'
+                  )
+            ),
+            wave_orders AS (
+                SELECT o.id FROM orders o
+                WHERE o.status IN ('PENDING', 'PROCESSING')
+                  AND o.id IN (SELECT order_id FROM claimable)
+                ORDER BY o.timestamp ASC, o.id ASC
+                LIMIT ?
+            )
+            INSERT INTO wave_allocations (wave_id, allocation_id)
+            SELECT ?, c.id FROM claimable c WHERE c.order_id IN (SELECT id FROM wave_orders)
+        ''', (warehouse_id, max_orders, wave_id))
+
+        # rowcount is not reported for statements that start with WITH
+        cursor.execute("SELECT changes()")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("DELETE FROM waves WHERE id = ?", (wave_id,))
+            return None
+
+        # 2. One pick line per product across all orders in the wave
+        return self._wave_pick_list(cursor, wave_id)
+
+    def _wave_pick_list(self, cursor, wave_id):
+        cursor.execute("SELECT id, warehouse_id, worker_name, status, created_at FROM waves WHERE id = ?", (wave_id,))
+        wave = dict(cursor.fetchone())
+        cursor.execute('''
+            SELECT a.product_id, p.name, SUM(a.quantity - a.picked_quantity) as quantity,
+                   COUNT(DISTINCT a.order_id) as order_count
+            FROM wave_allocations wa
+            JOIN order_item_allocations a ON a.id = wa.allocation_id
+            JOIN products p ON p.id = a.product_id
+            WHERE wa.wave_id = ?
+            GROUP BY a.product_id
+            ORDER BY p.name
+        ''', (wave_id,))
+        wave['items'] = [dict(row) for row in cursor.fetchall()]
+        cursor.execute('''
+            SELECT DISTINCT a.order_id FROM wave_allocations wa
+            JOIN order_item_allocations a ON a.id = wa.allocation_id
+            WHERE wa.wave_id = ?
+        ''', (wave_id,))
+        wave['order_ids'] = [row['order_id'] for row in cursor.fetchall()]
+        return wave
+
+    def get_wave(self, wave_id):
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM waves WHERE id = ?", (wave_id,))
+        wave = self._wave_pick_list(cursor, wave_id) if cursor.fetchone() else None
+        conn.close()
+        return wave
+
+    def confirm_wave(self, wave_id, barcodes, worker_name):
+        try:
+            return self._write_across(self._wave_warehouses(wave_id), self._confirm_wave, wave_id, barcodes, worker_name)
+        except Exception as e:
+            return False, str(e)
+
+    def _wave_warehouses(self, wave_id):
+        # The shard a wave's confirmation writes (none when the wave does not exist)
+        if not self.shard_dir:
+            return None
+        conn = self._get_connection()
+        row = conn.execute("SELECT warehouse_id FROM waves WHERE id = ?", (wave_id,)).fetchone()
+        conn.close()
+        return [row[0]] if row else []
+
+    def _confirm_wave(self, cursor, wave_id, barcodes, worker_name):
+        # Distribute the units scanned for a wave to its orders (oldest first) in one transaction
+        cursor.execute("SELECT warehouse_id, status FROM waves WHERE id = ?", (wave_id,))
+        wave = cursor.fetchone()
+        if not wave:
+            return False, "גל ליקוט לא נמצא"
+        if wave['status'] != 'OPEN':
+            return False, "גל הליקוט כבר הושלם"
+
+        # 1. Scanned units per product (barcode -> product within this warehouse)
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS wave_scans (barcode TEXT, quantity INTEGER)")
+        cursor.execute("DELETE FROM temp.wave_scans")
+        cursor.executemany("INSERT INTO temp.wave_scans (barcode, quantity) VALUES (?, 1)", [(b,) for b in barcodes])
+        cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS wave_scanned (product_id INTEGER PRIMARY KEY, quantity INTEGER)
+        ''')
+        cursor.execute("DELETE FROM temp.wave_scanned")
+        cursor.execute('''
+            INSERT INTO temp.wave_scanned (product_id, quantity)
+            SELECT i.product_id, SUM(s.quantity)
+            FROM (SELECT barcode, SUM(quantity) as quantity FROM temp.wave_scans GROUP BY barcode) s
+            JOIN (SELECT DISTINCT barcode, product_id FROM item_lots WHERE warehouse_id = ?) i
+              ON i.barcode = s.barcode
+            GROUP BY i.product_id
+        ''', (wave['warehouse_id'],))
+
+        cursor.execute('''
+            SELECT a.product_id, SUM(a.quantity - a.picked_quantity) as open_qty
+            FROM wave_allocations wa JOIN order_item_allocations a ON a.id = wa.allocation_id
+            WHERE wa.wave_id = ?
+            GROUP BY a.product_id
+        ''', (wave_id,))
+        open_before = {row['product_id']: row['open_qty'] for row in cursor.fetchall()}
+
+        # 2. Fill allocations per product in order sequence: each gets min(open, units left)
+        cursor.execute(f'''
+            UPDATE {self._sharded('order_item_allocations', wave['warehouse_id'])} AS target
+            SET picked_quantity = picked_quantity + fill.add_qty
+            FROM (
+                SELECT id, MIN(open_qty, MAX(0, scanned - (running - open_qty))) as add_qty
+                FROM (
+                    SELECT a.id, a.quantity - a.picked_quantity as open_qty, sc.quantity as scanned,
+                           SUM(a.quantity - a.picked_quantity) OVER (
+                               PARTITION BY a.product_id ORDER BY o.timestamp, a.order_id, a.id
+                           ) as running
+                    FROM wave_allocations wa
+                    JOIN order_item_allocations a ON a.id = wa.allocation_id
+                    JOIN orders o ON o.id = a.order_id
+                    JOIN temp.wave_scanned sc ON sc.product_id = a.product_id
+                    WHERE wa.wave_id = ? AND a.picked_quantity < a.quantity
+                )
+            ) fill
+            WHERE target.id = fill.id AND fill.add_qty > 0
+        ''', (wave_id,))
+
+        # 3. Traceability, as in record_pick: only the units actually filled leave their lots
+        cursor.execute('''
+            SELECT a.product_id, SUM(a.quantity - a.picked_quantity) as open_qty
+            FROM wave_allocations wa JOIN order_item_allocations a ON a.id = wa.allocation_id
+            WHERE wa.wave_id = ?
+            GROUP BY a.product_id
+        ''', (wave_id,))
+        open_after = {row['product_id']: row['open_qty'] for row in cursor.fetchall()}
+        wave_barcodes = list(set(barcodes))
+        for pid, qty in open_before.items():
+            filled = qty - open_after.get(pid, 0)
+            if filled > 0:
+                self._pick_from_lots(cursor, pid, wave['warehouse_id'], wave_barcodes, filled,
+                                     f"Picked for Wave #{wave_id} by {worker_name}")
+        cursor.execute("UPDATE workers SET last_active = CURRENT_TIMESTAMP WHERE name = ?", (worker_name,))
+
+        # 4. Complete orders with nothing left to pick, then close the wave
+        cursor.execute('''
+            UPDATE orders
+            SET status = 'COMPLETED', completed_at = CURRENT_TIMESTAMP, worker_name = COALESCE(worker_name, ?)
+            WHERE id IN (
+                SELECT a.order_id FROM wave_allocations wa
+                JOIN order_item_allocations a ON a.id = wa.allocation_id
+                WHERE wa.wave_id = ?
+            )
+            AND status IN ('PENDING', 'PROCESSING')
+            AND NOT EXISTS (
+                SELECT 1 FROM order_item_allocations x
+                WHERE x.order_id = orders.id AND x.picked_quantity < x.quantity
+            )
+        ''', (worker_name, wave_id))
+        cursor.execute('''
+            UPDATE waves SET status = 'COMPLETED', completed_at = CURRENT_TIMESTAMP, worker_name = ?
+            WHERE id = ?
+        ''', (worker_name, wave_id))
+
+        # Result: what is still short per product, surplus units and unknown barcodes
+        wave_result = self._wave_pick_list(cursor, wave_id)
+        cursor.execute("SELECT product_id, quantity FROM temp.wave_scanned")
+        scanned = {row['product_id']: row['quantity'] for row in cursor.fetchall()}
+        remaining = {item['product_id']: item['quantity'] for item in wave_result['items']}
+        wave_result['picked'] = {}
+        wave_result['surplus'] = {}
+        for pid, qty in scanned.items():
+            picked = open_before.get(pid, 0) - remaining.get(pid, 0)
+            wave_result['picked'][pid] = picked
+            if qty > picked:
+                wave_result['surplus'][pid] = qty - picked
+        cursor.execute('''
+            SELECT DISTINCT barcode FROM temp.wave_scans
+            WHERE barcode NOT IN (SELECT barcode FROM item_lots WHERE warehouse_id = ?)
+        ''', (wave['warehouse_id'],))
+        wave_result['unknown_barcodes'] = [row['barcode'] for row in cursor.fetchall()]
+        return True, wave_result
+
     def update_order_status(self, order_id, status, worker_name=None):
         conn = self._get_connection()
         cursor = conn.cursor()
@@ -461,12 +2171,20 @@ class Database:
 
     def get_analytics_data(self):
         conn = self._get_connection()
-        cursor = conn.cursor()
+        conn.row_factory = None
+        data = self._get_analytics_data(conn.cursor(), stock_value=self.stock_matrix is None)
+        conn.close()
+        if self.stock_matrix:
+            data['inventory_value'] = self.stock_matrix.inventory_value()
+        return data
+
+    def _get_analytics_data(self, cursor, stock_value=True):
+        # stock_value=False leaves inventory_value to the caller (served from the stock matrix)
         data = {}
         
         # 1. Total Orders
         cursor.execute("SELECT COUNT(*) as count FROM orders")
-        data['total_orders'] = cursor.fetchone()['count']
+        data['total_orders'] = cursor.fetchone()[0]
         
         # 2. Total Revenue
         cursor.execute('''
@@ -475,7 +2193,7 @@ class Database:
             JOIN products p ON oi.product_id = p.id
         ''')
         res = cursor.fetchone()
-        data['total_revenue'] = res['revenue'] if res and res['revenue'] else 0.0
+        data['total_revenue'] = res[0] if res and res[0] else 0.0
         
         # 3. Top Products
         cursor.execute('''
@@ -486,7 +2204,7 @@ class Database:
             ORDER BY total_sold DESC
             LIMIT 5
         ''')
-        data['top_products'] = [dict(row) for row in cursor.fetchall()]
+        data['top_products'] = self._fetch_dicts(cursor)
 
         # 4. Recent Orders
         cursor.execute('''
@@ -495,93 +2213,269 @@ class Database:
             ORDER BY timestamp DESC 
             LIMIT 5
         ''')
-        data['recent_orders'] = [dict(row) for row in cursor.fetchall()]
+        data['recent_orders'] = self._fetch_dicts(cursor)
 
         # 5. Inventory Value & Low Stock
-        cursor.execute("SELECT SUM(price * quantity * pack_size) as val FROM products")
-        res = cursor.fetchone()
-        data['inventory_value'] = res['val'] if res and res['val'] else 0.0
+        if stock_value:
+            cursor.execute("SELECT SUM(price * quantity * pack_size) as val FROM products")
+            res = cursor.fetchone()
+            data['inventory_value'] = res[0] if res and res[0] else 0.0
+
+        # Open low-stock alerts (raised by the writes that crossed a threshold)
+        cursor.execute("SELECT COUNT(*) as count FROM stock_alerts WHERE resolved_at IS NULL")
+        data['low_stock_count'] = cursor.fetchone()[0]
+        return data
+
+    def get_dashboard(self, orders_limit=50):
+        # Warehouses, products with their stock breakdowns and the first orders page for the
+        # admin dashboard, all read in one transaction so they agree with each other (the
+        # breakdowns come from warehouse_stock here, not the matrix). Analytics are left to
+        # the caller, which serves them from the report snapshot
+        conn = self._get_connection()
+        conn.row_factory = None
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            return {
+                'warehouses': self._get_warehouses(cursor),
+                'products': self._get_products(cursor),
+                'orders': self._get_orders(cursor, "", [], orders_limit),
+                'orders_total': self._count_orders(cursor),
+            }
+        finally:
+            conn.execute("COMMIT")
+            conn.close()
+
+    ROLLUP_METRICS = {
+        'units': ('sales', 'units'),
+        'revenue': ('sales', 'revenue'),
+        'stock_in': ('stock_in', 'units'),
+    }
+    # group_by -> (series key, join needed for it, query naming the keys)
+    ROLLUP_GROUPS = {
+        'product': ("r.product_id", "", "SELECT id, name FROM products"),
+        'category': ("COALESCE(p.category, 'Uncategorized')", "LEFT JOIN products p ON p.id = r.product_id", None),
+        'warehouse': ("r.warehouse_id", "", "SELECT id, name FROM warehouses"),
+        'total': ("'Total'", "", None),
+    }
+
+    def get_rollup_rows(self, metric, group_by, since, warehouse_id=None, resolution='hourly'):
+        # [(period, series, value)] from the hourly or daily rollups, one row per period and series
+        table, column = self.ROLLUP_METRICS[metric]
+        if resolution not in ('hourly', 'daily'):
+            raise ValueError(f"Unknown resolution: {resolution}")
+        key, join, names_sql = self.ROLLUP_GROUPS[group_by]
+        # Group by ids, following the primary key order, and name the series afterwards
+        sql = f"SELECT r.period, {key} AS series, SUM(r.{column}) FROM {table}_{resolution} r {join} WHERE r.period >= ?"
+        params = [since]
+        if warehouse_id is not None:
+            sql += " AND r.warehouse_id = ?"
+            params.append(warehouse_id)
+        sql += " GROUP BY r.period, series"
+
+        conn = self._get_connection()
+        conn.row_factory = None
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        if names_sql:
+            cursor.execute(names_sql)
+            names = dict(cursor.fetchall())
+            label = group_by.capitalize()
+            rows = [(period, names.get(series) or f"{label} {series}", value) for period, series, value in rows]
+        conn.close()
+        return rows
 
-        cursor.execute("SELECT COUNT(*) as count FROM products WHERE quantity < 5")
-        data['low_stock_count'] = cursor.fetchone()['count']
+    def get_rollup_version(self):
+        # Bumped by triggers on every rollup change, delete and series rename
+        conn = self._get_connection()
+        conn.row_factory = None
+        cursor = conn.cursor()
+        cursor.execute("SELECT version FROM rollup_version WHERE id = 1")
+        version = cursor.fetchone()[0]
+        conn.close()
+        return version
 
+    def get_demand_inputs(self, since, dirty_up_to=None):
+        # [(product_id, warehouse_id, stock, units sold since, sum of squared daily units)]
+        # for every stock row, or only those marked dirty up to dirty_up_to
+        conn = self._get_connection()
+        conn.row_factory = None
+        cursor = conn.cursor()
+        if dirty_up_to is None:
+            cursor.execute('''
+                SELECT ws.product_id, ws.warehouse_id, ws.quantity, COALESCE(d.units, 0), COALESCE(d.squares, 0)
+                FROM warehouse_stock ws
+                LEFT JOIN (
+                    SELECT product_id, warehouse_id, SUM(units) AS units, SUM(units * units) AS squares
+                    FROM sales_daily
+                    WHERE period >= ?
+                    GROUP BY product_id, warehouse_id
+                ) d ON d.product_id = ws.product_id AND d.warehouse_id = ws.warehouse_id
+            ''', (since,))
+        else:
+            cursor.execute('''
+                SELECT ws.product_id, ws.warehouse_id, ws.quantity,
+                       COALESCE(SUM(s.units), 0), COALESCE(SUM(s.units * s.units), 0)
+                FROM warehouse_stock ws
+                LEFT JOIN sales_daily s ON s.product_id = ws.product_id
+                     AND s.warehouse_id = ws.warehouse_id AND s.period >= ?
+                WHERE (ws.product_id, ws.warehouse_id) IN (
+                    SELECT product_id, warehouse_id FROM replenishment_dirty WHERE id <= ?
+                )
+                GROUP BY ws.product_id, ws.warehouse_id
+            ''', (since, dirty_up_to))
+        rows = cursor.fetchall()
         conn.close()
-        return data
+        return rows
+
+    def get_replenishment_dirty_id(self):
+        # Highest pending change id, 0 when nothing changed since the last pass
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM replenishment_dirty")
+        dirty_id = cursor.fetchone()[0]
+        conn.close()
+        return dirty_id
+
+    def save_replenishment(self, rows, dirty_up_to, full=False):
+        # rows: [(product_id, warehouse_id, stock, daily_demand, demand_std, reorder_point,
+        #         suggested_quantity, days_until_stockout)]; a full pass also drops rows
+        # whose stock row is gone
+        try:
+            return self._write(self._save_replenishment, rows, dirty_up_to, full)
+        except Exception as e:
+            print(f"Error saving replenishment: {e}")
+            return False
+
+    def _save_replenishment(self, cursor, rows, dirty_up_to, full):
+        cursor.executemany('''
+            INSERT OR REPLACE INTO replenishment
+                (product_id, warehouse_id, stock, daily_demand, demand_std, reorder_point,
+                 suggested_quantity, days_until_stockout, computed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', rows)
+        cursor.execute("DELETE FROM replenishment_dirty WHERE id <= ?", (dirty_up_to,))
+        if full:
+            cursor.execute('''
+                DELETE FROM replenishment WHERE NOT EXISTS (
+                    SELECT 1 FROM warehouse_stock ws
+                    WHERE ws.product_id = replenishment.product_id AND ws.warehouse_id = replenishment.warehouse_id
+                )
+            ''')
+        return True
+
+    def get_replenishment(self, warehouse_id=None, at_risk=False, limit=100):
+        # Soonest stock-outs first; at_risk keeps rows at or below their reorder point
+        sql = '''
+            SELECT r.product_id, p.name, r.warehouse_id, r.stock, r.daily_demand, r.demand_std,
+                   r.reorder_point, r.suggested_quantity, r.days_until_stockout, r.computed_at
+            FROM replenishment r
+            JOIN products p ON p.id = r.product_id
+            WHERE r.daily_demand > 0
+        '''
+        params = []
+        if warehouse_id is not None:
+            sql += " AND r.warehouse_id = ?"
+            params.append(warehouse_id)
+        if at_risk:
+            sql += " AND r.stock <= r.reorder_point"
+        sql += " ORDER BY r.days_until_stockout LIMIT ?"
+        params.append(limit)
 
-    def create_order(self, business_name, items):
-        # Items: [{'product_id': 1, 'quantity': 5}, ...]
         conn = self._get_connection()
+        conn.row_factory = None
         cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = self._fetch_dicts(cursor)
+        conn.close()
+        return rows
+
+    def create_order(self, business_name, items):
+        # Items: [{'product_id': 1, 'quantity': 5}, ...]
+        # Quick reject from RAM before queueing the write (the transaction checks again)
+        if self.stock_matrix:
+            short = self._short_items(items)
+            if short:
+                # The matrix may trail another process's writes: catch up before rejecting
+                self.stock_matrix.sync()
+                short = self._short_items(items)
+            if short:
+                return False, f"Insufficient total stock for Product {short[0]}"
         try:
-            # 1. Create Order
-            cursor.execute("INSERT INTO orders (business_name) VALUES (?)", (business_name,))
-            order_id = cursor.lastrowid
-            
-            # 2. Process Items with Warehouse Priority Deduction
-            warehouses_order = [1, 2, 3] # Priority: 1 -> 2 -> 3
-            
-            for item in items:
-                pid = item['product_id']
-                qty_needed = int(item['quantity']) 
-                
-                # Check Total Stock first for quick reject?
-                cursor.execute("SELECT quantity FROM products WHERE id = ?", (pid,))
-                row = cursor.fetchone()
-                if not row or row['quantity'] < qty_needed:
-                     raise Exception(f"Insufficient total stock for Product {pid}")
-
-                # Deduct from Total
-                cursor.execute("UPDATE products SET quantity = quantity - ? WHERE id = ?", (qty_needed, pid))
-                
-                # Deduct from Warehouses (Cascading)
-                remaining_to_deduct = qty_needed
-                
-                for wid in warehouses_order:
-                    if remaining_to_deduct <= 0:
-                        break
-                        
-                    # Get stock in this warehouse
-                    cursor.execute("SELECT quantity FROM warehouse_stock WHERE product_id = ? AND warehouse_id = ?", (pid, wid))
-                    w_row = cursor.fetchone()
-                    w_qty = w_row['quantity'] if w_row else 0
-                    
-                    if w_qty > 0:
-                        deduct = min(w_qty, remaining_to_deduct)
-                        # Update warehouse stock
-                        cursor.execute("UPDATE warehouse_stock SET quantity = quantity - ? WHERE product_id = ? AND warehouse_id = ?", (deduct, pid, wid))
-                        
-                        # Add Allocation record
-                        cursor.execute('''
-                            INSERT INTO order_item_allocations (order_id, product_id, warehouse_id, quantity)
-                            VALUES (?, ?, ?, ?)
-                        ''', (order_id, pid, wid, deduct))
-                        
-                        remaining_to_deduct -= deduct
-                
-                # Note: If remaining_to_deduct > 0 here, it means mismatch between 'products.quantity' and sum of 'warehouse_stock'.
-                # We trusted products.quantity earlier. We might have negative stock in warehouses if we force it, 
-                # or just deduct from last warehouse to balance? 
-                # Ideally we force deduct from W1 if we can't find it, or let it slide. 
-                # For now, let's force deduct any remainder from W1 to ensure mathematically sound total.
-                if remaining_to_deduct > 0:
-                     cursor.execute('''
-                        INSERT INTO warehouse_stock (product_id, warehouse_id, quantity) 
-                        VALUES (?, ?, ?)
-                        ON CONFLICT(product_id, warehouse_id) 
-                        DO UPDATE SET quantity = quantity - ?
-                    ''', (pid, 1, -remaining_to_deduct, remaining_to_deduct))
-
-                # Add Order Item
-                cursor.execute('''
-                    INSERT INTO order_items (order_id, product_id, quantity)
-                    VALUES (?, ?, ?)
-                ''', (order_id, pid, qty_needed))
-                
-            conn.commit()
-            return True, order_id
+            result, alerts = self._write_across(None, self._create_order, business_name, items)
         except Exception as e:
-            conn.rollback()
             return False, str(e)
-        finally:
-            conn.close()
+        self._sync_stock_matrix()
+        self._notify_low_stock(alerts)
+        return result
+
+    def _short_items(self, items):
+        # Product ids the matrix cannot cover; malformed items are left to the transaction
+        try:
+            return [item['product_id'] for item in items
+                    if self.stock_matrix.available(item['product_id']) < int(item['quantity'])]
+        except (KeyError, TypeError, ValueError):
+            return []
+
+    def _create_order(self, cursor, business_name, items):
+        # 1. Create Order
+        cursor.execute("INSERT INTO orders (business_name) VALUES (?)", (business_name,))
+        order_id = cursor.lastrowid
+
+        # 2. Process Items with Warehouse Priority Deduction
+        # Priority follows the warehouses table (lowest id first)
+        touched = []
+
+        for item in items:
+            pid = item['product_id']
+            qty_needed = int(item['quantity']) 
+
+            # Check Total Stock first for quick reject?
+            cursor.execute("SELECT quantity FROM products WHERE id = ?", (pid,))
+            row = cursor.fetchone()
+            if not row or row['quantity'] < qty_needed:
+                 raise Exception(f"Insufficient total stock for Product {pid}")
+
+            # Deduct from Warehouses (Cascading), products.quantity follows via trigger
+            remaining_to_deduct = qty_needed
+
+            # Warehouses holding this product, in priority order
+            cursor.execute('''
+                SELECT ws.warehouse_id, ws.quantity
+                FROM warehouse_stock ws
+                JOIN warehouses w ON w.id = ws.warehouse_id
+                WHERE ws.product_id = ? AND ws.quantity > 0
+                ORDER BY w.id
+            ''', (pid,))
+            for wid, w_qty in cursor.fetchall():
+                if remaining_to_deduct <= 0:
+                    break
+
+                if w_qty > 0:
+                    deduct = min(w_qty, remaining_to_deduct)
+                    # Update warehouse stock
+                    cursor.execute(f"UPDATE {self._sharded('warehouse_stock', wid)} SET quantity = quantity - ? WHERE product_id = ? AND warehouse_id = ?", (deduct, pid, wid))
+                    touched.append((pid, wid))
+
+                    # Add Allocation record
+                    cursor.execute(f'''
+                        INSERT INTO {self._sharded('order_item_allocations', wid)} (order_id, product_id, warehouse_id, quantity)
+                        VALUES (?, ?, ?, ?)
+                    ''', (order_id, pid, wid, deduct))
+
+                    remaining_to_deduct -= deduct
+
+            # Totals are trigger-maintained, so the positive warehouse rows cover products.quantity; stock
+            # the allocation loop cannot reach (a row for a removed warehouse) fails the order, which rolls back
+            if remaining_to_deduct > 0:
+                raise Exception(f"Insufficient warehouse stock for Product {pid}")
+
+            # Add Order Item
+            cursor.execute('''
+                INSERT INTO order_items (order_id, product_id, quantity)
+                VALUES (?, ?, ?)
+            ''', (order_id, pid, qty_needed))
 
+        # 3. Threshold checks for the stock rows this order drew from
+        return (True, order_id), self._check_low_stock(cursor, touched)
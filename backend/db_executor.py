@@ -0,0 +1,46 @@
+import types
+
+class DBExecutor:
+    """Runs Database calls on real OS threads so they never block the eventlet hub.
+
+    Wraps a Database and exposes the same public methods. Each call is handed
+    to eventlet's tpool, the calling greenthread yields until the result is
+    ready and other requests and Socket.IO heartbeats keep being served.
+    Generator methods (iter_export) are advanced one batch per tpool call.
+    Without eventlet (or with enabled=False) calls run directly.
+    """
+
+    def __init__(self, db, pool_size=8, enabled=True):
+        self.db = db
+        self.pool_size = pool_size
+        self._execute = None
+        if enabled:
+            try:
+                from eventlet import tpool
+                tpool.set_num_threads(pool_size)
+                self._execute = tpool.execute
+            except ImportError:
+                print("eventlet not available, database calls run inline")
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if name.startswith('_') or not callable(attr) or self._execute is None:
+            return attr
+
+        def call(*args, **kwargs):
+            result = self._execute(attr, *args, **kwargs)
+            if isinstance(result, types.GeneratorType):
+                return self._iterate(result)
+            return result
+        return call
+
+    def _iterate(self, generator):
+        done = object()
+        try:
+            while True:
+                item = self._execute(next, generator, done)
+                if item is done:
+                    return
+                yield item
+        finally:
+            self._execute(generator.close)
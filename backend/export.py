@@ -0,0 +1,49 @@
+import csv
+import io
+import json
+import zlib
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+def _csv_chunks(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _ndjson_chunks(columns, batches):
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows)
+
+def stream_export(db, kind, fmt='csv', since=None, since_id=None, compress=False):
+    """Yield an export as encoded chunks, one per cursor batch.
+
+    Only one batch of rows is held in memory at a time, so memory stays flat
+    regardless of table size. With compress=True the chunks form a single gzip
+    stream.
+    """
+    rows = db.iter_export(kind, since=since, since_id=since_id)
+    try:
+        columns = next(rows)
+        chunks = _csv_chunks(columns, rows) if fmt == 'csv' else _ndjson_chunks(columns, rows)
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        for chunk in chunks:
+            data = chunk.encode('utf-8')
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+        if compressor:
+            yield compressor.flush()
+    finally:
+        rows.close()
@@ -0,0 +1,97 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def forecast(rows, window_days=28, lead_time_days=7, service_z=1.65):
+    """Reorder points and stock-out estimates for a batch of stock rows, in one vectorized pass.
+
+    rows are (product_id, warehouse_id, stock, units sold in the window, sum of
+    squared daily units) as returned by Database.get_demand_inputs. Daily
+    demand is the window mean (days without sales count as zero), the reorder
+    point covers lead-time demand plus service_z standard deviations of it, and
+    the suggested quantity tops stock back up to one more lead time above the
+    reorder point. Returns rows for Database.save_replenishment.
+    """
+    if not rows:
+        return []
+    data = np.array(rows, dtype=np.float64)
+    stock, units, squares = data[:, 2], data[:, 3], data[:, 4]
+
+    demand = units / window_days
+    std = np.sqrt(np.maximum(squares / window_days - demand ** 2, 0.0))
+    lead_demand = demand * lead_time_days
+    reorder_point = np.ceil(lead_demand + service_z * std * np.sqrt(lead_time_days))
+    suggested = np.where(stock <= reorder_point, np.ceil(reorder_point + lead_demand - stock), 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_left = np.where(demand > 0, np.maximum(stock, 0) / demand, np.nan)
+
+    out = np.column_stack([data[:, :3], demand.round(4), std.round(4), reorder_point,
+                           np.maximum(suggested, 0), days_left.round(1)]).tolist()
+    # Back to ints for the key, counts and quantities; NULL where demand is zero
+    return [(int(r[0]), int(r[1]), int(r[2]), r[3], r[4], int(r[5]), int(r[6]),
+             None if r[7] != r[7] else r[7]) for r in out]
+
+class ReplenishmentForecaster:
+    """Keeps the replenishment table current.
+
+    A full pass recomputes every product/warehouse stock row from the daily
+    sales rollups; in between, incremental passes only recompute the rows whose
+    stock changed (orders, receipts, adjustments), as recorded by triggers in
+    replenishment_dirty. A full pass runs once a day so rates follow the
+    sliding window even for products that stopped selling.
+    """
+
+    def __init__(self, db, window_days=28, lead_time_days=7, service_z=1.65, interval=60,
+                 full_interval=24 * 3600):
+        self.db = db
+        self.window_days = window_days
+        self.lead_time_days = lead_time_days
+        self.service_z = service_z
+        self.interval = interval
+        self.full_interval = full_interval
+        self.last_full = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._forecast_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def _forecast_loop(self):
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Forecast error: {e}")
+            time.sleep(self.interval)
+
+    def run_once(self, full=None):
+        # Returns the number of rows recomputed
+        if np is None:
+            raise RuntimeError("numpy is required for replenishment forecasts")
+        if full is None:
+            full = self.last_full is None or time.time() - self.last_full >= self.full_interval
+
+        dirty_up_to = self.db.get_replenishment_dirty_id()
+        if not full and not dirty_up_to:
+            return 0
+        # window_days whole days, today (partial) included
+        since = (datetime.now(timezone.utc) - timedelta(days=self.window_days - 1)).strftime('%Y-%m-%d')
+        rows = self.db.get_demand_inputs(since, None if full else dirty_up_to)
+        results = forecast(rows, self.window_days, self.lead_time_days, self.service_z)
+        self.db.save_replenishment(results, dirty_up_to, full)
+        if full:
+            self.last_full = time.time()
+        return len(results)
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from flask import send_from_directory, url_for
+from werkzeug.utils import secure_filename
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+THUMBNAIL_SIZES = (40, 200)
+ONE_YEAR = 365 * 24 * 3600
+
+class ImageStore:
+    """Content-addressed product images with pre-sized thumbnails.
+
+    Uploads are stored as uploads/<sha256>.<ext>, so the same photo uploaded
+    twice is kept once. A worker thread renders square WebP thumbnails
+    (uploads/thumbs/<name>_<size>.webp) after each upload and, via backfill(),
+    for images that don't have them yet (including older uuid-named uploads).
+    Files are served from /media with immutable cache headers; until a
+    thumbnail exists, its URL falls back to the original.
+
+    Which images have thumbnails is kept in memory (from one listing of the
+    thumbs folder, plus what this process renders), so building URLs never
+    touches the filesystem; thumbnails rendered by another process are picked
+    up by a re-listing at most every rescan_interval seconds.
+    """
+
+    def __init__(self, upload_folder, sizes=THUMBNAIL_SIZES, rescan_interval=5.0):
+        self.upload_folder = upload_folder
+        self.thumb_folder = os.path.join(upload_folder, 'thumbs')
+        self.sizes = sizes
+        self.rescan_interval = rescan_interval
+        self.queue = queue.Queue()
+        self.running = False
+        self.thread = None
+        self.thumbnailed = set()  # image stems with every size rendered
+        self.scanned_at = 0.0
+        os.makedirs(self.thumb_folder, exist_ok=True)
+        self._scan()
+
+    def init_app(self, app):
+        app.add_url_rule('/media/<path:filename>', 'media', self.serve)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._thumbnail_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def backfill(self, image_paths):
+        # Queue thumbnails for images stored before they existed
+        for image_path in set(image_paths):
+            if image_path and not self.has_thumbnails(image_path):
+                self.queue.put(image_path)
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.queue.put(None)
+        self.thread.join()
+
+    def save(self, file):
+        # Returns the image_path stored on the product ('uploads/<hash>.<ext>')
+        data = file.read()
+        ext = os.path.splitext(secure_filename(file.filename or ''))[1].lower() or '.bin'
+        filename = hashlib.sha256(data).hexdigest() + ext
+        path = os.path.join(self.upload_folder, filename)
+        if not os.path.exists(path):
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        image_path = f"uploads/{filename}"
+        if not self.has_thumbnails(image_path):
+            self.queue.put(image_path)
+        return image_path
+
+    def thumbnail_name(self, image_path, size):
+        return f"thumbs/{self._stem(image_path)}_{size}.webp"
+
+    def _stem(self, image_path):
+        return os.path.splitext(os.path.basename(image_path))[0]
+
+    def _scan(self):
+        # One directory listing instead of a stat per image and size
+        found = {}
+        for name in os.listdir(self.thumb_folder):
+            stem, _, rest = name.rpartition('_')
+            if rest.endswith('.webp'):
+                found.setdefault(stem, set()).add(rest[:-len('.webp')])
+        wanted = {str(size) for size in self.sizes}
+        self.thumbnailed |= {stem for stem, sizes in found.items() if wanted <= sizes}
+        self.scanned_at = time.monotonic()
+
+    def has_thumbnails(self, image_path):
+        stem = self._stem(image_path)
+        if stem not in self.thumbnailed and time.monotonic() - self.scanned_at >= self.rescan_interval:
+            self._scan()
+        return stem in self.thumbnailed
+
+    def urls(self, image_path):
+        # {'image_url': ..., 'thumbnails': {size: url}} for an API payload
+        if not image_path:
+            return {'image_url': None, 'thumbnails': {}}
+        original = url_for('media', filename=os.path.basename(image_path))
+        if not self.has_thumbnails(image_path):
+            return {'image_url': original, 'thumbnails': {size: original for size in self.sizes}}
+        thumbnails = {size: url_for('media', filename=self.thumbnail_name(image_path, size)) for size in self.sizes}
+        return {'image_url': original, 'thumbnails': thumbnails}
+
+    def serve(self, filename):
+        # Names are content hashes (or unique uuids), so they never change
+        response = send_from_directory(self.upload_folder, filename, max_age=ONE_YEAR)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def make_thumbnails(self, image_path):
+        if Image is None:
+            return False
+        source = os.path.join(self.upload_folder, os.path.basename(image_path))
+        if not os.path.exists(source):
+            return False
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img).convert('RGBA')
+            for size in self.sizes:
+                target = os.path.join(self.upload_folder, self.thumbnail_name(image_path, size))
+                tmp = f"{target}.{os.getpid()}.tmp"
+                ImageOps.fit(img, (size, size), Image.LANCZOS).save(tmp, 'WEBP', quality=85)
+                os.replace(tmp, target)
+        self.thumbnailed.add(self._stem(image_path))
+        return True
+
+    def _thumbnail_loop(self):
+        while self.running:
+            image_path = self.queue.get()
+            if image_path is None:
+                break
+            try:
+                self.make_thumbnails(image_path)
+            except Exception as e:
+                print(f"Thumbnail error ({image_path}): {e}")
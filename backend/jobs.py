@@ -0,0 +1,226 @@
+import csv
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from database import Database
+
+class JobCancelled(Exception):
+    pass
+
+class JobContext:
+    """Handed to a job function in the worker process.
+
+    progress() records how far the job got (written at most every interval
+    seconds) and raises JobCancelled once cancellation has been requested, so
+    jobs stop at their next progress report.
+    """
+
+    def __init__(self, db, job_id, output_dir, interval=0.5):
+        self.db = db
+        self.job_id = job_id
+        self.output_dir = output_dir
+        self.interval = interval
+        self.last_report = 0.0
+
+    def progress(self, done, total=None, message=None, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        fraction = min(done / total, 1.0) if total else 0.0
+        if self.db.update_job_progress(self.job_id, round(fraction, 4), message):
+            raise JobCancelled()
+
+    def output_path(self, suffix):
+        os.makedirs(self.output_dir, exist_ok=True)
+        return os.path.join(self.output_dir, f"job_{self.job_id}{suffix}")
+
+# --- Job kinds: fn(db, params, job) -> JSON-serializable result ---
+
+def import_products(db, params, job):
+    # params: {'path': uploaded CSV}; the file is removed afterwards
+    path = params['path']
+    try:
+        with open(path, encoding='utf-8', newline='') as f:
+            total = sum(1 for _ in f) - 1
+        count = 0
+        with open(path, encoding='utf-8', newline='') as f:
+            for i, row in enumerate(csv.DictReader(f)):
+                job.progress(i, total, f"{count} imported")
+                # Flexible Key Mapping
+                name = row.get('name') or row.get('Name')
+                if not name:
+                    continue
+                try:
+                    price = float(row.get('price') or row.get('Price') or 0.0)
+                except ValueError:
+                    price = 0.0
+                category = row.get('category') or row.get('Category') or 'Uncategorized'
+                if db.add_product(name, price, "", category):
+                    count += 1
+    finally:
+        os.remove(path)
+    return {'imported_count': count, 'message': f"Imported {count} product classes."}
+
+def export_data(db, params, job):
+    # params: {'kind', 'format', 'gzip', 'since', 'since_id'}; written to the job output directory
+    from database import EXPORTS
+    from export import stream_export, FORMATS
+    kind, fmt = params.get('kind'), params.get('format', 'csv')
+    if kind not in EXPORTS or fmt not in FORMATS:
+        raise ValueError("Unknown export")
+    compress = bool(params.get('gzip'))
+    filename = f"{kind}.{fmt}" + ('.gz' if compress else '')
+    path = job.output_path('_' + filename)
+    written = 0
+    try:
+        with open(path, 'wb') as f:
+            for chunk in stream_export(db, kind, fmt, params.get('since'), params.get('since_id'), compress):
+                f.write(chunk)
+                written += len(chunk)
+                job.progress(0, None, f"{written} bytes written")
+    except BaseException:
+        os.remove(path)
+        raise
+    return {'path': path, 'filename': filename, 'bytes': written}
+
+def sync_warehouses(db, params, job):
+    from sync_warehouses import sync_data
+    summary = sync_data(db.db_name)
+    if summary is None:
+        raise RuntimeError("Warehouse sync failed")
+    return summary
+
+def reconcile_stock(db, params, job):
+    # Products whose total disagrees with their warehouse rows (should be none)
+    mismatches = db.check_stock_totals()
+    return {'mismatches': mismatches}
+
+def rebuild_replenishment(db, params, job):
+    from forecast import ReplenishmentForecaster
+    forecaster = ReplenishmentForecaster(db, **{k: params[k] for k in
+                                                ('window_days', 'lead_time_days', 'service_z') if k in params})
+    return {'rows': forecaster.run_once(full=True)}
+
+JOBS = {
+    'import_products': import_products,
+    'export': export_data,
+    'sync_warehouses': sync_warehouses,
+    'reconcile_stock': reconcile_stock,
+    'rebuild_replenishment': rebuild_replenishment,
+}
+
+def run_job(db_name, job_id, fn, params, output_dir):
+    # Worker process entry point: the job row carries status, progress and result.
+    # fn is the job function itself (pickled by name), so kinds registered in JOBS
+    # after import resolve in a spawned worker too
+    db = Database(db_name)
+    if not db.start_job(job_id):
+        return
+    job = JobContext(db, job_id, output_dir)
+    try:
+        result = fn(db, params, job)
+    except JobCancelled:
+        db.finish_job(job_id, 'cancelled', message="Cancelled")
+    except Exception as e:
+        db.finish_job(job_id, 'failed', message=str(e))
+    else:
+        db.finish_job(job_id, 'done', result)
+
+class JobRunner:
+    """Runs long operations (imports, exports, reconciliation, rebuilds) off the request path.
+
+    Jobs are rows in the jobs table, executed by a pool of max_workers
+    processes. Workers are spawned rather than forked, so they don't inherit
+    the app's threads, locks or open connections; they open their own
+    database connections and write progress to the job row. updates()
+    returns the jobs submitted here whose status or progress changed since
+    the last call, for pushing to clients.
+
+    max_workers is per app process, while max_pending counts queued and
+    running jobs in the jobs table, so it is shared by every process: with
+    N processes up to N * max_workers jobs run at once, but no more than
+    max_pending are ever accepted.
+    """
+
+    def __init__(self, db, output_dir, max_workers=2, max_pending=20):
+        self.db = db
+        self.output_dir = output_dir
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pool = None
+        self.futures = {}  # job_id -> Future
+        self.seen = {}     # job_id -> (status, progress, message) last reported
+
+    def start(self):
+        if self.pool:
+            return
+        self.pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        self.recover()
+
+    def recover(self):
+        # Jobs whose owning process has exited (a restart) can never finish: fail them
+        failed = []
+        for pid, job_ids in self.db.get_active_job_owners().items():
+            try:
+                if pid:
+                    os.kill(pid, 0)
+                    continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+            for job_id in job_ids:
+                if self.db.finish_job(job_id, 'failed', message="Interrupted by a restart"):
+                    failed.append(job_id)
+        return failed
+
+    def stop(self):
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def submit(self, kind, params=None):
+        # Returns the job id, or None when too many jobs are pending
+        if kind not in JOBS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        self.start()
+        job_id = self.db.create_job(kind, params, max_pending=self.max_pending)
+        if job_id is None:
+            return None
+        future = self.pool.submit(run_job, self.db.db_name, job_id, JOBS[kind], params or {}, self.output_dir)
+        self.futures[job_id] = future
+        self.seen[job_id] = None
+        future.add_done_callback(lambda f: self._job_exited(job_id, f))
+        return job_id
+
+    def _job_exited(self, job_id, future):
+        self.futures.pop(job_id, None)
+        if future.cancelled():
+            self.db.finish_job(job_id, 'cancelled', message="Cancelled")
+        elif future.exception() is not None:
+            # The worker died (or could not start): the job never recorded an outcome
+            self.db.finish_job(job_id, 'failed', message=str(future.exception()) or "Worker process failed")
+
+    def cancel(self, job_id):
+        # Returns the job status afterwards, or None if it had already finished
+        future = self.futures.get(job_id)
+        status = self.db.cancel_job(job_id)
+        if future is not None and status == 'cancelled':
+            future.cancel()
+        return status
+
+    def updates(self):
+        if not self.seen:
+            return []
+        changed = []
+        for job in self.db.get_jobs(job_ids=list(self.seen), limit=len(self.seen)):
+            state = (job['status'], job['progress'], job['message'])
+            if state != self.seen.get(job['id']):
+                changed.append(job)
+                self.seen[job['id']] = state
+            if job['status'] not in ('queued', 'running'):
+                del self.seen[job['id']]
+        return changed
@@ -0,0 +1,50 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+class StockSnapshotter:
+    """Writes periodic stock snapshots for point-in-time queries.
+
+    Every stock change is appended to stock_movements by triggers; a snapshot
+    copies warehouse_stock as of a ledger position so Database.get_stock_at()
+    only replays the movements after the nearest one. A snapshot is taken once
+    interval seconds have passed since the last one, or sooner when
+    max_movements have accumulated, checked every poll seconds.
+    """
+
+    def __init__(self, db, interval=24 * 3600, max_movements=50000, poll=60):
+        self.db = db
+        self.interval = interval
+        self.max_movements = max_movements
+        self.poll = poll
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._snapshot_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def due(self):
+        status = self.db.get_ledger_status()
+        if not status['pending']:
+            return False
+        if status['pending'] >= self.max_movements or status['taken_at'] is None:
+            return True
+        taken_at = datetime.strptime(status['taken_at'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - taken_at).total_seconds() >= self.interval
+
+    def _snapshot_loop(self):
+        while self.running:
+            try:
+                if self.due():
+                    self.db.take_stock_snapshot()
+            except Exception as e:
+                print(f"Stock snapshot error: {e}")
+            time.sleep(self.poll)
@@ -1,4 +1,5 @@
 import sqlite3
+import sys
 DB_NAME = "inventory.db"
 
 def migrate():
@@ -29,5 +30,24 @@ def migrate():
     conn.close()
     print("Migration complete.")
 
+def enable_incremental_vacuum(db_name=DB_NAME):
+    # Offline step (stop the app first): switching an existing database to incremental
+    # auto_vacuum takes one full VACUUM, which holds the write lock until it finishes.
+    # Databases created by the app are incremental already.
+    conn = sqlite3.connect(db_name)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            print("Database already uses incremental auto_vacuum.")
+            return
+        print("Converting database to incremental auto_vacuum (full VACUUM)...")
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        print("Conversion complete.")
+    finally:
+        conn.close()
+
 if __name__ == "__main__":
-    migrate()
+    if '--incremental-vacuum' in sys.argv[1:]:
+        enable_incremental_vacuum()
+    else:
+        migrate()
@@ -0,0 +1,78 @@
+import threading
+
+class PickQueue:
+    """In-memory pick queue per warehouse.
+
+    Holds the open allocations of every active order, grouped by warehouse and
+    order. It is seeded once from the database and refreshed per order after
+    create_order, record_pick and update_order_status, so workers never re-run
+    the grouped active-orders query.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        self.orders = {}  # warehouse_id -> {order_id: order}
+
+    def load(self):
+        rows = self.db.get_open_allocations()
+        with self.lock:
+            self.orders = {}
+            for row in rows:
+                self._add_allocation(row)
+
+    def refresh_order(self, order_id):
+        return self.refresh_orders([order_id])
+
+    def refresh_orders(self, order_ids):
+        # Re-read the given orders; returns the warehouses whose queue changed
+        rows = self.db.get_open_allocations(order_ids)
+        with self.lock:
+            affected = set()
+            for wid, orders in self.orders.items():
+                for order_id in order_ids:
+                    if orders.pop(order_id, None):
+                        affected.add(wid)
+            for row in rows:
+                self._add_allocation(row)
+                affected.add(row['warehouse_id'])
+        return affected
+
+    def get_queue(self, warehouse_id):
+        # Orders with something left to pick in this warehouse, oldest first
+        with self.lock:
+            orders = [
+                dict(order, items=[dict(item) for item in order['items']])
+                for order in self.orders.get(int(warehouse_id), {}).values()
+                if order['remaining_qty'] > 0
+            ]
+        orders.sort(key=lambda o: (o['timestamp'], o['id']))
+        return orders
+
+    def _add_allocation(self, row):
+        orders = self.orders.setdefault(row['warehouse_id'], {})
+        order = orders.get(row['order_id'])
+        if not order:
+            order = {
+                'id': row['order_id'],
+                'business_name': row['business_name'],
+                'timestamp': row['timestamp'],
+                'status': row['status'],
+                'worker_name': row['worker_name'],
+                'item_count': 0,
+                'total_qty': 0,
+                'remaining_qty': 0,
+                'items': [],
+            }
+            orders[row['order_id']] = order
+
+        order['items'].append({
+            'allocation_id': row['id'],
+            'product_id': row['product_id'],
+            'name': row['name'],
+            'quantity': row['quantity'],
+            'picked_quantity': row['picked_quantity'],
+        })
+        order['item_count'] += 1
+        order['total_qty'] += row['quantity']
+        order['remaining_qty'] += row['quantity'] - row['picked_quantity']
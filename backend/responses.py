@@ -0,0 +1,49 @@
+import gzip
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify() through orjson when it is installed, the stdlib otherwise.
+
+    Keys are not sorted (clients don't rely on order) and non-string keys such
+    as warehouse ids in stock_breakdown are allowed, matching the stdlib output.
+    """
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is None:
+            return super().response(obj)
+        # Skip the bytes -> str -> bytes round trip
+        body = orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+def compress_responses(app, threshold=1024, level=3, mimetypes=('application/json',)):
+    # gzip buffered JSON responses above threshold bytes for clients that accept it
+    @app.after_request
+    def gzip_response(response):
+        if (response.mimetype not in mimetypes
+                or response.direct_passthrough
+                or response.is_streamed
+                or response.status_code < 200 or response.status_code >= 300
+                or 'Content-Encoding' in response.headers
+                or not request.accept_encodings['gzip']):
+            return response
+        body = response.get_data()
+        if len(body) < threshold:
+            return response
+        response.set_data(gzip.compress(body, level, mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
+    return gzip_response
@@ -0,0 +1,246 @@
+import os
+import threading
+import time
+from functools import partial
+from database import Database, DB_NAME
+
+ARCHIVE_DB_NAME = os.environ.get('ARCHIVE_DB_NAME', 'inventory_archive.db')
+
+class RetentionManager:
+    """Keeps scans, item_instances and item_lots bounded.
+
+    Old scans are rolled into scan_daily (one row per day and barcode), picked or
+    shipped instances and fully picked lots older than the cutoff are moved to an
+    attached archive database and freed pages are returned with incremental vacuum. Work is done in
+    small transactions sized to hold the write lock for at most lock_budget_ms: each run starts
+    with a calibration batch of calibration_size rows and sizes the next batches from the time it
+    took, up to batch_size.
+
+    Retention writes on its own connection rather than through the single writer
+    (write_queue.WriteQueue): it needs the archive database ATTACHed, which cannot be done inside
+    the writer's group transaction, and each of its transactions is already bounded by the lock
+    budget, so the writer waits at most that long for the lock (within its connect timeout).
+
+    With warehouse shards (see Database), the core file and then each shard are processed in
+    turn, each pass with only its own file writable (and the core file, for scan_daily).
+    """
+
+    def __init__(self, db, archive_path=ARCHIVE_DB_NAME, scan_days=30, instance_days=90,
+                 lock_budget_ms=50, batch_size=500, calibration_size=50, interval=3600):
+        self.db = db
+        self.archive_path = archive_path
+        self.scan_days = scan_days
+        self.instance_days = instance_days
+        self.lock_budget = lock_budget_ms / 1000.0
+        self.batch_size = batch_size
+        self.calibration_size = min(calibration_size, batch_size)
+        self.interval = interval
+        self.vacuum_warned = False
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._retention_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"Retention started (scans {self.scan_days}d, instances {self.instance_days}d)")
+
+    def stop(self):
+        self.running = False
+
+    def _retention_loop(self):
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Retention error: {e}")
+            time.sleep(self.interval)
+
+    def _get_connection(self, lock=None):
+        conn = self.db._get_connection(lock=lock)
+        conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS archive.item_instances (
+                id INTEGER PRIMARY KEY,
+                product_id INTEGER NOT NULL,
+                warehouse_id INTEGER,
+                barcode TEXT NOT NULL,
+                scan_time DATETIME,
+                notes TEXT,
+                status TEXT,
+                lot_id INTEGER,
+                archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        columns = [row['name'] for row in conn.execute("PRAGMA archive.table_info(item_instances)")]
+        if 'lot_id' not in columns:
+            conn.execute("ALTER TABLE archive.item_instances ADD COLUMN lot_id INTEGER")
+        conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_product ON item_instances(product_id)")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS archive.item_lots (
+                id INTEGER PRIMARY KEY,
+                product_id INTEGER NOT NULL,
+                warehouse_id INTEGER,
+                barcode TEXT NOT NULL,
+                received_at DATETIME,
+                notes TEXT,
+                quantity INTEGER,
+                picked_quantity INTEGER,
+                archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_lots_product ON item_lots(product_id)")
+        return conn
+
+    def run_once(self):
+        stats = dict.fromkeys(('scans_rolled_up', 'instances_archived', 'lots_archived', 'pages_freed'), 0)
+        for warehouse_id in [None] + sorted(self.db.shards):
+            schema = 'main' if warehouse_id is None else f"shard_{warehouse_id}"
+            conn = self._get_connection(lock=[] if warehouse_id is None else [warehouse_id])
+            try:
+                stats['scans_rolled_up'] += self._run_batches(
+                    conn, partial(self._rollup_scans_batch, schema=schema), f"-{int(self.scan_days)} days")
+                stats['instances_archived'] += self._run_batches(
+                    conn, partial(self._archive_instances_batch, schema=schema), f"-{int(self.instance_days)} days")
+                # After the instances, so a lot only goes once no unit in its file refers to it
+                stats['lots_archived'] += self._run_batches(
+                    conn, partial(self._archive_lots_batch, schema=schema), f"-{int(self.instance_days)} days")
+                stats['pages_freed'] += self._vacuum(conn, schema)
+            finally:
+                conn.close()
+        print(f"Retention pass: {stats}")
+        return stats
+
+    def _run_batches(self, conn, batch_fn, cutoff):
+        # Size each write transaction from the last one's rows per second so it stays inside the
+        # lock budget; start small, since the cost per row is unknown until a batch has run
+        total = 0
+        batch_size = self.calibration_size
+        while True:
+            start = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                moved = batch_fn(conn, cutoff, batch_size)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            elapsed = time.perf_counter() - start
+
+            total += moved
+            if moved < batch_size:
+                return total
+
+            # Aim at half the budget (per-row cost varies between batches), at most doubling
+            target = int(batch_size * self.lock_budget / 2 / max(elapsed, 1e-6))
+            batch_size = max(10, min(target, batch_size * 2, self.batch_size))
+
+            # Give scanners and pickers a chance to take the write lock
+            time.sleep(0)
+
+    def _rollup_scans_batch(self, conn, cutoff, batch_size, schema='main'):
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT MAX(id) as max_id, COUNT(*) as count FROM (
+                SELECT id FROM {schema}.scans
+                WHERE timestamp < datetime('now', ?)
+                ORDER BY id
+                LIMIT ?
+            )
+        ''', (cutoff, batch_size))
+        row = cursor.fetchone()
+        if not row['count']:
+            return 0
+
+        # 1. Aggregate into the daily table
+        cursor.execute(f'''
+            INSERT INTO main.scan_daily (day, barcode, scan_count, quantity)
+            SELECT date(timestamp), barcode, COUNT(*), SUM(quantity)
+            FROM {schema}.scans
+            WHERE timestamp < datetime('now', ?) AND id <= ?
+            GROUP BY date(timestamp), barcode
+            ON CONFLICT(day, barcode)
+            DO UPDATE SET scan_count = scan_count + excluded.scan_count,
+                          quantity = quantity + excluded.quantity
+        ''', (cutoff, row['max_id']))
+
+        # 2. Drop the raw rows
+        cursor.execute(f'''
+            DELETE FROM {schema}.scans WHERE timestamp < datetime('now', ?) AND id <= ?
+        ''', (cutoff, row['max_id']))
+        return cursor.rowcount
+
+    def _archive_instances_batch(self, conn, cutoff, batch_size, schema='main'):
+        cursor = conn.cursor()
+        cursor.execute("DROP TABLE IF EXISTS temp.archive_batch")
+        cursor.execute(f'''
+            CREATE TEMP TABLE archive_batch AS
+            SELECT id FROM {schema}.item_instances
+            WHERE status IN ('Picked', 'Shipped') AND scan_time < datetime('now', ?)
+            LIMIT ?
+        ''', (cutoff, batch_size))
+
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO archive.item_instances
+                (id, product_id, warehouse_id, barcode, scan_time, notes, status, lot_id)
+            SELECT id, product_id, warehouse_id, barcode, scan_time, notes, status, lot_id
+            FROM {schema}.item_instances
+            WHERE id IN (SELECT id FROM temp.archive_batch)
+        ''')
+        cursor.execute(f"DELETE FROM {schema}.item_instances WHERE id IN (SELECT id FROM temp.archive_batch)")
+        moved = cursor.rowcount
+        cursor.execute("DROP TABLE temp.archive_batch")
+        return moved
+
+    def _archive_lots_batch(self, conn, cutoff, batch_size, schema='main'):
+        # Lots with nothing left in stock, received before the cutoff
+        cursor = conn.cursor()
+        cursor.execute("DROP TABLE IF EXISTS temp.archive_batch")
+        cursor.execute(f'''
+            CREATE TEMP TABLE archive_batch AS
+            SELECT l.id FROM {schema}.item_lots l
+            WHERE l.picked_quantity >= l.quantity AND l.received_at < datetime('now', ?)
+              AND NOT EXISTS (SELECT 1 FROM {schema}.item_instances i WHERE i.lot_id = l.id)
+            LIMIT ?
+        ''', (cutoff, batch_size))
+
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO archive.item_lots
+                (id, product_id, warehouse_id, barcode, received_at, notes, quantity, picked_quantity)
+            SELECT id, product_id, warehouse_id, barcode, received_at, notes, quantity, picked_quantity
+            FROM {schema}.item_lots
+            WHERE id IN (SELECT id FROM temp.archive_batch)
+        ''')
+        cursor.execute(f"DELETE FROM {schema}.item_lots WHERE id IN (SELECT id FROM temp.archive_batch)")
+        moved = cursor.rowcount
+        cursor.execute("DROP TABLE temp.archive_batch")
+        return moved
+
+    def _vacuum(self, conn, schema='main', pages_per_step=200):
+        cursor = conn.cursor()
+        cursor.execute(f"PRAGMA {schema}.auto_vacuum")
+        if cursor.fetchone()[0] != 2:
+            # Databases created before incremental auto_vacuum need a full VACUUM to switch,
+            # which would hold the write lock far beyond the budget: that is an offline step
+            # (migrate_db.py --incremental-vacuum). Freed pages are still reused by SQLite.
+            if not self.vacuum_warned:
+                print("Retention: incremental vacuum unavailable, run migrate_db.py --incremental-vacuum offline")
+                self.vacuum_warned = True
+            return 0
+
+        freed = 0
+        while True:
+            cursor.execute(f"PRAGMA {schema}.freelist_count")
+            free_pages = cursor.fetchone()[0]
+            if free_pages == 0:
+                return freed
+            cursor.execute(f"PRAGMA {schema}.incremental_vacuum({pages_per_step})")
+            cursor.fetchall()
+            freed += min(free_pages, pages_per_step)
+            time.sleep(0)
+
+if __name__ == "__main__":
+    RetentionManager(Database(DB_NAME)).run_once()
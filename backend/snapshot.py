@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import threading
+import time
+from database import Database
+
+SNAPSHOT_DB_NAME = os.environ.get('SNAPSHOT_DB_NAME', 'inventory_snapshot.db')
+
+class ReportSnapshot:
+    """Read-only copy of the live database for reports.
+
+    The copy is taken with the sqlite3 online backup API into a temporary file
+    and swapped in with os.replace, so reports opened on the previous copy keep
+    reading it undisturbed. A background thread refreshes it every interval
+    seconds or after max_writes writes to the live database, whichever comes
+    first. Reports read through `reader`, a read-only Database on the copy; a
+    copy older than max_age seconds (three intervals by default), such as one
+    left behind by an earlier run, is not ready.
+
+    With warehouse shards (see Database), each shard is copied to snapshot_path + '.shards'
+    before the core file; every file is copied in a read transaction of its own.
+    """
+
+    def __init__(self, db, snapshot_path=SNAPSHOT_DB_NAME, interval=300, max_writes=1000, poll=1.0,
+                 max_age=None):
+        self.db = db
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self.max_age = max_age if max_age is not None else 3 * interval
+        self.max_writes = max_writes
+        self.poll = poll
+        self.shard_dir = snapshot_path + '.shards' if db.shard_dir else None
+        self.reader = Database(snapshot_path, read_only=True, shard_dir=self.shard_dir)
+        self.taken_at = None
+        self.write_count = 0
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.refresh()
+        self.running = True
+        self.thread = threading.Thread(target=self._snapshot_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"Report snapshot started (every {self.interval}s or {self.max_writes} writes)")
+
+    def stop(self):
+        self.running = False
+
+    def ready(self):
+        age = self.age()
+        return age is not None and age <= self.max_age
+
+    def age(self):
+        # Seconds since the snapshot file was written (by this or another process), None before the first one
+        try:
+            return time.time() - os.path.getmtime(self.snapshot_path)
+        except OSError:
+            return None
+
+    def refresh(self):
+        with self.lock:
+            write_count = self.db.write_count
+            taken_at = time.time()
+            if self.shard_dir:
+                os.makedirs(self.shard_dir, exist_ok=True)
+                for warehouse_id, path in sorted(self.db.shards.items()):
+                    self._copy(sqlite3.connect(path), os.path.join(self.shard_dir, f"warehouse_{warehouse_id}.db"))
+            self._copy(self.db._get_connection(), self.snapshot_path)
+            self.taken_at = taken_at
+            self.write_count = write_count
+
+    def _copy(self, src, path):
+        tmp_path = path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        # One step (pages=-1): a single read transaction on the live database,
+        # which in WAL mode never blocks writers
+        dst = sqlite3.connect(tmp_path)
+        try:
+            src.backup(dst)
+            # Rollback journal so the copy can be opened read-only without -wal/-shm files
+            dst.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            dst.close()
+            src.close()
+        os.replace(tmp_path, path)
+
+    def _due(self):
+        if self.taken_at is None:
+            return True
+        if time.time() - self.taken_at >= self.interval:
+            return True
+        return self.db.write_count - self.write_count >= self.max_writes
+
+    def _snapshot_loop(self):
+        while self.running:
+            try:
+                if self._due():
+                    self.refresh()
+            except Exception as e:
+                print(f"Snapshot error: {e}")
+            time.sleep(self.poll)
@@ -26,6 +26,11 @@ socket.on('history_update', () => {
     loadData();
 });
 
+socket.on('low_stock', (data) => {
+    console.log("Low stock:", data);
+    loadAnalytics();
+});
+
 socket.on('order_update', (data) => {
     console.log("Order update received:", data);
     loadOrders();
@@ -38,15 +43,29 @@ socket.on('order_update', (data) => {
 
 // --- Init ---
 async function loadData() {
-    await loadWarehouses();
-    renderInventory();
-    loadOrders();
-    loadAnalytics();
+    // First paint in one round trip; the time-series chart loads on its own
+    try {
+        const res = await fetch('/api/bootstrap');
+        const data = await res.json();
+        renderWarehouses(data.warehouses);
+        renderInventory(data.products);
+        if (ordersFiltered()) {
+            loadOrders();
+        } else {
+            renderOrders(data.orders);
+        }
+        renderAnalytics(data.analytics);
+    } catch (e) {
+        console.error("Error loading dashboard", e);
+    }
+    loadTimeseries();
 }
 
-async function renderInventory() {
-    const res = await fetch('/api/products');
-    const products = await res.json();
+async function renderInventory(products) {
+    if (!products) {
+        const res = await fetch('/api/products');
+        products = await res.json();
+    }
     let html = '';
     products.forEach(item => {
         const isSelected = selectedProductId === item.id;
@@ -55,7 +74,7 @@ async function renderInventory() {
         const q2 = breakdown[2] || 0;
         const q3 = breakdown[3] || 0;
         const packSize = item.pack_size || 1;
-        const imgUrl = item.image_path ? `/static/${item.image_path}` : 'https://placehold.co/40x40?text=No+Img';
+        const imgUrl = item.image_path ? item.thumbnails[40] : 'https://placehold.co/40x40?text=No+Img';
 
         html += `
         <tr class="${isSelected ? 'pending-row' : ''}">
@@ -101,20 +120,10 @@ function updateHistoryTable(history) {
 
 // --- Analytics & Orders ---
 
-async function loadOrders() {
-    const container = document.getElementById('orders-list-body');
-    if (!container) return;
-
-    try {
-        const res = await fetch('/api/orders');
-        const orders = await res.json();
-
-        if (orders.length === 0) {
-            container.innerHTML = '<tr><td colspan="6" style="text-align:center; padding: 2rem; color: #666;">אין הזמנות עדיין</td></tr>';
-            return;
-        }
+let ordersCursor = null;
 
-        container.innerHTML = orders.map(o => `
+function orderRow(o) {
+    return `
             <tr>
                 <td>${o.id}</td>
                 <td><strong>${o.business_name}</strong></td>
@@ -125,12 +134,72 @@ async function loadOrders() {
                     <button class="btn btn-sm" onclick="viewOrderDetails(${o.id})">📄 פרטים</button>
                 </td>
             </tr>
-        `).join('');
+        `;
+}
+
+function ordersFiltered() {
+    const status = document.getElementById('orders-filter-status');
+    const business = document.getElementById('orders-filter-business');
+    return Boolean((status && status.value) || (business && business.value.trim()));
+}
+
+async function loadOrders(append = false) {
+    const container = document.getElementById('orders-list-body');
+    if (!container) return;
+
+    const params = new URLSearchParams({ limit: 50 });
+    const status = document.getElementById('orders-filter-status');
+    const business = document.getElementById('orders-filter-business');
+    if (status && status.value) params.set('status', status.value);
+    if (business && business.value.trim()) params.set('business', business.value.trim());
+    if (append && ordersCursor) {
+        params.set('before_ts', ordersCursor.before_ts);
+        params.set('before_id', ordersCursor.before_id);
+    }
+
+    try {
+        const res = await fetch(`/api/orders?${params}`);
+        renderOrders(await res.json(), append);
     } catch (e) {
         console.error("Error loading orders", e);
     }
 }
 
+function renderOrders(data, append = false) {
+    const container = document.getElementById('orders-list-body');
+    if (!container) return;
+    ordersCursor = data.next_cursor;
+
+    const moreBtn = document.getElementById('orders-load-more');
+    if (moreBtn) moreBtn.style.display = ordersCursor ? 'inline-block' : 'none';
+    const total = document.getElementById('orders-total');
+    if (total) total.innerText = data.total;
+
+    if (!append && data.orders.length === 0) {
+        container.innerHTML = '<tr><td colspan="6" style="text-align:center; padding: 2rem; color: #666;">אין הזמנות עדיין</td></tr>';
+        return;
+    }
+
+    const html = data.orders.map(orderRow).join('');
+    if (append) {
+        container.insertAdjacentHTML('beforeend', html);
+    } else {
+        container.innerHTML = html;
+    }
+}
+
+function printFilteredOrders() {
+    // One print document for every order in the selected status (pending by default)
+    const status = document.getElementById('orders-filter-status');
+    window.open(`/print/orders?status=${(status && status.value) || 'PENDING'}`, '_blank');
+}
+
+let ordersFilterTimer = null;
+function filterOrders() {
+    clearTimeout(ordersFilterTimer);
+    ordersFilterTimer = setTimeout(() => loadOrders(), 200);
+}
+
 async function viewOrderDetails(orderId) {
     try {
         const res = await fetch(`/api/orders/${orderId}`);
@@ -174,11 +243,21 @@ function closeOrderDetailsModal() {
 async function loadAnalytics() {
     try {
         const res = await fetch('/api/analytics');
-        const data = await res.json();
+        renderAnalytics(await res.json());
+    } catch (e) {
+        console.error("Analytics error", e);
+    }
+}
 
+function renderAnalytics(data) {
+    try {
         // Update Stats
         document.getElementById('stat-orders').textContent = data.total_orders;
         document.getElementById('stat-revenue').textContent = '₪' + data.total_revenue.toLocaleString();
+        const ageElem = document.getElementById('snapshot-age');
+        if (ageElem) {
+            ageElem.textContent = data.snapshot_age == null ? '' : `נתונים נכונים ל-${Math.round(data.snapshot_age / 60)} דקות אחורה`;
+        }
 
         // New metrics
         // New metrics - Fixed selectors
@@ -224,6 +303,27 @@ async function loadAnalytics() {
     }
 }
 
+async function loadTimeseries() {
+    // Figure JSON comes ready for Plotly from /api/analytics/timeseries
+    const params = new URLSearchParams({
+        metric: document.getElementById('timeseries-metric').value,
+        bucket: document.getElementById('timeseries-bucket').value,
+        group: document.getElementById('timeseries-group').value,
+        days: document.getElementById('timeseries-bucket').value === 'hour' ? 7 : 90
+    });
+    try {
+        const res = await fetch(`/api/analytics/timeseries?${params}`);
+        const fig = await res.json();
+        if (fig.data.length > 0) {
+            Plotly.react('chart-timeseries', fig.data, fig.layout, { displayModeBar: false, responsive: true });
+        } else {
+            document.getElementById('chart-timeseries').innerHTML = '<p style="text-align:center; color:#666; padding-top:2rem;">אין נתונים עדיין</p>';
+        }
+    } catch (e) {
+        console.error("Timeseries error", e);
+    }
+}
+
 function updateAnalytics(history) {
     // OLD live update for "Recent Scans Activity"
     // We will keep this as a separate chart
@@ -455,10 +555,19 @@ function setOrderQty(id, val, maxStock) {
     updateOrderTotal();
 }
 
+let searchTimeout;
 function filterOrderList() {
-    const query = document.getElementById('order-search').value.toLowerCase();
-    const filtered = allProductsCache.filter(p => p.name.toLowerCase().includes(query));
-    renderOrderList(filtered);
+    const query = document.getElementById('order-search').value.trim();
+    clearTimeout(searchTimeout);
+    if (!query) {
+        renderOrderList(allProductsCache);
+        return;
+    }
+    // Server-side FTS search instead of filtering the whole catalogue in the browser
+    searchTimeout = setTimeout(async () => {
+        const res = await fetch(`/api/products/search?q=${encodeURIComponent(query)}&limit=50`);
+        renderOrderList(await res.json());
+    }, 150);
 }
 
 function changeOrderQty(id, delta, maxStock) {
@@ -571,7 +680,7 @@ async function viewInstances(productId, name) {
     instancesList.innerHTML = instances.length ? instances.map(inst => `
         <tr>
             <td>${new Date(inst.scan_time).toLocaleString('he-IL')}</td>
-            <td><code style="color: #bb86fc;">${inst.barcode}</code></td>
+            <td><code style="color: #bb86fc;">${inst.barcode}</code>${inst.quantity > 1 ? ` <span style="color:#aaa;">×${inst.quantity - inst.picked_quantity}/${inst.quantity}</span>` : ''}</td>
             <td>${inst.notes || '-'}</td>
         </tr>`).join('') : '<tr><td colspan="3">אין רשומות</td></tr>';
 }
@@ -582,13 +691,7 @@ function testScan() {
     if (code) handleIncomingScan(code);
 }
 
-async function loadWarehouses() {
-    try {
-        const res = await fetch('/api/warehouses');
-        const warehouses = await res.json();
-        const selector = document.getElementById('warehouse-selector');
-        selector.innerHTML = warehouses.map(w => `<option value="${w.id}">${w.name}</option>`).join('');
-    } catch (e) {
-        console.error("Failed to load warehouses");
-    }
+function renderWarehouses(warehouses) {
+    const selector = document.getElementById('warehouse-selector');
+    selector.innerHTML = warehouses.map(w => `<option value="${w.id}">${w.name}</option>`).join('');
 }
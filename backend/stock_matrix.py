@@ -0,0 +1,209 @@
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class StockMatrix:
+    """Product x warehouse stock held in RAM.
+
+    quantities[product_id, column] is a NumPy int64 array indexed directly by
+    product id (ids are dense autoincrement values) and by a dense column per
+    warehouse id; unit_value[product_id] is price * pack_size. load() reads a
+    consistent copy of warehouse_stock and remembers the stock_movements
+    position it corresponds to; sync() applies the ledger rows after it. The
+    Database calls sync() after each of its stock writes (write-through);
+    reads never touch the database. Writes made by other processes are picked
+    up by the background thread every sync_interval seconds, and check()
+    compares the matrix with warehouse_stock every check_interval seconds and
+    reloads on drift.
+    """
+
+    def __init__(self, db, check_interval=300, sync_interval=1):
+        if np is None:
+            raise RuntimeError("numpy is required for the stock matrix")
+        self.db = db
+        self.check_interval = check_interval
+        self.sync_interval = sync_interval
+        self.lock = threading.RLock()
+        self.quantities = np.zeros((1, 0), dtype=np.int64)
+        self.unit_value = np.zeros(1, dtype=np.float64)
+        self.columns = {}  # warehouse_id -> column
+        self.movement_id = 0
+        self.max_product_id = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._check_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        # Waits for a sync in progress, so nothing touches the database after this returns
+        if not self.running:
+            return
+        self.running = False
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def _check_loop(self):
+        last_check = time.monotonic()
+        while self.running:
+            time.sleep(min(self.sync_interval, self.check_interval))
+            if not self.running:
+                break
+            try:
+                if time.monotonic() - last_check >= self.check_interval:
+                    last_check = time.monotonic()
+                    mismatches = self.check()
+                    if mismatches:
+                        print(f"Stock matrix drifted on {len(mismatches)} rows, reloaded")
+                else:
+                    self.sync()
+            except Exception as e:
+                print(f"Stock matrix check error: {e}")
+
+    def _read_state(self, conn):
+        # One read transaction, so stock rows and ledger position agree (WAL snapshot). Both come
+        # from the core file: sharded, its warehouse_stock is the mirror the ledger describes
+        conn.execute("BEGIN")
+        try:
+            movement_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM stock_movements").fetchone()[0]
+            products = conn.execute("SELECT id, COALESCE(price, 0) * COALESCE(pack_size, 1) FROM products").fetchall()
+            warehouses = [row[0] for row in conn.execute("SELECT id FROM warehouses ORDER BY id")]
+            stock = conn.execute("SELECT product_id, warehouse_id, quantity FROM main.warehouse_stock").fetchall()
+        finally:
+            conn.execute("COMMIT")
+        return movement_id, products, warehouses, stock
+
+    def _build(self, products, warehouses, stock):
+        columns = {wid: i for i, wid in enumerate(warehouses)}
+        for _, wid, _ in stock:
+            columns.setdefault(wid, len(columns))
+        size = max([pid for pid, _ in products] + [pid for pid, _, _ in stock] + [0]) + 1
+        quantities = np.zeros((size, len(columns)), dtype=np.int64)
+        unit_value = np.zeros(size, dtype=np.float64)
+        if products:
+            ids, values = zip(*products)
+            unit_value[list(ids)] = values
+        if stock:
+            pids, wids, qtys = zip(*stock)
+            quantities[list(pids), [columns[w] for w in wids]] = qtys
+        return quantities, unit_value, columns
+
+    def load(self):
+        conn = self.db._get_connection()
+        conn.row_factory = None
+        try:
+            movement_id, products, warehouses, stock = self._read_state(conn)
+        finally:
+            conn.close()
+        quantities, unit_value, columns = self._build(products, warehouses, stock)
+        with self.lock:
+            self.quantities, self.unit_value, self.columns = quantities, unit_value, columns
+            self.movement_id = movement_id
+            self.max_product_id = len(unit_value) - 1
+
+    def _grow(self, max_pid, warehouse_ids):
+        # Room for new products (doubling) and new warehouse columns
+        rows = self.quantities.shape[0]
+        if max_pid >= rows:
+            extra = max(max_pid + 1, rows * 2) - rows
+            self.quantities = np.pad(self.quantities, ((0, extra), (0, 0)))
+            self.unit_value = np.pad(self.unit_value, (0, extra))
+        new = [wid for wid in warehouse_ids if wid not in self.columns]
+        for wid in new:
+            self.columns[wid] = len(self.columns)
+        if new:
+            self.quantities = np.pad(self.quantities, ((0, 0), (0, len(new))))
+
+    def sync(self):
+        # Apply ledger rows and new products since the last sync; returns the number of movements.
+        # The queries run outside the lock, so RAM reads never wait on the database
+        with self.lock:
+            movement_id, max_product_id = self.movement_id, self.max_product_id
+        conn = self.db._get_connection()
+        conn.row_factory = None
+        try:
+            movements = conn.execute(
+                "SELECT id, product_id, warehouse_id, delta FROM stock_movements WHERE id > ? ORDER BY id",
+                (movement_id,)).fetchall()
+            products = conn.execute(
+                "SELECT id, COALESCE(price, 0) * COALESCE(pack_size, 1) FROM products WHERE id > ?",
+                (max_product_id,)).fetchall()
+        finally:
+            conn.close()
+
+        with self.lock:
+            # A concurrent sync (or load) may have applied part of what was read
+            movements = [m for m in movements if m[0] > self.movement_id]
+            if products:
+                ids, values = zip(*products)
+                self._grow(max(ids), [])
+                self.unit_value[list(ids)] = values
+                self.max_product_id = max(self.max_product_id, max(ids))
+            if movements:
+                _, pids, wids, deltas = zip(*movements)
+                self._grow(max(pids), set(wids))
+                np.add.at(self.quantities, (list(pids), [self.columns[w] for w in wids]), deltas)
+                self.movement_id = movements[-1][0]
+            return len(movements)
+
+    def breakdown(self, product_id):
+        # {warehouse_id: quantity} for the warehouses holding (or owing) stock
+        with self.lock:
+            if not 0 <= product_id < self.quantities.shape[0]:
+                return {}
+            row = self.quantities[product_id]
+            return {wid: int(row[col]) for wid, col in self.columns.items() if row[col]}
+
+    def breakdowns(self):
+        # {product_id: {warehouse_id: quantity}} for every product with stock rows
+        with self.lock:
+            pids, cols = np.nonzero(self.quantities)
+            wids = np.array(sorted(self.columns, key=self.columns.get))
+            result = {}
+            for pid, wid, qty in zip(pids.tolist(), wids[cols].tolist(), self.quantities[pids, cols].tolist()):
+                result.setdefault(pid, {})[wid] = qty
+            return result
+
+    def available(self, product_id):
+        with self.lock:
+            if not 0 <= product_id < self.quantities.shape[0]:
+                return 0
+            return int(self.quantities[product_id].sum())
+
+    def inventory_value(self):
+        with self.lock:
+            return float(self.quantities.sum(axis=1) @ self.unit_value)
+
+    def check(self):
+        # [(product_id, warehouse_id, in RAM, in DB)] that differ; reloads when anything does
+        conn = self.db._get_connection()
+        conn.row_factory = None
+        try:
+            movement_id, products, warehouses, stock = self._read_state(conn)
+        finally:
+            conn.close()
+        expected, expected_value, _ = self._build(products, warehouses, stock)
+
+        self.sync()
+        with self.lock:
+            if self.movement_id != movement_id:
+                return []  # written meanwhile: compare on the next check
+            mismatches = []
+            for wid, col in self.columns.items():
+                db_col = expected[:, col] if col < expected.shape[1] else np.zeros(len(expected), dtype=np.int64)
+                ram_col = self.quantities[:len(expected), col]
+                for pid in np.nonzero(ram_col != db_col)[0].tolist():
+                    mismatches.append((pid, wid, int(ram_col[pid]), int(db_col[pid])))
+            drifted = mismatches or not np.allclose(self.unit_value[:len(expected_value)], expected_value)
+        if drifted:
+            self.load()
+        return mismatches
@@ -1,81 +1,49 @@
-import sqlite3
 import os
+from database import Database, DB_NAME
 
-DB_NAME = "inventory.db"
-
-def sync_data():
-    if not os.path.exists(DB_NAME):
+def sync_data(db_name=DB_NAME):
+    # Returns {'totals_reset', 'rows_seeded'}, or None when the database is missing or the sync failed
+    if not os.path.exists(db_name):
         print("Database not found!")
-        return
+        return None
+
+    # Opening the database installs the stock triggers. On the first run this also
+    # migrates legacy totals (products.quantity without warehouse rows) into Warehouse 1.
+    db = Database(db_name)
 
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = db._get_connection()
     cursor = conn.cursor()
 
     try:
-        # 1. Get all products
-        print("Fetching products...")
-        cursor.execute("SELECT id, quantity FROM products")
-        products = cursor.fetchall()
-
-        # 2. Get all warehouses
-        print("Fetching warehouses...")
-        cursor.execute("SELECT id, name FROM warehouses")
-        warehouses = cursor.fetchall()
-        
-        # 3. Iterate and Seed
-        for p in products:
-            pid = p['id']
-            qty_total = p['quantity']
-            
-            # Check existing stock for this product
-            cursor.execute("SELECT warehouse_id, quantity FROM warehouse_stock WHERE product_id = ?", (pid,))
-            existing_stock = {row['warehouse_id']: row['quantity'] for row in cursor.fetchall()}
-            
-            # Calculate total in warehouse_stock
-            current_warehouse_total = sum(existing_stock.values())
-            
-            print(f"Product {pid}: Total={qty_total}, Warehoused={current_warehouse_total}")
-            
-            if current_warehouse_total == 0 and qty_total > 0:
-                # Case: Legacy Item (Has total stock, but no warehouse stock)
-                # Assign ALL to Warehouse 1 (Default)
-                print(f"  -> Migrating {qty_total} to Warehouse 1")
-                cursor.execute('''
-                    INSERT OR REPLACE INTO warehouse_stock (product_id, warehouse_id, quantity)
-                    VALUES (?, ?, ?)
-                ''', (pid, 1, qty_total))
-                existing_stock[1] = qty_total
-            
-            elif current_warehouse_total != qty_total:
-                 # Stock mismatch. Trust Total? Or Trust Warehouse?
-                 # If we trust Total, we need to decide where the diff goes.
-                 diff = qty_total - current_warehouse_total
-                 if diff != 0:
-                     print(f"  -> Mismatch! Diff={diff}. Adding to Warehouse 1.")
-                     cursor.execute('''
-                        INSERT INTO warehouse_stock (product_id, warehouse_id, quantity)
-                        VALUES (?, ?, ?)
-                        ON CONFLICT(product_id, warehouse_id)
-                        DO UPDATE SET quantity = quantity + ?
-                     ''', (pid, 1, diff, diff))
+        # 1. Verify totals (trigger-maintained, so this should report nothing)
+        print("Checking totals...")
+        mismatches = db.check_stock_totals()
+        for m in mismatches:
+            print(f"Product {m['product_id']}: Total={m['quantity']}, Warehoused={m['warehouse_total']}")
+            # Trust the warehouse breakdown; products.quantity is derived from it
+            print(f"  -> Resetting total to {m['warehouse_total']}")
+            cursor.execute("UPDATE products SET quantity = ? WHERE id = ?", (m['warehouse_total'], m['product_id']))
+
+        # 2. Ensure all warehouses have an entry (even 0) for every product, in the
+        #    warehouse's shard when sharded (zero rows leave nothing to fold)
+        print("Seeding empty warehouse rows...")
+        cursor.execute("SELECT id FROM warehouses ORDER BY id")
+        seeded = 0
+        for (warehouse_id,) in cursor.fetchall():
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO {db._sharded('warehouse_stock', warehouse_id)} (product_id, warehouse_id, quantity)
+                SELECT p.id, ?, 0 FROM products p
+            ''', (warehouse_id,))
+            seeded += cursor.rowcount
 
-            # Ensure all warehouses have an entry (even 0)
-            for w in warehouses:
-                wid = w['id']
-                if wid not in existing_stock: # and we didn't just add it above? existing_stock is stale for W1 if migrated
-                    # Check again to be safe via insert ignore equivalent
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO warehouse_stock (product_id, warehouse_id, quantity)
-                        VALUES (?, ?, 0)
-                    ''', (pid, wid))
-                    
         conn.commit()
         print("Sync complete.")
+        return {'totals_reset': len(mismatches), 'rows_seeded': seeded}
 
     except Exception as e:
         print(f"Error during sync: {e}")
         conn.rollback()
+        return None
     finally:
         conn.close()
 
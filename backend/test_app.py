@@ -0,0 +1,236 @@
+import io
+import os
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+import pytest
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    # app.py builds everything at import against relative paths (inventory.db, the report
+    # snapshot, the leader lock): import it, and keep serving, from an empty directory
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    try:
+        import app
+        yield app
+        # Collect the finished jobs and stop the stock matrix sync here, so nothing is left
+        # to read the relative database path once the working directory is back
+        app.jobs.updates()
+        app.jobs.stop()
+        app.db.db.stock_matrix.stop()
+    finally:
+        os.chdir(cwd)
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+def add_stock(client, name, quantity, warehouse_id=1, price=1.0):
+    # A new product with quantity units received into warehouse_id; returns its id
+    assert client.post('/api/products', data={"name": name, "price": price, "category": "Test"}).status_code == 200
+    pid = next(p['id'] for p in client.get('/api/products').get_json() if p['name'] == name)
+    response = client.post('/api/instances', json={"product_id": pid, "barcode": f"{name}-BC",
+                                                   "quantity": quantity, "warehouse_id": warehouse_id})
+    assert response.status_code == 200
+    return pid
+
+def test_rejected_product_stores_no_image(server, client):
+    print("--- Starting Product Validation Route Test ---")
+    uploads = server.app.config['UPLOAD_FOLDER']
+    before = sorted(os.listdir(uploads))
+    response = client.post('/api/products', data={"name": "", "image": (io.BytesIO(b"not stored"), "photo.png")},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert sorted(os.listdir(uploads)) == before
+    print("A rejected product leaves no upload behind")
+
+def test_bootstrap_reads_analytics_from_the_snapshot(server, client):
+    print("--- Starting Bootstrap Route Test ---")
+    pid = add_stock(client, "Boot", 5, price=2.0)
+
+    # No snapshot yet: analytics come from the live database
+    response = client.get('/api/bootstrap')
+    data = response.get_json()
+    assert set(data) == {'warehouses', 'products', 'orders', 'analytics'}
+    assert set(data['orders']) == {'orders', 'total', 'next_cursor'}
+    assert data['analytics']['snapshot_age'] is None and 'X-Snapshot-Age' not in response.headers
+    live_value = data['analytics']['inventory_value']
+
+    # With a fresh snapshot, analytics lag behind while stock is read live
+    server.snapshot.refresh()
+    client.post('/api/instances', json={"product_id": pid, "barcode": "BOOT2", "quantity": 5, "warehouse_id": 1})
+    response = client.get('/api/bootstrap')
+    data = response.get_json()
+    assert data['analytics']['snapshot_age'] is not None and 'X-Snapshot-Age' in response.headers
+    assert data['analytics']['inventory_value'] == live_value
+    product = next(p for p in data['products'] if p['id'] == pid)
+    assert product['stock_breakdown'] == {'1': 10}
+    print("Bootstrap analytics served from the report snapshot")
+
+def test_orders_listing_pages(client):
+    print("--- Starting Orders Route Test ---")
+    pid = add_stock(client, "Paged", 10)
+    for i in range(3):
+        response = client.post('/api/orders', json={"business_name": f"Pager {i}",
+                                                    "items": [{"product_id": pid, "quantity": 1}]})
+        assert response.status_code == 200 and response.get_json()['status'] == 'success'
+
+    first = client.get('/api/orders?business=Pager&limit=2').get_json()
+    assert set(first) == {'orders', 'total', 'next_cursor'}
+    assert first['total'] == 3 and [o['business_name'] for o in first['orders']] == ["Pager 2", "Pager 1"]
+    cursor = first['next_cursor']
+    rest = client.get(f"/api/orders?business=Pager&limit=2&before_ts={cursor['before_ts']}"
+                      f"&before_id={cursor['before_id']}").get_json()
+    assert [o['business_name'] for o in rest['orders']] == ["Pager 0"] and rest['next_cursor'] is None
+    assert client.get('/api/orders?business=Pager&status=DONE').get_json()['total'] == 0
+    print("Orders come back as a page with a total and a cursor")
+
+def test_wave_routes(client):
+    print("--- Starting Wave Routes Test ---")
+    pid = add_stock(client, "Waved", 10, warehouse_id=3)
+    order_id = client.post('/api/orders', json={"business_name": "Wave Client",
+                                                "items": [{"product_id": pid, "quantity": 3}]}).get_json()['order_id']
+
+    assert client.post('/api/waves', json={}).status_code == 400
+    response = client.post('/api/waves', json={"warehouse_id": 3, "worker_name": "picker"})
+    assert response.status_code == 200
+    wave = response.get_json()['wave']
+    assert order_id in wave['order_ids']
+    assert [(i['product_id'], i['quantity']) for i in wave['items']] == [(pid, 3)]
+    assert client.get(f"/api/waves/{wave['id']}").get_json()['id'] == wave['id']
+    assert client.get('/api/waves/999999').status_code == 404
+    # Everything open in warehouse 3 is claimed by the first wave
+    assert client.post('/api/waves', json={"warehouse_id": 3}).status_code == 404
+
+    confirm = f"/api/waves/{wave['id']}/confirm"
+    assert client.post(confirm, json={"barcodes": ["Waved-BC"]}).status_code == 400
+    response = client.post(confirm, json={"barcodes": ["Waved-BC"] * 3, "worker_name": "picker"})
+    assert response.status_code == 200
+    assert response.get_json()['wave']['picked'] == {str(pid): 3}
+    assert client.post(confirm, json={"barcodes": ["Waved-BC"], "worker_name": "picker"}).status_code == 400
+    print("Waves planned, fetched and confirmed over HTTP")
+
+def test_stock_at_route(client):
+    print("--- Starting Stock At Route Test ---")
+    pid = add_stock(client, "Ledgered", 6, warehouse_id=2)
+    soon = datetime.now(timezone.utc) + timedelta(minutes=1)
+    rows = client.get(f"/api/stock/at?at={soon:%Y-%m-%dT%H:%M}&product_id={pid}").get_json()
+    assert rows == [{'warehouse_id': 2, 'product_id': pid, 'quantity': 6}]
+    # Offsets are converted to UTC; a bare date means the end of that day
+    local = soon.astimezone(timezone(timedelta(hours=3))).isoformat(timespec='minutes')
+    assert client.get('/api/stock/at', query_string={'at': local, 'product_id': pid}).get_json() == rows
+    assert client.get(f"/api/stock/at?at={soon:%Y-%m-%d}&product_id={pid}&warehouse_id=1").get_json() == []
+
+    assert client.get('/api/stock/at?at=yesterday').status_code == 400
+    assert client.get('/api/stock/at?at=2001-01-01').status_code == 404
+    print("Point-in-time stock over HTTP")
+
+def test_stock_adjustments_route(client):
+    print("--- Starting Stock Adjustments Route Test ---")
+    pid = add_stock(client, "Counted", 10, price=2.0)
+    response = client.post('/api/stock/adjustments', json={"lines": [
+        {"product_id": pid, "warehouse_id": 1, "counted": 8},
+        {"product_id": pid, "warehouse_id": 2, "change": 3},
+    ]})
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report['status'] == 'success' and report['changed'] == 2 and report['units_delta'] == 1
+    assert [(v['warehouse_id'], v['before'], v['after']) for v in report['variances']] == [(2, 0, 3), (1, 10, 8)]
+    product = next(p for p in client.get('/api/products').get_json() if p['id'] == pid)
+    assert product['quantity'] == 11 and product['stock_breakdown'] == {'1': 8, '2': 3}
+
+    assert client.post('/api/stock/adjustments', json={}).status_code == 400
+    assert client.post('/api/stock/adjustments', json={"lines": ["nope"]}).status_code == 400
+    response = client.post('/api/stock/adjustments', json={"lines": [{"product_id": pid, "warehouse_id": 1, "counted": -1}]})
+    assert response.status_code == 400 and response.get_json()['status'] == 'error'
+    print("Cycle counts applied over HTTP")
+
+def test_timeseries_route(server, client):
+    print("--- Starting Time Series Route Test ---")
+    pid = add_stock(client, "Charted", 10)
+    client.post('/api/orders', json={"business_name": "Chart Client", "items": [{"product_id": pid, "quantity": 2}]})
+    server.snapshot.refresh()
+    url = '/api/analytics/timeseries?metric=units&bucket=day&group=product&days=7&series=20'
+
+    response = client.get(url)
+    assert response.status_code == 200 and 'X-Snapshot-Age' in response.headers
+    fig = response.get_json()
+    assert set(fig) == {'data', 'layout'}
+    assert sum(next(t for t in fig['data'] if t['name'] == "Charted")['y']) == 2
+
+    # Served from the snapshot: a new sale shows up after the next refresh
+    client.post('/api/orders', json={"business_name": "Chart Client", "items": [{"product_id": pid, "quantity": 3}]})
+    assert client.get(url).get_json() == fig
+    server.snapshot.refresh()
+    fig = client.get(url).get_json()
+    assert sum(next(t for t in fig['data'] if t['name'] == "Charted")['y']) == 5
+
+    assert client.get('/api/analytics/timeseries?metric=nope').status_code == 400
+    assert client.get('/api/analytics/timeseries?bucket=year').status_code == 400
+    print("Plotly figures over HTTP, from the report snapshot")
+
+def test_assets_built_by_the_cli(server, client, tmp_path):
+    print("--- Starting Asset Build Route Test ---")
+    # Importing the app builds nothing: pages link the plain static files
+    assert server.assets.manifest == {}
+    assert b'href="/static/css/style.css"' in client.get('/admin').data
+
+    # Build from a copy of the sources so the test doesn't write into static/
+    pipeline = server.assets
+    for folder in pipeline.dirs:
+        shutil.copytree(os.path.join(pipeline.static_folder, folder), tmp_path / folder)
+    static_folder, dist_folder = pipeline.static_folder, pipeline.dist_folder
+    pipeline.static_folder, pipeline.dist_folder = str(tmp_path), str(tmp_path / 'dist')
+    try:
+        result = server.app.test_cli_runner().invoke(args=['build-assets'])
+        assert result.exit_code == 0 and "css/style.css -> css/style." in result.output
+        hashed = pipeline.manifest['css/style.css']
+        assert f'href="/assets/{hashed}"'.encode() in client.get('/admin').data
+
+        response = client.get(f"/assets/{hashed}", headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200 and response.headers['Content-Encoding'] == 'gzip'
+        assert 'immutable' in response.headers['Cache-Control']
+    finally:
+        pipeline.static_folder, pipeline.dist_folder = static_folder, dist_folder
+        pipeline.manifest, pipeline.files = {}, {}
+    print("flask build-assets fingerprints the css/js served from /assets")
+
+def wait_for_job(client, job_id, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/api/jobs/{job_id}").get_json()
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+def test_job_routes(client):
+    print("--- Starting Job Routes Test ---")
+    add_stock(client, "Exported", 4)
+    response = client.post('/api/jobs', json={"kind": "export", "params": {"kind": "products", "format": "ndjson"}})
+    assert response.status_code == 202 and response.get_json()['status'] == 'queued'
+    job_id = response.get_json()['job_id']
+    job = wait_for_job(client, job_id)
+    assert job['status'] == 'done' and job['result']['filename'] == "products.ndjson"
+    download = client.get(f"/api/jobs/{job_id}/download")
+    assert download.status_code == 200 and b'"Exported"' in download.data
+    assert job_id in [j['id'] for j in client.get('/api/jobs?status=done').get_json()]
+    assert client.post(f"/api/jobs/{job_id}/cancel").status_code == 409
+    print("Export job: 202, polled to done, output downloaded")
+
+    csv = io.BytesIO(b"name,price,category\nImported One,3.5,Jobs\nImported Two,1,Jobs\n")
+    response = client.post('/api/import', data={'file': (csv, 'products.csv')}, content_type='multipart/form-data')
+    assert response.status_code == 202
+    job = wait_for_job(client, response.get_json()['job_id'])
+    assert job['status'] == 'done' and job['result']['imported_count'] == 2
+    assert {"Imported One", "Imported Two"} <= {p['name'] for p in client.get('/api/products').get_json()}
+    print("Import job: 202, products imported by the worker")
+
+    assert client.post('/api/jobs', json={"kind": "import_products"}).status_code == 400
+    assert client.post('/api/jobs', json={"kind": "export", "params": "products"}).status_code == 400
+    assert client.get('/api/jobs/999999').status_code == 404
+    assert client.get('/api/jobs/999999/download').status_code == 404
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
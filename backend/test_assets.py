@@ -0,0 +1,73 @@
+import gzip
+import os
+import pytest
+from flask import Flask, render_template_string
+from assets import AssetPipeline, minify_css, minify_js
+
+def make_static(tmp_path):
+    static = str(tmp_path)
+    os.makedirs(os.path.join(static, 'css'))
+    os.makedirs(os.path.join(static, 'js'))
+    with open(os.path.join(static, 'css', 'site.css'), 'w') as f:
+        f.write("/* header */\n.a:hover ,\n.b > .c {\n    color : red;\n    margin: 0 10px;\n}\n")
+    with open(os.path.join(static, 'js', 'app.js'), 'w') as f:
+        f.write("// init\nfunction f() {\n    return `a\n    b`; // keep\n}\n\n")
+    return static
+
+def test_build_and_serve(tmp_path):
+    print("--- Starting Asset Pipeline Test ---")
+    static = make_static(tmp_path)
+    app = Flask(__name__, static_folder=static, static_url_path='/static')
+    pipeline = AssetPipeline(static)
+    pipeline.init_app(app)
+    manifest = pipeline.build()
+
+    assert set(manifest) == {'css/site.css', 'js/app.js'}
+    css_path = os.path.join(static, 'dist', manifest['css/site.css'])
+    with open(css_path) as f:
+        assert f.read() == ".a:hover,.b>.c{color:red;margin:0 10px}"
+    with open(css_path + '.gz', 'rb') as f, open(css_path, 'rb') as raw:
+        assert gzip.decompress(f.read()) == raw.read()
+    assert minify_css("@media (max-width: 600px) { .x { top: 0; } }") == "@media (max-width: 600px){.x{top:0}}"
+    print("Minified and precompressed:", manifest)
+
+    client = app.test_client()
+    with app.test_request_context():
+        url = render_template_string("{{ asset_url('css/site.css') }}")
+        assert url == f"/assets/{manifest['css/site.css']}"
+        assert render_template_string("{{ asset_url('css/missing.css') }}") == "/static/css/missing.css"
+
+    response = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert 'immutable' in response.headers['Cache-Control'] and 'max-age=31536000' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data) == b".a:hover,.b>.c{color:red;margin:0 10px}"
+
+    plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers and plain.data.startswith(b".a:hover")
+
+    revalidate = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+    assert revalidate.status_code == 304
+    assert client.get("/assets/css/site.000000000000.css").status_code == 404
+    print("Served with immutable cache headers and the gzip variant")
+
+    # Content change -> new URL; prebuilt manifest can be reloaded
+    with open(os.path.join(static, 'css', 'site.css'), 'a') as f:
+        f.write(".d { top: 1px; }")
+    assert pipeline.build()['css/site.css'] != manifest['css/site.css']
+    reloaded = AssetPipeline(static)
+    reloaded.load()
+    assert reloaded.manifest == pipeline.manifest
+
+def test_minify_js_template_literals():
+    print("--- Starting JS Template Literal Test ---")
+    source = ("// init\nconst row = `<tr>\n    <td>${name}</td>  \n\n    // not a comment\n</tr>`;\n"
+              "    if (x) {   \n        show(`${ {a: 1}.a } `);\n    }\n")
+    assert minify_js(source) == ("const row = `<tr>\n    <td>${name}</td>  \n\n    // not a comment\n</tr>`;\n"
+                                 "if (x) {\nshow(`${ {a: 1}.a } `);\n}\n")
+    print("Lines inside backtick literals are kept as written")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,74 @@
+import time
+import uuid
+import pytest
+import socketio
+from cluster import LocalManager, LeaderLock
+
+def make_node(channel):
+    server = socketio.Server(async_mode='threading', client_manager=LocalManager(f"local://{channel}"))
+    server.manager.initialize()
+    return server
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_emits_and_events_cross_nodes():
+    print("--- Starting Cluster Relay Test ---")
+    channel = uuid.uuid4().hex
+    node_a = make_node(channel)
+    node_b = make_node(channel)
+    time.sleep(0.1)
+
+    # A client connected to node B, in the warehouse 1 room
+    sent_b = []
+    node_b._send_eio_packet = lambda eio_sid, pkt: sent_b.append((eio_sid, pkt.data))
+    sid = node_b.manager.connect('eio-b', '/')
+    node_b.manager.enter_room(sid, '/', 'warehouse_1')
+
+    node_a.emit('pick_queue', {'warehouse_id': 1}, to='warehouse_1')
+    node_a.emit('pick_queue', {'warehouse_id': 2}, to='warehouse_2')
+    assert wait_for(lambda: sent_b == [('eio-b', '2["pick_queue",{"warehouse_id":1}]')])
+    print("Room emit from node A reached the client on node B")
+
+    # App events go to the other nodes only
+    received_a, received_b = [], []
+    node_a.manager.on_cluster_event('refresh', received_a.append)
+    node_b.manager.on_cluster_event('refresh', received_b.append)
+    node_a.manager.publish_event('refresh', [1, 2])
+    assert wait_for(lambda: received_b == [[1, 2]])
+    time.sleep(0.05)
+    assert received_a == []
+    print("Cluster event delivered to the other node, not the sender")
+
+    # The server initializes the manager again on the first connection: still one listener
+    node_b.manager.initialize()
+    time.sleep(0.05)
+    node_a.manager.publish_event('refresh', [3])
+    assert wait_for(lambda: received_b == [[1, 2], [3]])
+    time.sleep(0.05)
+    assert received_b == [[1, 2], [3]]
+
+def test_leader_lock_single_and_failover(tmp_path):
+    print("--- Starting Leader Lock Test ---")
+    path = str(tmp_path / "leader.lock")
+    elected = []
+    first = LeaderLock(path, lambda: elected.append('first'), poll=0.05)
+    second = LeaderLock(path, lambda: elected.append('second'), poll=0.05)
+    first.start()
+    second.start()
+    time.sleep(0.2)
+    assert elected == ['first'] and first.is_leader() and not second.is_leader()
+
+    first.release()
+    assert wait_for(lambda: elected == ['first', 'second'])
+    assert second.is_leader()
+    second.release()
+    print("Exactly one leader; follower took over after release")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,46 @@
+import pytest
+
+def test_orders_details(make_db):
+    print("--- Starting Order Details Multi-get Test ---")
+    db = make_db()
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_product("Beta", 2.0, "", "Test")
+    db.add_instance(1, "A", 10, '', 1)
+    db.add_instance(1, "A2", 10, '', 2)
+    db.add_instance(2, "B", 10, '', 1)
+    db.create_order("Client", [{'product_id': 1, 'quantity': 12}, {'product_id': 2, 'quantity': 1}])
+    db.create_order("Other", [{'product_id': 2, 'quantity': 3}])
+
+    details = db.get_orders_details([2, 1, 99])
+    assert list(details) == [2, 1, 99]
+    assert [(i['product_id'], i['quantity']) for i in details[1]['items']] == [(1, 12), (2, 1)]
+    assert [(a['product_id'], a['warehouse_id'], a['quantity']) for a in details[1]['allocations']] == \
+        [(1, 1, 10), (1, 2, 2), (2, 1, 1)]
+    assert details[99] == {"items": [], "allocations": []}
+    # The single-order lookup returns the same shape
+    assert db.get_order_details(2) == details[2]
+    print("Items and allocations for many orders")
+
+def test_dashboard_bootstrap(make_db):
+    print("--- Starting Dashboard Bootstrap Test ---")
+    db = make_db()
+    db.add_product("Alpha", 1.5, "", "Test")
+    db.add_instance(1, "A", 10, '', 2)
+    db.create_order("Client", [{'product_id': 1, 'quantity': 4}])
+
+    data = db.get_dashboard()
+    assert [w['id'] for w in data['warehouses']] == [w['id'] for w in db.get_warehouses()]
+    assert data['products'] == db.get_all_products()
+    assert data['orders'] == db.get_orders() and data['orders_total'] == 1
+    assert 'analytics' not in data
+    print("One read for the whole dashboard")
+
+    # Breakdowns are read in the same transaction as the totals, even with the matrix enabled
+    db.enable_stock_matrix()
+    db.stock_matrix.quantities[1, db.stock_matrix.columns[2]] = 99
+    product = db.get_dashboard()['products'][0]
+    assert product['stock_breakdown'] == {2: 6} and product['quantity'] == 6
+    print("Stock breakdowns agree with the product totals")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,29 @@
+import gzip
+import json
+import pytest
+from export import stream_export
+
+def test_export_formats_and_since(make_db):
+    print("--- Starting Export Test ---")
+    db = make_db()
+    for i in range(5):
+        db.log_scan(f"BC{i}", i + 1)
+
+    csv_text = b''.join(stream_export(db, 'scans', 'csv')).decode('utf-8')
+    lines = csv_text.strip().splitlines()
+    assert lines[0] == 'id,barcode,quantity,timestamp'
+    assert len(lines) == 6
+
+    ndjson = b''.join(stream_export(db, 'scans', 'ndjson', since_id=3)).decode('utf-8')
+    rows = [json.loads(line) for line in ndjson.strip().splitlines()]
+    assert [r['barcode'] for r in rows] == ['BC3', 'BC4']
+
+    compressed = b''.join(stream_export(db, 'scans', 'csv', compress=True))
+    assert gzip.decompress(compressed).decode('utf-8') == csv_text
+
+    # Empty result still has a header
+    assert b''.join(stream_export(db, 'orders', 'csv')).decode('utf-8').startswith('id,business_name')
+    print("--- Test Passed ---")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,44 @@
+import pytest
+from forecast import ReplenishmentForecaster, forecast
+
+def test_forecast_math():
+    print("--- Starting Forecast Math Test ---")
+    # 28 units over a 28-day window, 1 per day: no variance
+    rows = forecast([(1, 1, 10, 28, 28), (2, 1, 5, 0, 0), (3, 2, 2, 56, 28 * 4)],
+                    window_days=28, lead_time_days=7, service_z=1.65)
+    steady, idle, fast = rows
+    assert steady == (1, 1, 10, 1.0, 0.0, 7, 0, 10.0)
+    assert idle == (2, 1, 5, 0.0, 0.0, 0, 0, None)
+    # 2/day: reorder point 14, stock 2 -> order back up to 14 + 14
+    assert fast[5] == 14 and fast[6] == 26 and fast[7] == 1.0
+    assert forecast([]) == []
+    print("Demand, reorder point and days until stock-out")
+
+def test_forecaster_incremental(make_db):
+    print("--- Starting Replenishment Forecaster Test ---")
+    db = make_db()
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_product("Beta", 1.0, "", "Test")
+    db.add_instance(1, "A", 20, '', 1)
+    db.add_instance(2, "B", 100, '', 1)
+    db.create_order("Client", [{'product_id': 1, 'quantity': 14}])
+
+    forecaster = ReplenishmentForecaster(db, window_days=7, lead_time_days=3)
+    assert forecaster.run_once() == 2
+    rows = {r['product_id']: r for r in db.get_replenishment()}
+    assert list(rows) == [1]  # Beta has no demand
+    assert rows[1]['stock'] == 6 and rows[1]['daily_demand'] == 2.0
+    assert rows[1]['days_until_stockout'] == 3.0
+    print("Full pass over every stock row")
+
+    # Nothing changed: the incremental pass is a no-op
+    assert forecaster.run_once() == 0
+    db.create_order("Client", [{'product_id': 2, 'quantity': 7}])
+    assert forecaster.run_once() == 1
+    beta = [r for r in db.get_replenishment() if r['product_id'] == 2][0]
+    assert beta['stock'] == 93 and beta['daily_demand'] == 1.0
+    assert [r['product_id'] for r in db.get_replenishment(at_risk=True)] == [1]
+    print("Incremental pass only recomputes touched rows")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
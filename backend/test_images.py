@@ -0,0 +1,78 @@
+import io
+import os
+import time
+import pytest
+from flask import Flask
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from images import ImageStore
+
+def make_upload(name, color):
+    buf = io.BytesIO()
+    Image.new('RGB', (640, 480), color).save(buf, 'PNG')
+    buf.seek(0)
+    return FileStorage(buf, filename=name)
+
+def test_dedupe_and_thumbnails(tmp_path):
+    print("--- Starting Image Store Test ---")
+    folder = str(tmp_path)
+    app = Flask(__name__)
+    store = ImageStore(folder)
+    store.init_app(app)
+
+    first = store.save(make_upload("photo.PNG", 'red'))
+    again = store.save(make_upload("same photo.png", 'red'))
+    other = store.save(make_upload("other.png", 'blue'))
+    assert first == again and first != other
+    assert first.startswith("uploads/") and first.endswith(".png")
+    assert len([f for f in os.listdir(folder) if f.endswith('.png')]) == 2
+    print("Identical uploads share one file:", first)
+
+    with app.test_request_context():
+        # Not rendered yet: thumbnail URLs fall back to the original
+        urls = store.urls(first)
+        assert urls['thumbnails'][40] == urls['image_url'] == f"/media/{os.path.basename(first)}"
+
+        store.start()
+        deadline = time.time() + 5
+        while not (store.has_thumbnails(first) and store.has_thumbnails(other)) and time.time() < deadline:
+            time.sleep(0.02)
+        store.stop()
+        urls = store.urls(first)
+        assert urls['thumbnails'][40].endswith("_40.webp") and urls['thumbnails'][200].endswith("_200.webp")
+        assert store.urls(None) == {'image_url': None, 'thumbnails': {}}
+
+        # URLs come from the in-memory thumbnail state, not a stat per size
+        exists = os.path.exists
+        os.path.exists = None
+        try:
+            assert store.urls(first) == urls
+        finally:
+            os.path.exists = exists
+
+    with Image.open(os.path.join(folder, store.thumbnail_name(first, 40))) as thumb:
+        assert thumb.size == (40, 40)
+    print("Thumbnails rendered by the worker")
+
+    response = app.test_client().get(urls['thumbnails'][200])
+    assert response.status_code == 200 and response.mimetype == 'image/webp'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert len(response.data) < os.path.getsize(os.path.join(folder, os.path.basename(first)))
+
+def test_backfill_legacy_upload(tmp_path):
+    print("--- Starting Thumbnail Backfill Test ---")
+    folder = str(tmp_path)
+    Image.new('RGB', (300, 100), 'green').save(os.path.join(folder, "1234-abcd_legacy.png"))
+    store = ImageStore(folder)
+    store.start()
+    store.backfill(["uploads/1234-abcd_legacy.png", None, "uploads/1234-abcd_legacy.png"])
+    store.stop()
+    assert store.has_thumbnails("uploads/1234-abcd_legacy.png")
+    print("Legacy upload got thumbnails")
+
+    # Another process finds them with one listing of the thumbs folder
+    assert ImageStore(folder).has_thumbnails("uploads/1234-abcd_legacy.png")
+    assert not ImageStore(folder).has_thumbnails("uploads/other.png")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,85 @@
+import sqlite3
+import pytest
+from database import Database
+
+def test_lots_and_picks(make_path):
+    print("--- Starting Item Lots Test ---")
+    db = Database(make_path())
+    db.add_product("Lot Product", 1.0, "", "Test")
+    assert db.add_instance(1, "LOT-A", 1000, 'delivery 1', 1)[0]
+    assert db.add_instance(1, "LOT-B", 5, '', 1)[0]
+
+    conn = db._get_connection()
+    assert conn.execute("SELECT COUNT(*) FROM item_lots").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM item_instances").fetchone()[0] == 0
+    conn.close()
+    print("1005 units stored as 2 lot rows")
+
+    success, order_id = db.create_order("Client", [{'product_id': 1, 'quantity': 3}])
+    assert success
+    for _ in range(3):
+        assert db.record_pick(order_id, 1, "LOT-A", "Worker")[0]
+
+    instances = db.get_instances(1)
+    lot_a = [i for i in instances if i['barcode'] == "LOT-A" and i['instance_id'] is None][0]
+    assert (lot_a['quantity'], lot_a['picked_quantity'], lot_a['status']) == (1000, 3, 'In Stock')
+    units = [i for i in instances if i['instance_id'] is not None]
+    assert len(units) == 3
+    assert all(u['status'] == 'Picked' and u['lot_id'] == lot_a['lot_id'] for u in units)
+    assert units[0]['notes'] == f"Picked for Order #{order_id} by Worker"
+    print("Picks counted on the lot, one unit row per picked unit")
+
+    history = db.get_scan_history()
+    assert [h['name'] for h in history] == ["Lot Product", "Lot Product"]
+
+def test_wave_picks_oldest_lot_first(make_path):
+    print("--- Starting Lot Wave Test ---")
+    db = Database(make_path())
+    db.add_product("Wave Product", 1.0, "", "Test")
+    db.add_instance(1, "SAME", 2, '', 1)
+    db.add_instance(1, "SAME", 10, '', 1)
+    success, order_id = db.create_order("Client", [{'product_id': 1, 'quantity': 4}])
+    wave = db.plan_wave(1)
+    success, result = db.confirm_wave(wave['id'], ["SAME"] * 6, "Worker")
+    assert success and result['picked'] == {1: 4} and result['surplus'] == {1: 2}
+
+    conn = db._get_connection()
+    lots = [tuple(r) for r in conn.execute("SELECT quantity, picked_quantity FROM item_lots ORDER BY id")]
+    assert lots == [(2, 2), (10, 2)]
+    assert conn.execute("SELECT COUNT(*) FROM item_instances").fetchone()[0] == 4
+    conn.close()
+    print("Wave filled the older lot first, surplus units stayed in stock")
+
+def test_legacy_instances_compacted(make_path):
+    print("--- Starting Lot Migration Test ---")
+    path = make_path()
+    Database(path)
+    conn = sqlite3.connect(path)
+    conn.execute("DROP TABLE item_lots")
+    conn.execute("INSERT INTO products (name, price) VALUES ('Legacy', 1.0)")
+    conn.executemany(
+        "INSERT INTO item_instances (product_id, warehouse_id, barcode, scan_time, notes, status) VALUES (1, 1, ?, ?, ?, ?)",
+        [("OLD", "2024-01-01 10:00:00", "batch", "In Stock")] * 50 +
+        [("OLD", "2024-01-01 10:00:00", "Picked for Order #1 by W", "Picked")] * 2 +
+        [("OLD", "2024-02-01 10:00:00", "second", "In Stock")] * 7)
+    conn.commit()
+    conn.close()
+
+    db = Database(path)
+    conn = db._get_connection()
+    lots = [tuple(r) for r in conn.execute(
+        "SELECT barcode, received_at, notes, quantity, picked_quantity FROM item_lots ORDER BY received_at")]
+    assert lots == [("OLD", "2024-01-01 10:00:00", "batch", 52, 2), ("OLD", "2024-02-01 10:00:00", "second", 7, 0)]
+    units = conn.execute("SELECT status, lot_id FROM item_instances").fetchall()
+    assert [(u['status'], u['lot_id']) for u in units] == [('Picked', 1), ('Picked', 1)]
+    conn.close()
+
+    # Reopening does not migrate again
+    Database(path)
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM item_lots").fetchone()[0] == 2
+    conn.close()
+    print("59 legacy unit rows compacted into 2 lots, picked units kept")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
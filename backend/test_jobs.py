@@ -0,0 +1,93 @@
+import threading
+import time
+import pytest
+from jobs import JobRunner, JOBS
+
+# Registered here, after jobs is imported: spawned workers still find it (run_job gets the function)
+def slow_job(db, params, job):
+    for i in range(params.get('steps', 100)):
+        job.progress(i, params.get('steps', 100), force=True)
+        time.sleep(0.05)
+    return {'steps': i + 1}
+
+JOBS['slow'] = slow_job
+
+def wait(db, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = db.get_job(job_id)
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+def test_job_lifecycle(make_db, tmp_path):
+    print("--- Starting Job Runner Test ---")
+    db = make_db()
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_instance(1, "A", 10, '', 1)
+    runner = JobRunner(db, str(tmp_path), max_workers=1)
+    try:
+        job_id = runner.submit('export', {'kind': 'products'})
+        job = wait(db, job_id)
+        assert job['status'] == 'done' and job['progress'] == 1
+        with open(job['result']['path']) as f:
+            assert f.read().splitlines()[1].startswith("1,Alpha")
+        assert runner.pool._mp_context.get_start_method() == 'spawn'
+        assert [(j['id'], j['status']) for j in runner.updates()] == [(job_id, 'done')]
+        assert runner.updates() == []
+        print("Export runs in a worker process")
+
+        job_id = runner.submit('export', {'kind': 'nope'})
+        job = wait(db, job_id)
+        assert job['status'] == 'failed' and job['message'] == "Unknown export"
+        print("Errors fail the job")
+    finally:
+        runner.stop()
+
+def test_cancel_and_limits(make_db, tmp_path):
+    print("--- Starting Job Cancellation Test ---")
+    db = make_db()
+    runner = JobRunner(db, str(tmp_path), max_workers=1, max_pending=2)
+    try:
+        running = runner.submit('slow')
+        queued = runner.submit('slow', {'steps': 1})
+        assert runner.submit('slow') is None  # over max_pending
+        while db.get_job(running)['status'] != 'running':
+            time.sleep(0.05)
+
+        # Queued: cancelled at once; running: stops at its next progress report
+        assert runner.cancel(queued) == 'cancelled'
+        assert runner.cancel(running) == 'running'
+        assert wait(db, running)['status'] == 'cancelled'
+        assert wait(db, queued)['status'] == 'cancelled'
+        assert 0 < db.get_job(running)['progress'] < 1
+        assert runner.cancel(running) is None
+        print("Queued and running jobs cancel")
+    finally:
+        runner.stop()
+
+def test_pending_limit_under_concurrent_submits(make_db):
+    print("--- Starting Concurrent Job Limit Test ---")
+    for single_writer in (False, True):
+        db = make_db(single_writer=single_writer)
+        created = []
+        barrier = threading.Barrier(12)
+
+        def submit():
+            barrier.wait()
+            created.append(db.create_job('reconcile_stock', max_pending=3))
+
+        threads = [threading.Thread(target=submit) for _ in range(12)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # The count and the insert are one statement: racing submits cannot overshoot
+        assert len([j for j in created if j is not None]) == 3
+        assert len(db.get_jobs(status='queued')) == 3
+        assert db.create_job('reconcile_stock') is not None  # no limit given
+    print("max_pending holds under concurrent submits")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
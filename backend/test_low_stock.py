@@ -0,0 +1,46 @@
+import pytest
+
+def test_threshold_crossings(make_db):
+    print("--- Starting Low Stock Alert Test ---")
+    db = make_db()
+    raised = []
+    db.on_low_stock(raised.append)
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_product("Beta", 1.0, "", "Test")
+    db.add_instance(1, "A", 10, '', 1)
+    db.add_instance(1, "A2", 10, '', 2)
+    db.add_instance(2, "B", 10, '', 1)
+
+    db.set_stock_threshold(1, 5)                  # every warehouse
+    db.set_stock_threshold(1, 8, warehouse_id=2)  # warehouse 2 override
+    assert db.get_stock_thresholds(1) == [{'warehouse_id': 0, 'threshold': 5},
+                                          {'warehouse_id': 2, 'threshold': 8}]
+
+    # Setting a threshold does not scan: only writes check the rows they touch
+    assert raised == []
+    assert db.create_order("Client", [{'product_id': 1, 'quantity': 4}]) == (True, 1)
+    assert raised == []
+    db.create_order("Client", [{'product_id': 1, 'quantity': 1}, {'product_id': 2, 'quantity': 9}])
+    assert [(a['product_id'], a['warehouse_id'], a['quantity'], a['threshold']) for a in raised] == [(1, 1, 5, 5)]
+    print("Order crossing the product threshold raises one alert")
+
+    # Still low: no duplicate; the warehouse override applies to warehouse 2
+    assert db.update_quantity(1, -1, 1) is True
+    assert db.update_quantity(1, -2, 2) is True
+    assert [(a['product_id'], a['warehouse_id']) for a in raised] == [(1, 1), (1, 2)]
+    assert len(db.get_stock_alerts()) == 2
+    assert db.get_analytics_data()['low_stock_count'] == 2
+
+    # A receipt back above the threshold resolves the alert
+    success, _ = db.add_instance(1, "A3", 10, '', 1)
+    assert success
+    open_alerts = db.get_stock_alerts()
+    assert [(a['product_id'], a['warehouse_id']) for a in open_alerts] == [(1, 2)]
+    assert len(db.get_stock_alerts(open_only=False)) == 2
+    print("Receipt resolves the alert")
+
+    db.set_stock_threshold(1, None, warehouse_id=2)
+    assert db.get_stock_thresholds(1) == [{'warehouse_id': 0, 'threshold': 5}]
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
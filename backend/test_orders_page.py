@@ -0,0 +1,64 @@
+import pytest
+
+def test_keyset_pages_cover_all_orders(make_db):
+    print("--- Starting Orders Pagination Test ---")
+    db = make_db()
+    conn = db._get_connection()
+    # Same timestamp for a run of orders so the id tiebreak matters
+    conn.executemany("INSERT INTO orders (business_name, timestamp, status) VALUES (?, ?, ?)",
+                     [(f"Client {i % 7}", f"2024-01-{i // 10 + 1:02d} 10:00:00", ['PENDING', 'COMPLETED'][i % 2])
+                      for i in range(95)])
+    conn.executemany("INSERT INTO order_items (order_id, product_id, quantity) VALUES (?, 1, ?)",
+                     [(i % 95 + 1, 2) for i in range(190)])
+    conn.commit()
+    conn.close()
+
+    seen = []
+    before = None
+    while True:
+        page = db.get_orders(limit=20, before=before)
+        seen.extend(page)
+        if len(page) < 20:
+            break
+        before = (page[-1]['timestamp'], page[-1]['id'])
+
+    assert [o['id'] for o in seen] == [o['id'] for o in sorted(seen, key=lambda o: (o['timestamp'], o['id']), reverse=True)]
+    assert sorted(o['id'] for o in seen) == list(range(1, 96))
+    assert all(o['item_count'] == 2 and o['total_qty'] == 4 for o in seen)
+    print("Keyset pages covered all orders exactly once")
+
+    # Filters
+    pending = db.get_orders(status='PENDING', limit=500)
+    assert len(pending) == 48 and all(o['status'] == 'PENDING' for o in pending)
+    client = db.get_orders(business_name="Client 3", limit=500)
+    assert {o['business_name'] for o in client} == {"Client 3"}
+    january_2 = db.get_orders(date_from="2024-01-02", date_to="2024-01-03", limit=500)
+    assert len(january_2) == 10
+    print("Status, client and date filters applied")
+
+def test_order_counts_follow_status_changes(make_db):
+    print("--- Starting Order Counts Test ---")
+    db = make_db()
+    db.add_product("Count Product", 1.0, "", "Test")
+    db.add_instance(1, "C-BC", 10, '', 1)
+    ids = [db.create_order(f"Client {i}", [{'product_id': 1, 'quantity': 1}])[1] for i in range(4)]
+    assert db.count_orders() == 4
+    assert db.count_orders(status='PENDING') == 4
+
+    db.update_order_status(ids[0], 'COMPLETED')
+    db.update_order_status(ids[1], 'PROCESSING')
+    assert db.count_orders(status='PENDING') == 2
+    assert db.count_orders(status='COMPLETED') == 1
+    assert db.count_orders() == 4
+    # Filtered counts fall back to a query
+    assert db.count_orders(status='PENDING', business_name="Client 3") == 1
+
+    conn = db._get_connection()
+    conn.execute("DELETE FROM orders WHERE id = ?", (ids[3],))
+    conn.commit()
+    conn.close()
+    assert db.count_orders() == 3
+    print("Counters tracked inserts, status updates and deletes")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,42 @@
+import pytest
+from pick_queue import PickQueue
+
+def test_queue_follows_orders_and_picks(make_db):
+    print("--- Starting Pick Queue Test ---")
+    db = make_db()
+    db.add_product("Pick Product", 1.0, "", "Test")
+    db.add_instance(1, "W1-BC", 1, '', 1)
+    db.add_instance(1, "W2-BC", 5, '', 2)
+
+    queue = PickQueue(db)
+    queue.load()
+    assert queue.get_queue(1) == []
+
+    # 3 units: 1 from W1, 2 from W2
+    success, order_id = db.create_order("Client", [{'product_id': 1, 'quantity': 3}])
+    assert success
+    assert queue.refresh_order(order_id) == {1, 2}
+    assert [(o['id'], o['remaining_qty']) for o in queue.get_queue(1)] == [(order_id, 1)]
+    assert [(o['id'], o['remaining_qty']) for o in queue.get_queue(2)] == [(order_id, 2)]
+
+    # Fully picked in W1: leaves the W1 queue, still open in W2
+    assert db.record_pick(order_id, 1, "W1-BC", "worker")[0]
+    queue.refresh_order(order_id)
+    assert queue.get_queue(1) == []
+    assert queue.get_queue(2)[0]['remaining_qty'] == 2
+
+    # Last pick completes the order automatically
+    assert db.record_pick(order_id, 2, "W2-BC", "worker")[0]
+    assert db.record_pick(order_id, 2, "W2-BC", "worker")[0]
+    assert queue.refresh_order(order_id) == {1, 2}
+    assert queue.get_queue(2) == []
+    assert db.get_active_orders() == []
+    assert [o['status'] for o in db.get_orders()] == ['COMPLETED']
+
+    # A fresh load sees the same state
+    queue.load()
+    assert queue.orders == {}
+    print("--- Test Passed ---")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
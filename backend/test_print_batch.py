@@ -0,0 +1,31 @@
+import pytest
+
+def test_print_batch_selections(make_db):
+    print("--- Starting Print Batch Test ---")
+    db = make_db()
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_product("Beta", 1.0, "", "Test")
+    db.add_instance(1, "A", 100, '', 1)
+    db.add_instance(2, "B", 100, '', 1)
+    ids = [db.create_order(f"Client {i}", [{'product_id': 1, 'quantity': i + 1}, {'product_id': 2, 'quantity': 1}])[1]
+           for i in range(5)]
+    db.update_order_status(ids[0], 'COMPLETED')
+
+    orders = db.get_print_batch([ids[3], ids[1]])
+    assert [o['id'] for o in orders] == [ids[1], ids[3]]
+    assert orders[1]['business_name'] == "Client 3"
+    assert orders[1]['items'] == [{'quantity': 4, 'name': "Alpha", 'product_id': 1},
+                                  {'quantity': 1, 'name': "Beta", 'product_id': 2}]
+    print("Explicit ids: headers and items grouped per order")
+
+    pending = db.get_print_batch(status='PENDING')
+    assert [o['id'] for o in pending] == ids[1:]
+    assert len(db.get_print_batch(status='PENDING', limit=2)) == 2
+
+    wave = db.plan_wave(1, max_orders=2)
+    assert [o['id'] for o in db.get_print_batch(wave_id=wave['id'])] == wave['order_ids']
+    assert db.get_print_batch([999]) == []
+    print("Status and wave selections")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,30 @@
+import pytest
+
+def test_search_prefix_ranking_and_sync(make_db):
+    print("--- Starting Product Search Test ---")
+    db = make_db()
+    db.add_product("Espresso Shot", 2.5, "Rich and bold single shot", "Coffee")
+    db.add_product("Cappuccino", 3.4, "Steamed milk foam with espresso", "Coffee")
+    db.add_product("Green Tea", 2.75, "Organic Japanese Sencha", "Tea")
+
+    # Prefix match, name hits rank above description hits
+    results = db.search_products("espr")
+    assert [r['name'] for r in results] == ['Espresso Shot', 'Cappuccino']
+    assert [r['name'] for r in db.search_products("coffee milk")] == ['Cappuccino']
+    assert db.search_products("") == []
+    assert len(db.search_products("co", limit=1)) == 1
+
+    # Index follows renames and deletes, stock changes keep results intact
+    conn = db._get_connection()
+    conn.execute("UPDATE products SET name = 'Matcha' WHERE name = 'Green Tea'")
+    conn.execute("DELETE FROM products WHERE name = 'Cappuccino'")
+    conn.commit()
+    conn.close()
+    db.update_quantity(1, 5, 1)
+    assert [r['name'] for r in db.search_products("matc")] == ['Matcha']
+    assert db.search_products("green") == []
+    assert [r['quantity'] for r in db.search_products("espresso")] == [5]
+    print("--- Test Passed ---")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
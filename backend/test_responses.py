@@ -0,0 +1,48 @@
+import gzip
+import json
+from flask import Flask, jsonify, Response
+from responses import FastJSONProvider, compress_responses
+
+def make_app():
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    compress_responses(app, threshold=200)
+
+    @app.route('/small')
+    def small():
+        return jsonify({"status": "ok"})
+
+    @app.route('/big')
+    def big():
+        return jsonify([{"id": i, "name": f"Product {i}", "stock_breakdown": {1: i, 2: 0}} for i in range(100)])
+
+    @app.route('/stream')
+    def stream():
+        return Response((b'{"a":1}\n' for _ in range(100)), mimetype='application/json')
+
+    return app
+
+def test_json_and_gzip():
+    print("--- Starting Response Layer Test ---")
+    client = make_app().test_client()
+
+    small = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+    assert small.json == {"status": "ok"}
+
+    big = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert big.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in big.headers['Vary']
+    payload = json.loads(gzip.decompress(big.data))
+    assert payload[5] == {"id": 5, "name": "Product 5", "stock_breakdown": {"1": 5, "2": 0}}
+    print(f"Big payload gzipped: {len(gzip.decompress(big.data))} -> {len(big.data)} bytes")
+
+    plain = client.get('/big')
+    assert 'Content-Encoding' not in plain.headers and plain.json == payload
+
+    streamed = client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in streamed.headers and streamed.data.count(b'\n') == 100
+    print("Small, identity and streamed responses untouched")
+
+if __name__ == "__main__":
+    test_json_and_gzip()
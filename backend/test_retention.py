@@ -0,0 +1,98 @@
+import time
+import pytest
+from database import Database
+from retention import RetentionManager
+from migrate_db import enable_incremental_vacuum
+
+def test_rollup_and_archive(make_path):
+    print("--- Starting Retention Test ---")
+    db = Database(make_path())
+    archive_path = make_path('_archive.db')
+    db.add_product("Retention Product", 1.0, "", "Test")
+
+    conn = db._get_connection()
+    # 3 old scans on one day, 1 recent scan
+    for _ in range(3):
+        conn.execute("INSERT INTO scans (barcode, quantity, timestamp) VALUES ('OLD', 2, datetime('now', '-40 days'))")
+    conn.execute("INSERT INTO scans (barcode, quantity) VALUES ('NEW', 1)")
+    # One old picked instance, one old in-stock instance, one recent picked instance
+    conn.execute("INSERT INTO item_instances (product_id, barcode, status, scan_time) VALUES (1, 'A', 'Picked', datetime('now', '-100 days'))")
+    conn.execute("INSERT INTO item_instances (product_id, barcode, status, scan_time) VALUES (1, 'B', 'In Stock', datetime('now', '-100 days'))")
+    conn.execute("INSERT INTO item_instances (product_id, barcode, status) VALUES (1, 'C', 'Picked')")
+    # Old lots: fully picked (archived, with its picked unit), partly picked, and fully picked but
+    # still referenced by a unit in main; plus a recent fully picked lot
+    conn.execute("INSERT INTO item_lots (product_id, barcode, quantity, picked_quantity, received_at) VALUES (1, 'L1', 2, 2, datetime('now', '-100 days'))")
+    conn.execute("INSERT INTO item_lots (product_id, barcode, quantity, picked_quantity, received_at) VALUES (1, 'L2', 2, 1, datetime('now', '-100 days'))")
+    conn.execute("INSERT INTO item_lots (product_id, barcode, quantity, picked_quantity, received_at) VALUES (1, 'L3', 1, 1, datetime('now', '-100 days'))")
+    conn.execute("INSERT INTO item_lots (product_id, barcode, quantity, picked_quantity) VALUES (1, 'L4', 1, 1)")
+    conn.execute("UPDATE item_instances SET lot_id = 1 WHERE barcode = 'A'")
+    conn.execute("UPDATE item_instances SET lot_id = 3 WHERE barcode = 'B'")
+    conn.commit()
+    conn.close()
+
+    stats = RetentionManager(db, archive_path, scan_days=30, instance_days=90, batch_size=2).run_once()
+    assert stats['scans_rolled_up'] == 3
+    assert stats['instances_archived'] == 1
+    assert stats['lots_archived'] == 1
+
+    conn = db._get_connection()
+    assert [r['barcode'] for r in conn.execute("SELECT barcode FROM scans")] == ['NEW']
+    daily = conn.execute("SELECT barcode, scan_count, quantity FROM scan_daily").fetchall()
+    assert [tuple(r) for r in daily] == [('OLD', 3, 6)]
+    assert sorted(r['barcode'] for r in conn.execute("SELECT barcode FROM item_instances")) == ['B', 'C']
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+    assert [tuple(r) for r in conn.execute("SELECT barcode, lot_id FROM archive.item_instances")] == [('A', 1)]
+    assert [r['barcode'] for r in conn.execute("SELECT barcode FROM archive.item_lots")] == ['L1']
+    assert [r['barcode'] for r in conn.execute("SELECT barcode FROM item_lots ORDER BY id")] == ['L2', 'L3', 'L4']
+    assert conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] == 2
+    conn.close()
+    print("--- Test Passed ---")
+
+def test_legacy_database_is_not_vacuumed(make_path):
+    print("--- Starting Retention Legacy Vacuum Test ---")
+    db = Database(make_path())
+    archive_path = make_path('_archive.db')
+    conn = db._get_connection()
+    conn.execute("PRAGMA auto_vacuum = NONE")
+    conn.execute("VACUUM")
+    conn.close()
+
+    # No full VACUUM from the retention thread: it reports nothing freed and leaves the mode
+    stats = RetentionManager(db, archive_path).run_once()
+    assert stats['pages_freed'] == 0
+    conn = db._get_connection()
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    conn.close()
+
+    # The offline migration converts it
+    enable_incremental_vacuum(db.db_name)
+    conn = db._get_connection()
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    conn.close()
+
+def test_batches_start_small(make_path):
+    print("--- Starting Retention Batch Size Test ---")
+    db = Database(make_path())
+    manager = RetentionManager(db, make_path('_archive.db'), lock_budget_ms=50, batch_size=500)
+    conn = manager._get_connection()
+    sizes = []
+
+    # 2 ms per row: the first batch is the calibration size, the rest fit the budget
+    def slow_batch(conn, cutoff, batch_size):
+        sizes.append(batch_size)
+        time.sleep(batch_size * 0.002)
+        return batch_size if len(sizes) < 4 else 0
+    assert manager._run_batches(conn, slow_batch, "-1 days") == sum(sizes[:3])
+    assert sizes[0] == 50 and all(size <= 25 for size in sizes[1:])
+
+    # Cheap rows grow the batch, up to batch_size
+    sizes.clear()
+    def fast_batch(conn, cutoff, batch_size):
+        sizes.append(batch_size)
+        return batch_size if len(sizes) < 6 else 0
+    manager._run_batches(conn, fast_batch, "-1 days")
+    assert sizes == [50, 100, 200, 400, 500, 500]
+    conn.close()
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
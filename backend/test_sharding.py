@@ -0,0 +1,191 @@
+import os
+import sqlite3
+import time
+import pytest
+from database import Database
+from retention import RetentionManager
+from snapshot import ReportSnapshot
+
+def make_sharded(make_path, **kwargs):
+    path = make_path()
+    return Database(path, shard_dir=path + '.shards', **kwargs)
+
+def shard_rows(db, warehouse_id, sql):
+    conn = sqlite3.connect(db.shards[warehouse_id])
+    rows = conn.execute(sql).fetchall()
+    conn.close()
+    return rows
+
+def test_receipts_land_in_their_shard(make_path):
+    print("--- Starting Sharded Receipt Test ---")
+    db = make_sharded(make_path)
+    db.add_product("Alpha", 2.0, "", "Test")
+    assert db.add_instance(1, "A1", 10, '', 1) == (True, "Added 10 items")
+    assert db.add_instance(1, "A2", 5, '', 2)
+    assert db.update_quantity(1, -1, 2)
+
+    # Rows live in the warehouse's file, reads see them through the views
+    assert sorted(db.shards) == [1, 2, 3]
+    assert shard_rows(db, 1, "SELECT barcode, quantity FROM item_lots") == [('A1', 10)]
+    assert shard_rows(db, 2, "SELECT product_id, quantity FROM warehouse_stock") == [(1, 4)]
+    assert shard_rows(db, 2, "SELECT barcode FROM scans") == [('A2',)]
+    conn = sqlite3.connect(db.db_name)
+    assert conn.execute("SELECT COUNT(*) FROM item_lots").fetchone() == (0,)
+    assert conn.execute("SELECT COUNT(*) FROM scans").fetchone() == (0,)
+    conn.close()
+    assert db.get_all_products()[0]['stock_breakdown'] == {1: 10, 2: 4}
+    assert sorted(i['barcode'] for i in db.get_instances(1)) == ['A1', 'A2']
+    print("Receipts written to the owning shard")
+
+    # Folded into the core file: totals, ledger and rollups as without shards
+    assert db.get_product_by_id(1)['quantity'] == 14
+    assert db.check_stock_totals() == []
+    assert [(r['warehouse_id'], r['quantity']) for r in db.get_stock_at('9999-01-01 00:00:00')] == [(1, 10), (2, 4)]
+    assert sorted((series, units) for _, series, units in db.get_rollup_rows('stock_in', 'warehouse', '2000-01-01')) == \
+        [('Warehouse 1', 10), ('Warehouse 2', 5)]
+
+    # Ids stay unique across shards
+    lot_ids = [i['lot_id'] for i in db.get_instances(1)]
+    assert len(set(lot_ids)) == 2 and max(lot_ids) > 2 << 40
+    print("Core totals, ledger and rollups follow the shards")
+
+def test_orders_picks_and_waves(make_path):
+    print("--- Starting Sharded Order Test ---")
+    db = make_sharded(make_path)
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_instance(1, "A", 2, '', 1)
+    db.add_instance(1, "B", 3, '', 2)
+    success, order_id = db.create_order("Client", [{'product_id': 1, 'quantity': 4}])
+    assert success
+    allocations = db.get_orders_details([order_id])[order_id]['allocations']
+    assert sorted((a['warehouse_id'], a['quantity']) for a in allocations) == [(1, 2), (2, 2)]
+    assert shard_rows(db, 2, "SELECT quantity FROM order_item_allocations") == [(2,)]
+    assert db.get_product_by_id(1)['quantity'] == 1
+    assert db.create_order("Client", [{'product_id': 1, 'quantity': 2}]) == \
+        (False, "Insufficient total stock for Product 1")
+
+    # Warehouse 1 picks unit by unit, warehouse 2 in a wave; the order completes across both
+    assert db.record_pick(order_id, 1, "A", "Dana")[0]
+    assert db.record_pick(order_id, 1, "A", "Dana")[0]
+    assert not db.record_pick(order_id, 1, "B", "Dana")[0]
+    wave = db.plan_wave(2)
+    assert wave['order_ids'] == [order_id]
+    success, result = db.confirm_wave(wave['id'], ["B", "B"], "Dana")
+    assert success and result['picked'] == {1: 2}
+    assert [o['id'] for o in db.get_orders(status='COMPLETED')] == [order_id]
+    assert shard_rows(db, 2, "SELECT COUNT(*) FROM item_instances WHERE status = 'Picked'") == [(2,)]
+    assert [units for _, _, units in db.get_rollup_rows('units', 'product', '2000-01-01')] == [4]
+    assert db.check_stock_totals() == []
+    print("Orders, picks and waves write each warehouse's shard")
+
+def test_adjustments_and_alerts(make_path):
+    print("--- Starting Sharded Alert Test ---")
+    db = make_sharded(make_path)
+    raised = []
+    db.on_low_stock(raised.append)
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.set_stock_threshold(1, 5)
+    db.add_instance(1, "A", 10, '', 1)
+    db.add_instance(1, "B", 10, '', 2)
+
+    db.update_quantity(1, -6, 1)
+    assert [(a['warehouse_id'], a['quantity']) for a in raised] == [(1, 4)]
+    success, report = db.adjust_stock([{'product_id': 1, 'warehouse_id': 1, 'counted': 20},
+                                       {'product_id': 1, 'warehouse_id': 2, 'counted': 1}])
+    assert success and report['units_delta'] == 7
+    assert [(a['warehouse_id'], a['quantity']) for a in raised] == [(1, 4), (2, 1)]
+    assert [a['warehouse_id'] for a in db.get_stock_alerts()] == [2]
+    assert db.get_all_products()[0]['stock_breakdown'] == {1: 20, 2: 1}
+    assert db.adjust_stock([{'product_id': 1, 'warehouse_id': 9, 'counted': 1}]) == \
+        (False, "Unknown product or warehouse for product 1")
+    assert db.check_stock_totals() == []
+    print("Threshold crossings are raised once, from the fold")
+
+def test_existing_rows_move_to_shards(make_path):
+    print("--- Starting Shard Migration Test ---")
+    path = make_path()
+    db = Database(path)
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_instance(1, "A", 5, '', 1)
+    db.add_instance(1, "B", 5, '', 2)
+    db.log_scan("LOOSE")
+    success, order_id = db.create_order("Client", [{'product_id': 1, 'quantity': 7}])
+    before = db.get_all_products()
+
+    db = Database(path, shard_dir=path + '.shards')
+    assert db.get_all_products() == before
+    assert shard_rows(db, 2, "SELECT barcode FROM item_lots") == [('B',)]
+    assert shard_rows(db, 2, "SELECT quantity FROM order_item_allocations") == [(2,)]
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM item_lots").fetchone() == (0,)
+    assert conn.execute("SELECT COUNT(*) FROM order_item_allocations").fetchone() == (0,)
+    assert conn.execute("SELECT barcode FROM scans ORDER BY id").fetchall() == [('A',), ('B',), ('LOOSE',)]
+    conn.close()
+
+    # Nothing is folded twice, and new rows get new ids
+    assert [units for _, _, units in db.get_rollup_rows('stock_in', 'product', '2000-01-01')] == [10]
+    assert db.record_pick(order_id, 2, "B", "Dana")[0]
+    db.add_instance(1, "C", 1, '', 2)
+    assert db.get_product_by_id(1)['quantity'] == 4
+    assert len({i['lot_id'] for i in db.get_instances(1) if i['instance_id'] is None}) == 3
+    assert db.check_stock_totals() == []
+    print("Existing warehouse rows moved into new shards")
+
+def test_shards_lock_independently(make_path):
+    print("--- Starting Shard Lock Test ---")
+    db = make_sharded(make_path, single_writer=True)
+    try:
+        db.add_product("Alpha", 1.0, "", "Test")
+        db.add_instance(1, "A", 5, '', 1)
+        matrix = db.enable_stock_matrix()
+
+        # Warehouse 1's file is write-locked: warehouse 2 receives anyway
+        blocker = sqlite3.connect(db.shards[1], isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        start = time.monotonic()
+        assert db.add_instance(1, "B", 3, '', 2) == (True, "Added 3 items")
+        assert time.monotonic() - start < 2
+        blocker.execute("ROLLBACK")
+        blocker.close()
+
+        assert db.add_instance(1, "A", 1, '', 1)
+        assert matrix.breakdown(1) == {1: 6, 2: 3}
+        assert matrix.check() == []
+        print("A locked warehouse does not hold up the others")
+    finally:
+        db.close()
+
+def test_retention_and_snapshot(make_path):
+    print("--- Starting Sharded Retention Test ---")
+    db = make_sharded(make_path)
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_instance(1, "A", 1, '', 2)
+    success, order_id = db.create_order("Client", [{'product_id': 1, 'quantity': 1}])
+    db.record_pick(order_id, 2, "A", "Dana")
+    conn = sqlite3.connect(db.shards[2])
+    conn.execute("UPDATE scans SET timestamp = datetime('now', '-40 days')")
+    conn.execute("UPDATE item_instances SET scan_time = datetime('now', '-100 days')")
+    conn.execute("UPDATE item_lots SET received_at = datetime('now', '-100 days')")
+    conn.commit()
+    conn.close()
+
+    stats = RetentionManager(db, make_path('_archive.db'), scan_days=30, instance_days=90).run_once()
+    assert (stats['scans_rolled_up'], stats['instances_archived'], stats['lots_archived']) == (1, 1, 1)
+    assert shard_rows(db, 2, "SELECT COUNT(*) FROM item_lots") == [(0,)]
+    conn = sqlite3.connect(db.db_name)
+    assert conn.execute("SELECT barcode, scan_count FROM scan_daily").fetchall() == [('A', 1)]
+    conn.close()
+    print("Retention works through every shard")
+
+    # Report snapshots copy the shards along with the core file
+    db.add_instance(1, "B", 4, '', 3)
+    snapshot = ReportSnapshot(db, make_path())
+    snapshot.refresh()
+    assert os.path.exists(os.path.join(snapshot.shard_dir, 'warehouse_3.db'))
+    assert snapshot.reader.get_all_products()[0]['stock_breakdown'] == {2: 0, 3: 4}
+    db.update_quantity(1, 1, 3)
+    assert snapshot.reader.get_all_products()[0]['stock_breakdown'] == {2: 0, 3: 4}
+    print("Snapshot reads its own copies of the shards")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,56 @@
+import os
+import time
+import pytest
+from database import Database
+from snapshot import ReportSnapshot
+
+def test_snapshot_refresh_and_isolation(make_path):
+    print("--- Starting Report Snapshot Test ---")
+    db = Database(make_path())
+    db.add_product("Snap Product", 2.0, "", "Test")
+    db.add_instance(1, "SNAP", 5, '', 1)
+
+    snapshot = ReportSnapshot(db, make_path(), interval=3600, max_writes=3)
+    assert not snapshot.ready() and snapshot.age() is None
+    assert snapshot._due()
+    snapshot.refresh()
+    assert snapshot.ready() and snapshot.age() < 5
+    assert not snapshot._due()
+
+    assert snapshot.reader.get_all_products()[0]['quantity'] == 5
+    print("Snapshot matches the live database")
+
+    # Live writes are not visible until the next refresh
+    db.update_quantity(1, 10, 1)
+    assert snapshot.reader.get_all_products()[0]['quantity'] == 5
+    assert db.get_all_products()[0]['quantity'] == 15
+
+    # A report that is mid-read keeps its copy across a refresh
+    export = snapshot.reader.iter_export('products', batch_size=1)
+    next(export)
+    db.update_quantity(1, 1, 1)
+    db.update_quantity(1, 1, 1)
+    assert snapshot._due()
+    snapshot.refresh()
+    assert [row[5] for batch in export for row in batch] == [5]
+    assert snapshot.reader.get_all_products()[0]['quantity'] == 17
+    print("Refresh after max_writes; open readers keep the old copy")
+
+    # The copy is read-only
+    assert not snapshot.reader.add_product("Nope", 1.0, "", "Test")
+    assert len(snapshot.reader.get_all_products()) == 1
+
+def test_stale_snapshot_is_not_ready(make_path):
+    print("--- Starting Stale Snapshot Test ---")
+    db = Database(make_path())
+    snapshot = ReportSnapshot(db, make_path(), interval=60)
+    snapshot.refresh()
+    assert snapshot.ready() and snapshot.max_age == 180
+
+    # A copy left behind by an earlier run (or a stalled refresher) falls back to the live database
+    old = time.time() - 181
+    os.utime(snapshot.snapshot_path, (old, old))
+    assert not snapshot.ready() and snapshot.age() > 180
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
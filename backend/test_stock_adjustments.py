@@ -0,0 +1,56 @@
+import sqlite3
+import pytest
+
+def test_cycle_count(make_db):
+    print("--- Starting Cycle Count Test ---")
+    db = make_db()
+    db.add_product("Alpha", 2.0, "", "Test")
+    db.add_product("Beta", 1.0, "", "Test")
+    db.add_instance(1, "A", 10, '', 1)
+    db.add_instance(2, "B", 5, '', 2)
+
+    success, report = db.adjust_stock([
+        {'product_id': 1, 'warehouse_id': 1, 'counted': 7},   # 3 missing
+        {'product_id': 2, 'warehouse_id': 2, 'change': 2},    # 2 found
+        {'product_id': 2, 'warehouse_id': 3, 'counted': 4},   # no stock row yet
+        {'product_id': 1, 'warehouse_id': 2, 'counted': 0},   # nothing there, nothing changes
+    ])
+    assert success
+    assert report['lines'] == 4 and report['changed'] == 3
+    assert report['units_delta'] == 3 and report['value_delta'] == 0.0
+    by_key = {(v['product_id'], v['warehouse_id']): v for v in report['variances']}
+    assert by_key[(1, 1)] == {'product_id': 1, 'name': "Alpha", 'warehouse_id': 1,
+                              'before': 10, 'after': 7, 'delta': -3, 'value': -6.0}
+    assert (by_key[(2, 2)]['before'], by_key[(2, 2)]['after']) == (5, 7)
+    assert (by_key[(2, 3)]['before'], by_key[(2, 3)]['after']) == (0, 4)
+    assert report['variances'][0]['product_id'] == 1  # largest value first
+    print("Counted and delta lines applied, variance report returned")
+
+    conn = sqlite3.connect(db.db_name)
+    stock = conn.execute("SELECT product_id, warehouse_id, quantity FROM warehouse_stock ORDER BY 1, 2").fetchall()
+    totals = conn.execute("SELECT id, quantity FROM products ORDER BY id").fetchall()
+    conn.close()
+    assert stock == [(1, 1, 7), (2, 2, 7), (2, 3, 4)]
+    assert totals == [(1, 7), (2, 11)]
+
+def test_invalid_count_changes_nothing(make_db):
+    print("--- Starting Invalid Cycle Count Test ---")
+    db = make_db()
+    db.add_product("Alpha", 2.0, "", "Test")
+    db.add_instance(1, "A", 10, '', 1)
+    for lines in ([{'product_id': 1, 'warehouse_id': 1, 'counted': 3},
+                   {'product_id': 99, 'warehouse_id': 1, 'counted': 3}],
+                  [{'product_id': 1, 'warehouse_id': 1, 'counted': 3},
+                   {'product_id': 1, 'warehouse_id': 1, 'change': 1}],
+                  [{'product_id': 1, 'warehouse_id': 1, 'counted': 3, 'change': 1}],
+                  [{'product_id': 1, 'warehouse_id': 1, 'counted': -1}],
+                  # JSON booleans are not quantities or ids
+                  [{'product_id': True, 'warehouse_id': 1, 'counted': False}],
+                  [{'product_id': 1, 'warehouse_id': 1, 'change': True}]):
+        success, message = db.adjust_stock(lines)
+        assert not success and message
+    assert db.get_all_products()[0]['quantity'] == 10
+    print("Rejected counts leave stock untouched")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
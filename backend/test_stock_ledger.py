@@ -0,0 +1,61 @@
+import sqlite3
+import pytest
+
+def backdate(db, seconds):
+    # Shift all recorded history back, as if it happened `seconds` ago
+    conn = sqlite3.connect(db.db_name)
+    conn.execute("UPDATE stock_movements SET at = datetime(at, ?)", (f"-{seconds} seconds",))
+    conn.execute("UPDATE stock_snapshots SET taken_at = datetime(taken_at, ?)", (f"-{seconds} seconds",))
+    conn.commit()
+    conn.close()
+
+def test_ledger_records_movements(make_db):
+    print("--- Starting Stock Ledger Test ---")
+    db = make_db()
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_instance(1, "A", 10, '', 1)
+    db.add_instance(1, "A2", 5, '', 2)
+    db.update_quantity(1, -2, 1)
+    db.create_order("Client", [{'product_id': 1, 'quantity': 9}])
+
+    conn = sqlite3.connect(db.db_name)
+    deltas = conn.execute("SELECT warehouse_id, delta FROM stock_movements ORDER BY id").fetchall()
+    conn.close()
+    assert deltas == [(1, 10), (2, 5), (1, -2), (1, -8), (2, -1)]
+    print("Receipts, adjustments and orders land in the ledger")
+
+def test_point_in_time_stock(make_db):
+    print("--- Starting Point In Time Stock Test ---")
+    db = make_db()
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_product("Beta", 1.0, "", "Test")
+    db.add_instance(1, "A", 10, '', 1)
+    db.add_instance(2, "B", 4, '', 2)
+    backdate(db, 7200)
+    assert db.take_stock_snapshot()
+    db.update_quantity(1, -3, 1)
+    backdate(db, 3600)
+    # 3 hours ago: history starts, A=10 (W1), B=4 (W2); 1 hour ago: snapshot, then A=7; now: B sold
+    db.create_order("Client", [{'product_id': 2, 'quantity': 4}])
+
+    conn = sqlite3.connect(db.db_name)
+    at = lambda modifier: conn.execute("SELECT datetime('now', ?)", (modifier,)).fetchone()[0]
+    assert db.get_stock_at(at('-200 minutes')) is None
+    assert db.get_stock_at(at('-150 minutes')) == [
+        {'warehouse_id': 1, 'product_id': 1, 'quantity': 10},
+        {'warehouse_id': 2, 'product_id': 2, 'quantity': 4}]
+    assert db.get_stock_at(at('-30 minutes'), warehouse_id=1) == [{'warehouse_id': 1, 'product_id': 1, 'quantity': 7}]
+    # B sold out: rows at zero are left out
+    assert db.get_stock_at(at('+1 minute')) == [{'warehouse_id': 1, 'product_id': 1, 'quantity': 7}]
+    assert db.get_stock_at(at('+1 minute'), product_id=2) == []
+    print("Nearest snapshot plus the ledger tail")
+
+    # Snapshots don't change the answers, only how much is replayed
+    db.take_stock_snapshot()
+    assert db.get_ledger_status()['pending'] == 0
+    assert db.get_stock_at(at('+1 minute')) == [{'warehouse_id': 1, 'product_id': 1, 'quantity': 7}]
+    assert db.get_stock_at(at('-30 minutes'), warehouse_id=1) == [{'warehouse_id': 1, 'product_id': 1, 'quantity': 7}]
+    conn.close()
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
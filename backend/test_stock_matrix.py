@@ -0,0 +1,95 @@
+import time
+import pytest
+from database import Database
+
+def test_write_through(make_db):
+    print("--- Starting Stock Matrix Test ---")
+    db = make_db()
+    db.add_product("Alpha", 2.0, "", "Test")
+    db.add_instance(1, "A", 10, '', 1)
+    matrix = db.enable_stock_matrix()
+    assert matrix.breakdown(1) == {1: 10}
+
+    # Every stock write lands in the matrix, including new products and warehouses
+    db.add_product("Beta", 1.5, "", "Test", pack_size=2)
+    db.add_instance(2, "B", 4, '', 2)
+    db.update_quantity(1, 5, 2)
+    assert db.create_order("Client", [{'product_id': 1, 'quantity': 12}]) == (True, 1)
+    db.adjust_stock([{'product_id': 2, 'warehouse_id': 2, 'counted': 3}])
+    assert matrix.breakdowns() == {1: {2: 3}, 2: {2: 3}}
+    assert matrix.available(1) == 3 and matrix.available(99) == 0
+    assert db.get_analytics_data()['inventory_value'] == 3 * 2.0 + 3 * 1.5 * 2
+    products = {p['id']: p['stock_breakdown'] for p in db.get_all_products()}
+    assert products == {1: {2: 3}, 2: {2: 3}}
+    print("Writes go through to the matrix")
+
+    # Quick reject from RAM, same message as the transaction
+    assert db.create_order("Client", [{'product_id': 1, 'quantity': 4}]) == \
+        (False, "Insufficient total stock for Product 1")
+    assert matrix.check() == []
+    print("Availability served from RAM")
+
+def test_consistency_check(make_db):
+    print("--- Starting Stock Matrix Check Test ---")
+    db = make_db()
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_instance(1, "A", 10, '', 1)
+    matrix = db.enable_stock_matrix()
+
+    # A write from another process is picked up from the ledger before an order is rejected
+    other = Database(db.db_name)
+    other.update_quantity(1, -4, 1)
+    assert db.create_order("Client", [{'product_id': 1, 'quantity': 6}])[0]
+    assert matrix.breakdown(1) == {} and matrix.available(1) == 0
+
+    # Drift (a bug, a restored backup) is reported and repaired by a reload
+    matrix.quantities[1, matrix.columns[1]] = 5
+    assert matrix.check() == [(1, 1, 5, 0)]
+    assert matrix.available(1) == 0
+    assert matrix.check() == []
+    print("Checker reloads a drifted matrix")
+
+def test_reads_stay_off_the_database(make_db):
+    print("--- Starting Stock Matrix Read Path Test ---")
+    db = make_db()
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_instance(1, "A", 10, '', 1)
+    matrix = db.enable_stock_matrix()
+
+    # Sync queries the ledger without holding the lock that RAM reads take
+    connect = db._get_connection
+    held = []
+    def checked_connection():
+        held.append(matrix.lock._is_owned())
+        return connect()
+    db._get_connection = checked_connection
+    other = Database(db.db_name)
+    other.update_quantity(1, -4, 1)
+
+    # Reads serve the matrix as it is; another process's write arrives with the next sync
+    assert db.get_all_products()[0]['stock_breakdown'] == {1: 10}
+    assert db.get_analytics_data()['inventory_value'] == 10.0
+    assert matrix.sync() == 1
+    assert db.get_all_products()[0]['stock_breakdown'] == {1: 6}
+    assert held and not any(held)
+    print("Reads served from RAM, sync outside the lock")
+
+def test_background_sync(make_db):
+    print("--- Starting Stock Matrix Background Sync Test ---")
+    db = make_db()
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_instance(1, "A", 10, '', 1)
+    matrix = db.enable_stock_matrix(sync_interval=0.05)
+    matrix.start()
+    try:
+        Database(db.db_name).update_quantity(1, -4, 1)
+        deadline = time.monotonic() + 5
+        while matrix.available(1) != 6 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert matrix.available(1) == 6
+    finally:
+        matrix.stop()
+    print("Timer picks up writes from other processes")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
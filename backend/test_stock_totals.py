@@ -0,0 +1,57 @@
+import random
+import sqlite3
+import pytest
+from database import Database
+
+def assert_totals_match(db):
+    mismatches = db.check_stock_totals()
+    assert mismatches == [], f"Totals diverged: {mismatches}"
+
+def test_totals_never_diverge(make_db):
+    print("--- Starting Stock Totals Property Test ---")
+
+    for seed in range(20):
+        rng = random.Random(seed)
+        db = make_db()
+        for i in range(5):
+            db.add_product(f"Product {i}", 1.0 + i, "", "Test")
+        pids = [p['id'] for p in db.get_all_products()]
+
+        for step in range(200):
+            op = rng.choice(['add_instance', 'update_quantity', 'create_order'])
+            pid = rng.choice(pids)
+            wid = rng.randint(1, 3)
+
+            if op == 'add_instance':
+                db.add_instance(pid, f"BC-{pid}-{step}", rng.randint(1, 5), '', wid)
+            elif op == 'update_quantity':
+                db.update_quantity(pid, rng.randint(-3, 3), wid)
+            else:
+                items = [{'product_id': p, 'quantity': rng.randint(1, 4)} for p in rng.sample(pids, 2)]
+                db.create_order(f"Client {step}", items)
+
+            assert_totals_match(db)
+
+    print("--- Test Passed ---")
+
+def test_legacy_totals_migrated(make_path):
+    # A database created before the triggers existed, with totals and no warehouse rows
+    path = make_path()
+
+    db = Database(path)
+    db.add_product("Legacy Product", 1.0, "", "Test")
+    conn = sqlite3.connect(path)
+    for trigger in ['trg_stock_insert', 'trg_stock_update', 'trg_stock_delete']:
+        conn.execute(f"DROP TRIGGER {trigger}")
+    conn.execute("UPDATE products SET quantity = 7")
+    conn.commit()
+    conn.close()
+
+    db = Database(path)
+    assert_totals_match(db)
+    product = db.get_all_products()[0]
+    assert product['quantity'] == 7
+    assert product['stock_breakdown'] == {1: 7}
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
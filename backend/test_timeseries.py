@@ -0,0 +1,102 @@
+import sqlite3
+from datetime import datetime, timedelta
+import pytest
+import timeseries
+from database import Database
+from timeseries import TimeSeries
+
+def test_rollups_follow_inserts(make_db):
+    print("--- Starting Hourly Rollup Test ---")
+    db = make_db()
+    db.add_product("Alpha", 2.5, "", "Tools")
+    db.add_product("Beta", 1.0, "", "Toys")
+    db.add_instance(1, "A", 100, '', 1)
+    db.add_instance(2, "B", 50, '', 1)
+    db.create_order("Client", [{'product_id': 1, 'quantity': 4}, {'product_id': 2, 'quantity': 1}])
+    db.create_order("Client", [{'product_id': 1, 'quantity': 2}])
+
+    conn = sqlite3.connect(db.db_name)
+    sales = conn.execute("SELECT product_id, units, revenue FROM sales_hourly ORDER BY product_id").fetchall()
+    daily = conn.execute("SELECT product_id, units, revenue FROM sales_daily ORDER BY product_id").fetchall()
+    stock_in = conn.execute("SELECT product_id, units FROM stock_in_daily ORDER BY product_id").fetchall()
+    conn.close()
+    assert sales == daily == [(1, 6, 15.0), (2, 1, 1.0)]
+    assert stock_in == [(1, 100), (2, 50)]
+    print("Triggers keep the hourly and daily rollups current")
+
+    # Rollups are seeded from existing rows when they are first created
+    conn = sqlite3.connect(db.db_name)
+    for table in ('sales_hourly', 'sales_daily', 'stock_in_hourly', 'stock_in_daily'):
+        conn.execute(f"DROP TABLE {table}")
+    conn.close()
+    db = Database(db.db_name)
+    conn = sqlite3.connect(db.db_name)
+    assert conn.execute("SELECT SUM(units), SUM(revenue) FROM sales_hourly").fetchone() == (7, 16.0)
+    assert conn.execute("SELECT SUM(units), SUM(revenue) FROM sales_daily").fetchone() == (7, 16.0)
+    conn.close()
+    print("Migration backfills the rollups")
+
+def test_timeseries_figure(make_db):
+    print("--- Starting Time Series Figure Test ---")
+    db = make_db()
+    for i in range(4):
+        db.add_product(f"P{i}", 1.0, "", "Cat A" if i < 2 else "Cat B")
+        db.add_instance(i + 1, f"B{i}", 100, '', 1)
+    for i in range(4):
+        db.create_order("Client", [{'product_id': i + 1, 'quantity': i + 1}])
+
+    ts = TimeSeries(db)
+    fig = ts.figure(metric='units', bucket='day', group_by='product', days=7, max_series=3)
+    names = [trace['name'] for trace in fig['data']]
+    assert names == ["P3", "P2", "Other"]
+    assert len(fig['data'][0]['x']) == 8  # 7 days back plus today
+    assert sum(fig['data'][2]['y']) == 3  # P1 + P0
+    print("Top series kept, the rest folded into Other")
+
+    by_category = ts.figure(metric='revenue', bucket='week', group_by='category', days=30)
+    assert {t['name']: sum(t['y']) for t in by_category['data']} == {"Cat B": 7.0, "Cat A": 3.0}
+    total = ts.figure(metric='stock_in', bucket='month', group_by='total', days=30)
+    assert sum(total['data'][0]['y']) == 400
+    hourly = ts.figure(metric='units', bucket='hour', group_by='warehouse', days=2)
+    assert len(hourly['data']) == 1 and sum(hourly['data'][0]['y']) == 10
+
+    assert ts.figure(metric='units', bucket='day', group_by='product', days=7, max_series=3) is fig
+    db.create_order("Client", [{'product_id': 1, 'quantity': 1}])
+    assert ts.figure(metric='units', bucket='day', group_by='product', days=7, max_series=3) is not fig
+    print("Figures cached until the rollups change")
+
+    fig = ts.figure(metric='units', bucket='day', group_by='product', days=7, max_series=3)
+    conn = sqlite3.connect(db.db_name)
+    conn.execute("UPDATE products SET name = 'Renamed' WHERE id = 4")
+    conn.commit()
+    renamed = ts.figure(metric='units', bucket='day', group_by='product', days=7, max_series=3)
+    assert renamed is not fig and renamed['data'][0]['name'] == "Renamed"
+    version = db.get_rollup_version()
+    conn.execute("DELETE FROM stock_in_daily WHERE product_id = 4")
+    conn.commit()
+    assert db.get_rollup_version() == version + 1
+    conn.close()
+    print("Renames and deletes invalidate the cache")
+
+    class Tomorrow(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.now(tz) + timedelta(days=1)
+
+    fig = ts.figure(metric='units', bucket='day', group_by='total', days=7)
+    timeseries.datetime = Tomorrow
+    try:
+        moved = ts.figure(metric='units', bucket='day', group_by='total', days=7)
+    finally:
+        timeseries.datetime = datetime
+    assert moved is not fig and moved['data'][0]['x'][-1] > fig['data'][0]['x'][-1]
+    print("The window slides with the current bucket")
+
+    try:
+        ts.figure(bucket='year')
+        assert False, "unknown bucket accepted"
+    except ValueError:
+        pass
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,52 @@
+import sqlite3
+import pytest
+
+def test_orders_draw_from_every_warehouse(make_db):
+    print("--- Starting Warehouse Priority Test ---")
+    db = make_db()
+    conn = sqlite3.connect(db.db_name)
+    conn.execute("INSERT INTO warehouses (name) VALUES ('Warehouse 4')")
+    conn.commit()
+    conn.close()
+    assert [w['id'] for w in db.get_warehouses()] == [1, 2, 3, 4]
+
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_instance(1, "A4", 5, '', 4)
+    db.add_instance(1, "A2", 3, '', 2)
+    success, order_id = db.create_order("Client", [{'product_id': 1, 'quantity': 7}])
+    assert success
+
+    conn = sqlite3.connect(db.db_name)
+    allocations = conn.execute(
+        "SELECT warehouse_id, quantity FROM order_item_allocations WHERE order_id = ? ORDER BY id", (order_id,)
+    ).fetchall()
+    stock = conn.execute("SELECT warehouse_id, quantity FROM warehouse_stock ORDER BY warehouse_id").fetchall()
+    conn.close()
+    assert allocations == [(2, 3), (4, 4)]
+    assert stock == [(2, 0), (4, 1)]
+    print("Warehouse 4 (not in the old hardcoded list) is allocated from, in id order")
+
+def test_unreachable_stock_rejects_order(make_db):
+    print("--- Starting Unallocatable Stock Test ---")
+    db = make_db()
+    db.add_product("Alpha", 1.0, "", "Test")
+    db.add_instance(1, "A", 2, '', 1)
+    # Stock left on a warehouse that no longer exists counts toward the total but cannot be allocated
+    conn = sqlite3.connect(db.db_name)
+    conn.execute("INSERT INTO warehouse_stock (product_id, warehouse_id, quantity) VALUES (1, 99, 5)")
+    conn.commit()
+    conn.close()
+    assert db.get_product_by_id(1)['quantity'] == 7
+
+    assert db.create_order("Client", [{'product_id': 1, 'quantity': 4}]) == \
+        (False, "Insufficient warehouse stock for Product 1")
+    conn = sqlite3.connect(db.db_name)
+    assert conn.execute("SELECT COUNT(*) FROM orders").fetchone() == (0,)
+    assert conn.execute("SELECT warehouse_id, quantity FROM warehouse_stock ORDER BY warehouse_id").fetchall() == \
+        [(1, 2), (99, 5)]
+    conn.close()
+    assert db.create_order("Client", [{'product_id': 1, 'quantity': 2}])[0]
+    print("Short orders are rejected instead of driving a warehouse negative")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
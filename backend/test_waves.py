@@ -0,0 +1,50 @@
+import pytest
+
+def test_wave_plan_and_confirm(make_db):
+    print("--- Starting Wave Picking Test ---")
+    db = make_db()
+    db.add_product("Wave A", 1.0, "", "Test")
+    db.add_product("Wave B", 1.0, "", "Test")
+    db.add_instance(1, "A-BC", 10, '', 1)
+    db.add_instance(2, "B-BC", 10, '', 1)
+
+    order_ids = []
+    for qty_a, qty_b in [(2, 1), (3, 0), (1, 4)]:
+        items = [{'product_id': 1, 'quantity': qty_a}]
+        if qty_b:
+            items.append({'product_id': 2, 'quantity': qty_b})
+        order_ids.append(db.create_order("Client", items)[1])
+
+    # Wave limited to the two oldest orders: A = 2 + 3, B = 1
+    wave = db.plan_wave(1, max_orders=2)
+    assert sorted(wave['order_ids']) == order_ids[:2]
+    assert [(i['name'], i['quantity'], i['order_count']) for i in wave['items']] == [('Wave A', 5, 2), ('Wave B', 1, 1)]
+
+    # Next wave only gets what the first one did not claim
+    second = db.plan_wave(1, max_orders=10)
+    assert second['order_ids'] == [order_ids[2]]
+    # Nothing left to claim: no (empty) wave is created
+    assert db.plan_wave(1) is None
+
+    # 4 units of A scanned: order 1 gets 2, order 2 gets 2 of 3; B fully picked; one unknown barcode
+    success, result = db.confirm_wave(wave['id'], ["A-BC"] * 4 + ["B-BC", "NOPE"], "worker")
+    assert success
+    assert result['picked'] == {1: 4, 2: 1}
+    assert result['surplus'] == {}
+    assert result['unknown_barcodes'] == ['NOPE']
+    assert [(i['name'], i['quantity']) for i in result['items']] == [('Wave A', 1), ('Wave B', 0)]
+
+    statuses = {o['id']: o['status'] for o in db.get_orders()}
+    assert statuses[order_ids[0]] == 'COMPLETED'
+    assert statuses[order_ids[1]] == 'PENDING'
+    assert db.confirm_wave(wave['id'], ["A-BC"], "worker")[0] is False
+
+    # Surplus: more units than the wave needs
+    success, result = db.confirm_wave(second['id'], ["A-BC"] * 3 + ["B-BC"] * 4, "worker")
+    assert result['picked'] == {1: 1, 2: 4}
+    assert result['surplus'] == {1: 2}
+    assert {o['id']: o['status'] for o in db.get_orders()}[order_ids[2]] == 'COMPLETED'
+    print("--- Test Passed ---")
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,45 @@
+import threading
+import pytest
+
+def test_concurrent_writers_single_writer(make_db):
+    print("--- Starting Single Writer Test ---")
+    db = make_db(single_writer=True)
+    db.add_product("Queued Product", 1.0, "", "Test")
+
+    def worker(n):
+        for i in range(50):
+            assert db.update_quantity(1, 1, n % 3 + 1)
+            db.log_scan(f"BC{n}-{i}")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert db.get_product_by_id(1)['quantity'] == 1000
+    assert db.check_stock_totals() == []
+    conn = db._get_connection()
+    assert conn.execute("SELECT COUNT(*) FROM scans").fetchone()[0] == 1000
+    conn.close()
+
+    db.close()
+    print("--- Test Passed ---")
+
+def test_failed_command_only_rolls_back_itself(make_db):
+    db = make_db(single_writer=True)
+    db.add_product("Queued Product", 1.0, "", "Test")
+    db.add_instance(1, "BC1", 2, '', 1)
+
+    # Over-ordering raises inside the writer, the order row must not survive
+    success, message = db.create_order("Too Big", [{'product_id': 1, 'quantity': 5}])
+    assert not success and 'Insufficient' in message
+    success, order_id = db.create_order("Fits", [{'product_id': 1, 'quantity': 2}])
+    assert success
+    assert [o['business_name'] for o in db.get_orders()] == ['Fits']
+    assert db.get_product_by_id(1)['quantity'] == 0
+
+    db.close()
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
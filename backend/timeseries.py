@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+# Period frequencies; weeks start on Monday
+BUCKETS = {'hour': 'h', 'day': 'D', 'week': 'W-SUN', 'month': 'M'}
+METRICS = ('units', 'revenue', 'stock_in')
+
+class TimeSeries:
+    """Sales and stock-in charts built from the hourly and daily rollup tables.
+
+    SQL sums the rollups per (period, series), reading the daily tables unless
+    hourly buckets are asked for; pandas re-buckets them into hours, days,
+    weeks or months, fills empty buckets with zeros and keeps the
+    top max_series series (the rest are summed into "Other"). The result is a
+    Plotly figure dict ready for Plotly.newPlot, cached per query until the
+    rollups or series names change (see Database.get_rollup_version) or the
+    window slides into a new hour (hourly buckets) or day.
+    """
+
+    def __init__(self, db, cache_size=64):
+        self.db = db
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def figure(self, metric='units', bucket='day', group_by='product', days=90,
+               warehouse_id=None, max_series=10):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        if bucket not in BUCKETS:
+            raise ValueError(f"Unknown bucket: {bucket}")
+        if group_by not in self.db.ROLLUP_GROUPS:
+            raise ValueError(f"Unknown grouping: {group_by}")
+
+        # Rollup periods are UTC (orders.timestamp is CURRENT_TIMESTAMP)
+        now = datetime.now(timezone.utc).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+        if bucket != 'hour':
+            now = now.replace(hour=0)
+        key = (metric, bucket, group_by, days, warehouse_id, max_series, now, self.db.get_rollup_version())
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        fig = self._build(metric, bucket, group_by, days, warehouse_id, max_series, now)
+        with self.lock:
+            self.cache[key] = fig
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return fig
+
+    def _build(self, metric, bucket, group_by, days, warehouse_id, max_series, now):
+        if pd is None:
+            raise RuntimeError("pandas is required for time-series analytics")
+
+        # now: the current hour for hourly buckets, otherwise the start of today
+        start = now - timedelta(days=days)
+        if bucket == 'hour':
+            rows = self.db.get_rollup_rows(metric, group_by, start.strftime('%Y-%m-%d %H:00:00'), warehouse_id)
+        else:
+            rows = self.db.get_rollup_rows(metric, group_by, start.strftime('%Y-%m-%d'), warehouse_id,
+                                           resolution='daily')
+
+        freq = BUCKETS[bucket]
+        index = pd.period_range(start, now, freq=freq).start_time
+        if rows:
+            df = pd.DataFrame.from_records(rows, columns=['period', 'series', 'value'])
+            df['bucket'] = pd.to_datetime(df['period']).dt.to_period(freq).dt.start_time
+            table = (df.groupby(['bucket', 'series'])['value'].sum()
+                       .unstack(fill_value=0)
+                       .reindex(index, fill_value=0))
+        else:
+            table = pd.DataFrame(index=index)
+
+        totals = table.sum().sort_values(ascending=False)
+        if len(totals) > max_series:
+            keep = list(totals.index[:max_series - 1])
+            table = table[keep].assign(Other=table.drop(columns=keep).sum(axis=1))
+        else:
+            table = table[list(totals.index)]
+
+        x = [ts.strftime('%Y-%m-%d %H:%M') if bucket == 'hour' else ts.strftime('%Y-%m-%d')
+             for ts in table.index]
+        traces = [{
+            'type': 'scatter',
+            'mode': 'lines',
+            'name': str(name),
+            'x': x,
+            'y': table[name].round(2).tolist(),
+        } for name in table.columns]
+
+        return {
+            'data': traces,
+            'layout': {
+                'paper_bgcolor': 'rgba(0,0,0,0)',
+                'plot_bgcolor': 'rgba(0,0,0,0)',
+                'font': {'color': '#f0f0f0', 'family': 'Rubik'},
+                'xaxis': {'gridcolor': '#444'},
+                'yaxis': {'gridcolor': '#444', 'rangemode': 'tozero'},
+                'legend': {'orientation': 'h'},
+                'margin': {'t': 20, 'b': 40, 'l': 50, 'r': 20},
+            },
+        }
@@ -0,0 +1,88 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+class WriteQueue:
+    """Single writer thread that owns the only write connection.
+
+    Commands are (fn, args) pairs where fn(cursor, *args) runs inside a
+    transaction. Commands that arrive together are group-committed: each runs
+    in its own savepoint (a failing command only rolls back itself) and the
+    whole group is committed once. Callers get results through futures, which
+    are resolved after the commit.
+    """
+
+    def __init__(self, db_name, max_batch=64):
+        self.db_name = db_name
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._writer_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.queue.put(None)
+        self.thread.join()
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.queue.put((future, fn, args))
+        return future
+
+    def _writer_loop(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            while self.running:
+                batch = [self.queue.get()]
+                while len(batch) < self.max_batch:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                commands = [cmd for cmd in batch if cmd is not None]
+                if commands:
+                    self._run_batch(conn, commands)
+        finally:
+            conn.close()
+
+    def _run_batch(self, conn, commands):
+        cursor = conn.cursor()
+        results = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for future, fn, args in commands:
+                cursor.execute("SAVEPOINT cmd")
+                try:
+                    results.append((future, fn(cursor, *args), None))
+                    cursor.execute("RELEASE cmd")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO cmd")
+                    cursor.execute("RELEASE cmd")
+                    results.append((future, None, e))
+            cursor.execute("COMMIT")
+        except Exception as e:
+            # Commit (or BEGIN) failed: nothing in this group was written
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            for future, fn, args in commands:
+                future.set_exception(e)
+            return
+
+        for future, result, error in results:
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)